@@ -0,0 +1,167 @@
+"""FAISS index factory for the RAG vector store: exact, IVF, HNSW and quantized indexes."""
+
+import json
+import os
+from dataclasses import asdict, dataclass, replace
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf_flat", "hnsw", "ivf_pq", "ivf_sq8")
+PARAMS_FILE = "ann_params.json"
+
+# FAISS warns when k-means gets fewer than 39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Build and search parameters of a FAISS index.
+
+    `nlist`, `hnsw_m`, `ef_construction`, `pq_m` and `pq_bits` are fixed when the index is built, while
+    `nprobe` and `ef_search` trade recall for latency at query time and can be changed on a saved index.
+    HNSW indexes cannot delete vectors, so they only suit indexes that are rebuilt rather than updated.
+    """
+
+    kind: str = "flat"
+    nlist: int = 1024
+    nprobe: int = 16
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    pq_m: int = 16
+    pq_bits: int = 8
+    train_size: int = 10000
+
+    def __post_init__(self):
+        """Validate the index kind."""
+        if self.kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind {self.kind!r}, expected one of {', '.join(INDEX_KINDS)}.")
+
+    @classmethod
+    def from_env(cls) -> "IndexSpec":
+        """Build the spec from the ANN_* environment variables."""
+        defaults = cls()
+        return cls(
+            kind=os.getenv("ANN_INDEX_KIND", defaults.kind),
+            nlist=int(os.getenv("ANN_NLIST", defaults.nlist)),
+            nprobe=int(os.getenv("ANN_NPROBE", defaults.nprobe)),
+            hnsw_m=int(os.getenv("ANN_HNSW_M", defaults.hnsw_m)),
+            ef_construction=int(os.getenv("ANN_EF_CONSTRUCTION", defaults.ef_construction)),
+            ef_search=int(os.getenv("ANN_EF_SEARCH", defaults.ef_search)),
+            pq_m=int(os.getenv("ANN_PQ_M", defaults.pq_m)),
+            pq_bits=int(os.getenv("ANN_PQ_BITS", defaults.pq_bits)),
+            train_size=int(os.getenv("ANN_TRAIN_SIZE", defaults.train_size)),
+        )
+
+    @property
+    def needs_training(self) -> bool:
+        """Whether the index has to be trained before vectors are added."""
+        return self.kind.startswith("ivf")
+
+    def build_params(self) -> dict:
+        """Parameters that change the content of the index, and therefore its cache key."""
+        params = {"kind": self.kind}
+        if self.needs_training:
+            params["nlist"] = self.nlist
+        if self.kind == "hnsw":
+            params.update(hnsw_m=self.hnsw_m, ef_construction=self.ef_construction)
+        if self.kind == "ivf_pq":
+            params.update(pq_m=self.pq_m, pq_bits=self.pq_bits)
+        return params
+
+    def factory_string(self) -> str:
+        """The faiss.index_factory description of the index."""
+        return {
+            "flat": "Flat",
+            "ivf_flat": f"IVF{self.nlist},Flat",
+            "hnsw": f"HNSW{self.hnsw_m}",
+            "ivf_pq": f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_bits}",
+            "ivf_sq8": f"IVF{self.nlist},SQ8",
+        }[self.kind]
+
+    def fit(self, num_vectors: int) -> "IndexSpec":
+        """Shrink the spec so it can be trained on `num_vectors` vectors, falling back to a flat index."""
+        if not self.needs_training:
+            return self
+        nlist = min(self.nlist, num_vectors // MIN_POINTS_PER_CENTROID)
+        if nlist < 1 or (self.kind == "ivf_pq" and num_vectors < 2 ** self.pq_bits):
+            print(f"Only {num_vectors} vectors to train {self.factory_string()}, using a flat index instead.")
+            return replace(self, kind="flat")
+        return replace(self, nlist=nlist, nprobe=min(self.nprobe, nlist))
+
+    def create(self, dimension: int, training_vectors: np.ndarray = None) -> faiss.Index:
+        """Create the index, training it on the given vectors when it needs training."""
+        index = faiss.index_factory(dimension, self.factory_string())
+        if self.kind == "hnsw":
+            index.hnsw.efConstruction = self.ef_construction
+        if self.needs_training:
+            if training_vectors is None:
+                raise ValueError(f"{self.factory_string()} needs training vectors.")
+            index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+        self.tune(index)
+        return index
+
+    def tune(self, index: faiss.Index) -> None:
+        """Apply the query-time parameters to an index."""
+        if self.needs_training:
+            ivf = faiss.extract_index_ivf(index)
+            ivf.nprobe = self.nprobe
+            # The vector store labels vectors 0..n-1, so an array direct map can reconstruct them for MMR.
+            if ivf.direct_map.type != faiss.DirectMap.Array:
+                ivf.set_direct_map_type(faiss.DirectMap.Array)
+        if self.kind == "hnsw":
+            index.hnsw.efSearch = self.ef_search
+
+    def with_search_params(self, nprobe: int = None, ef_search: int = None) -> "IndexSpec":
+        """Return a copy with different query-time parameters."""
+        return replace(self, nprobe=nprobe or self.nprobe, ef_search=ef_search or self.ef_search)
+
+    def save(self, directory: str) -> None:
+        """Persist the spec next to a saved index."""
+        with open(os.path.join(directory, PARAMS_FILE), "w", encoding="utf-8") as params_file:
+            json.dump(asdict(self), params_file, sort_keys=True)
+
+    @classmethod
+    def load(cls, directory: str) -> "IndexSpec":
+        """Load the spec saved next to an index, defaulting to a flat index for indexes saved without one."""
+        path = os.path.join(directory, PARAMS_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as params_file:
+            return cls(**json.load(params_file))
+
+
+def remove_and_renumber(index: faiss.Index, labels) -> int:
+    """Remove vectors from an IVF index and renumber the remaining ones 0..n-1 in their previous order.
+
+    LangChain's FAISS store treats labels as positions and renumbers its id map after a delete, which matches
+    what `remove_ids` does to a flat index but not to an IVF index, whose labels stay as they were. The
+    inverted lists are rewritten instead, keeping the stored codes, so nothing is re-encoded or retrained.
+
+    Returns:
+        int: The number of vectors removed.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    removed = np.unique(np.asarray(list(labels), dtype=np.int64))
+    kept_total = 0
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        keep = ~np.isin(ids, removed)
+        new_ids = np.ascontiguousarray(ids[keep] - np.searchsorted(removed, ids[keep]))
+        kept_codes = np.ascontiguousarray(codes.reshape(size, invlists.code_size)[keep])
+        invlists.resize(list_no, 0)
+        if len(new_ids):
+            invlists.add_entries(list_no, len(new_ids), faiss.swig_ptr(new_ids), faiss.swig_ptr(kept_codes))
+        kept_total += len(new_ids)
+    removed_count = index.ntotal - kept_total
+    direct_map_type = ivf.direct_map.type
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    ivf.ntotal = index.ntotal = kept_total
+    ivf.set_direct_map_type(direct_map_type)
+    return removed_count
@@ -0,0 +1,327 @@
+"""ASGI service for the chatbot, on the async backend API, for serving many conversations per process.
+
+Run it with any ASGI server from this folder, e.g. `uvicorn asgi_app:app --port 8000 --workers 2`.
+
+Routes (JSON bodies with a "message" and an optional "session_id"; a new session id is returned when omitted):
+    POST /chat          answer with the plain chatbot
+    POST /chat/stream   the same answer as server-sent events
+    POST /rag           answer from the indexed documents (RAG_INDEX_PATH must be set)
+    POST /rag/stream    the same answer as server-sent events: a "sources" event, then the answer chunks
+    GET  /health        load and counters of the process
+
+Requests beyond ASGI_MAX_CONCURRENCY wait up to ASGI_QUEUE_TIMEOUT seconds for a slot and are then refused with
+503; a request running longer than ASGI_REQUEST_TIMEOUT seconds is cancelled with 504 (or an "error" event once
+a stream has started). Turns of the same session are served one at a time, so its history stays in order; a turn
+waits for the previous one of its session before taking a slot, and gets a 504 after ASGI_REQUEST_TIMEOUT.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from rag_backend import SESSION_HISTORY, ChatBotBackend, CorpusIndexer, Indexer, build_embeddings, build_retriever
+from response_cache import ResponseCache
+
+ASGI_MAX_CONCURRENCY = int(os.getenv("ASGI_MAX_CONCURRENCY", "256"))
+ASGI_QUEUE_TIMEOUT = float(os.getenv("ASGI_QUEUE_TIMEOUT", "5"))
+ASGI_REQUEST_TIMEOUT = float(os.getenv("ASGI_REQUEST_TIMEOUT", "60"))
+ASGI_MAX_BODY_BYTES = int(os.getenv("ASGI_MAX_BODY_BYTES", "65536"))
+# A PDF path or URL, or a directory or manifest of PDFs; the RAG routes are disabled when it is not set.
+RAG_INDEX_PATH = os.getenv("RAG_INDEX_PATH")
+RAG_RESPONSE_CACHE = os.getenv("RAG_RESPONSE_CACHE", "true").lower() == "true"
+
+
+class HTTPError(Exception):
+    """An error answered with its status code and message."""
+
+    def __init__(self, status: int, message: str):
+        """Initialize the error."""
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ChatService:
+    """Class to handle the ASGI application: routing, admission control, timeouts and per-session ordering.
+
+    Bedrock is called through boto3, which blocks, so LangChain runs the model calls on the event loop's
+    default executor; the service sizes that executor to the concurrency limit so every admitted request
+    has a thread, while the event loop itself only waits.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ASGI_MAX_CONCURRENCY,
+        queue_timeout: float = ASGI_QUEUE_TIMEOUT,
+        request_timeout: float = ASGI_REQUEST_TIMEOUT,
+        index_path: Optional[str] = RAG_INDEX_PATH,
+        response_cache: bool = RAG_RESPONSE_CACHE,
+    ):
+        """Initialize the service; the index is loaded at startup."""
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.index_path = index_path
+        self.use_response_cache = response_cache
+        self.retriever = None
+        self.index_version = None
+        self.response_cache = None
+        self.slots = None
+        self.started = False
+        # Created on the running loop by the first caller of ensure_started.
+        self.startup_lock = None
+        self.session_locks = weakref.WeakValueDictionary()
+        self.stats = {"in_flight": 0, "max_in_flight": 0, "served": 0, "rejected": 0, "timed_out": 0, "failed": 0}
+
+    async def startup(self) -> None:
+        """Size the executor and semaphore on the running loop and load the index, if any."""
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_concurrency + 8))
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        if self.index_path:
+            self.retriever, self.index_version = await asyncio.to_thread(self.load_index)
+            if self.use_response_cache:
+                self.response_cache = ResponseCache(embeddings=build_embeddings())
+        self.started = True
+
+    async def ensure_started(self) -> None:
+        """Run startup once: concurrent first requests wait for the one that runs it."""
+        if self.started:
+            return
+        if self.startup_lock is None:
+            self.startup_lock = asyncio.Lock()
+        async with self.startup_lock:
+            if not self.started:
+                await self.startup()
+
+    def load_index(self):
+        """Index the documents (or load the saved index) and build the retriever."""
+        if os.path.isdir(self.index_path) or self.index_path.endswith((".json", ".txt")):
+            indexer = CorpusIndexer(self.index_path)
+        else:
+            indexer = Indexer(self.index_path)
+        return build_retriever(indexer.index().vectorstore), indexer.version
+
+    def backend(self, session_id: str, use_rag: bool) -> ChatBotBackend:
+        """Build the backend of a turn; the models and chains come from the process-wide pool."""
+        if not use_rag:
+            return ChatBotBackend(session_id=session_id, session_history=SESSION_HISTORY)
+        if self.retriever is None:
+            raise HTTPError(404, "RAG is not enabled: set RAG_INDEX_PATH.")
+        return ChatBotBackend(
+            session_id=session_id,
+            session_history=SESSION_HISTORY,
+            index=self.retriever,
+            use_rag=True,
+            response_cache=self.response_cache,
+            index_version=self.index_version,
+        )
+
+    def session_lock(self, session_id: str) -> asyncio.Lock:
+        """The lock serializing the turns of a session; dropped once no turn of the session is pending."""
+        lock = self.session_locks.get(session_id)
+        if lock is None:
+            lock = self.session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def turn(self, session_id: str):
+        """Hold the turn of a session, then a concurrency slot, while a request is answered.
+
+        The session comes first, so a turn queued behind an earlier one of its session does not hold a slot
+        while it waits; it waits at most the request timeout.
+        """
+        lock = self.session_lock(session_id)
+        try:
+            await asyncio.wait_for(lock.acquire(), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise HTTPError(504, "An earlier turn of this session is still running.") from None
+        try:
+            await self.admit()
+            try:
+                yield
+            finally:
+                self.release()
+        finally:
+            lock.release()
+
+    async def admit(self) -> None:
+        """Wait for a concurrency slot, refusing the request if none frees up within the queue timeout."""
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise HTTPError(503, "The service is at capacity, retry later.") from None
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def release(self) -> None:
+        """Give the slot back."""
+        self.stats["in_flight"] -= 1
+        self.slots.release()
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        """ASGI entry point."""
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send) -> None:
+        """Run startup and shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.ensure_started()
+                except Exception as error:
+                    await send({"type": "lifespan.startup.failed", "message": str(error)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope: dict, receive, send) -> None:
+        """Route a request and turn errors into JSON responses."""
+        # Servers that skip the lifespan protocol start the service on the first requests.
+        await self.ensure_started()
+        method, path = scope["method"], scope["path"].rstrip("/")
+        try:
+            if method == "GET" and path == "/health":
+                await send_json(send, 200, {"status": "ok", "rag": self.retriever is not None, **self.stats})
+                return
+            routes = {"/chat": False, "/rag": True, "/chat/stream": False, "/rag/stream": True}
+            if path not in routes:
+                raise HTTPError(404, f"No route {path}.")
+            if method != "POST":
+                raise HTTPError(405, "Use POST.")
+            session_id, message = parse_request(await read_body(receive))
+            try:
+                backend = self.backend(session_id, routes[path])
+            except HTTPError:
+                raise
+            except Exception as error:
+                # E.g. no credentials for the model client; answer and stream report the failures of a turn.
+                self.stats["failed"] += 1
+                raise HTTPError(500, f"{type(error).__name__}: {error}") from error
+            async with self.turn(session_id):
+                if path.endswith("/stream"):
+                    await self.stream(send, backend, message, routes[path])
+                else:
+                    await self.answer(send, backend, message, routes[path])
+        except HTTPError as error:
+            await send_json(send, error.status, {"error": error.message})
+
+    async def answer(self, send, backend: ChatBotBackend, message: str, use_rag: bool) -> None:
+        """Answer a turn with one JSON response."""
+        call = backend.aget_rag_response(message) if use_rag else backend.aget_response(message)
+        try:
+            answer = await asyncio.wait_for(call, self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            await send_json(send, 504, {"error": f"No answer within {self.request_timeout} seconds."})
+            return
+        except Exception as error:
+            self.stats["failed"] += 1
+            await send_json(send, 502, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self.stats["served"] += 1
+        await send_json(send, 200, {"session_id": backend.session_id, "answer": answer})
+
+    async def stream(self, send, backend: ChatBotBackend, message: str, use_rag: bool) -> None:
+        """Answer a turn as server-sent events, cancelling it when the request timeout runs out."""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        await send_event(send, "session", {"session_id": backend.session_id})
+        chunks = backend.astream_rag_response(message) if use_rag else backend.astream_response(message)
+
+        async def relay() -> None:
+            # One task iterates the whole stream: the trace of the turn lives in its context.
+            async for kind, data in stream_events(chunks, use_rag):
+                await send_event(send, kind, data)
+
+        try:
+            await asyncio.wait_for(relay(), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            await send_event(send, "error", {"error": f"No answer within {self.request_timeout} seconds."})
+        except Exception as error:
+            self.stats["failed"] += 1
+            await send_event(send, "error", {"error": f"{type(error).__name__}: {error}"})
+        else:
+            self.stats["served"] += 1
+            await send_event(send, "done", {})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def stream_events(chunks: AsyncIterator, use_rag: bool) -> AsyncIterator[tuple]:
+    """Label the items of a backend stream as server-sent events."""
+    first = use_rag
+    try:
+        async for item in chunks:
+            if first:
+                # The RAG stream starts with the retrieved documents.
+                first = False
+                yield "sources", [
+                    {"source": document.metadata.get("source", ""), "page": document.metadata.get("page")}
+                    for document in item
+                ]
+            elif item:
+                yield "message", {"text": item}
+    finally:
+        await chunks.aclose()
+
+
+async def read_body(receive) -> bytes:
+    """Read the request body, refusing bodies over ASGI_MAX_BODY_BYTES."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > ASGI_MAX_BODY_BYTES:
+            raise HTTPError(413, f"The body exceeds {ASGI_MAX_BODY_BYTES} bytes.")
+        if not message.get("more_body", False):
+            return bytes(body)
+
+
+def parse_request(body: bytes) -> tuple:
+    """Return the session id (a new one if absent) and message of a request body."""
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "The body must be JSON.") from None
+    message = request.get("message") if isinstance(request, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, 'The body needs a non-empty "message".')
+    session_id = request.get("session_id") or str(uuid.uuid4())
+    return str(session_id), message
+
+
+async def send_json(send, status: int, payload: dict) -> None:
+    """Send a complete JSON response."""
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_event(send, event: str, data) -> None:
+    """Send one server-sent event."""
+    payload = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+    await send({"type": "http.response.body", "body": payload, "more_body": True})
+
+
+app = ChatService()
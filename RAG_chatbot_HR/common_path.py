@@ -0,0 +1,10 @@
+"""Make the repository's shared `common` package importable when the app is run from this folder."""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# In a container the package is copied next to the app instead.
+if os.path.isdir(os.path.join(REPO_ROOT, "common")) and REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
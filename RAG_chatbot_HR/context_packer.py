@@ -0,0 +1,128 @@
+"""Context assembly for the RAG prompt: over-fetch, MMR de-duplication, overlap trimming and token-budgeted packing."""
+
+import os
+from typing import Any, Callable, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import common_path  # noqa: F401
+import tracing
+from common.lazy import lazy_import
+from common.session_store import count_tokens
+
+# numpy is loaded by the first retrieval rather than at import time.
+np = lazy_import("numpy")
+
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "20"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+# Chunks overlap by CHUNK_OVERLAP characters; a little more catches splits that moved to a word boundary.
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 20
+
+
+def trim_overlap(text: str, packed: List[str]) -> str:
+    """Remove the start (end) of `text` that repeats the end (start) of an already packed chunk."""
+    for other in packed:
+        for size in range(min(MAX_OVERLAP_CHARS, len(text), len(other)), MIN_OVERLAP_CHARS - 1, -1):
+            if other.endswith(text[:size]):
+                text = text[size:]
+                break
+        for size in range(min(MAX_OVERLAP_CHARS, len(text), len(other)), MIN_OVERLAP_CHARS - 1, -1):
+            if other.startswith(text[-size:]):
+                text = text[:-size]
+                break
+    return text.strip()
+
+
+class ContextPacker(BaseRetriever):
+    """Retriever that assembles a compact, diverse context for the QA prompt from a FAISS vector store.
+
+    It fetches `fetch_k` candidates, orders them by maximal marginal relevance using the vectors already
+    stored in the index, drops near-duplicates, trims the spans shared with chunks already selected and packs
+    the chunks greedily until `max_chunks` or `token_budget` is reached. Every returned document records the
+    context's token count in its `context_tokens` metadata.
+    """
+
+    vectorstore: Any
+    fetch_k: int = CONTEXT_FETCH_K
+    max_chunks: int = CONTEXT_MAX_CHUNKS
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    lambda_mult: float = CONTEXT_MMR_LAMBDA
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD
+    token_counter: Callable[[str], int] = count_tokens
+
+    @staticmethod
+    def _normalize(vectors: "np.ndarray") -> "np.ndarray":
+        """Scale vectors to unit length."""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def candidates(self, query: str) -> Tuple["np.ndarray", List[Document], "np.ndarray"]:
+        """Fetch the candidates of a query with their stored vectors.
+
+        Returns:
+            Tuple[np.ndarray, List[Document], np.ndarray]: The unit query vector, the documents and their
+                unit vectors.
+        """
+        store = self.vectorstore
+        with tracing.span("embed_query"):
+            query_vector = np.asarray([store.embeddings.embed_query(query)], dtype=np.float32)
+        with tracing.span("vector_search", fetch_k=self.fetch_k) as search_span:
+            _, positions = store.index.search(query_vector, self.fetch_k)
+            positions = [int(position) for position in positions[0] if position >= 0]
+            documents = [store.docstore.search(store.index_to_docstore_id[position]) for position in positions]
+            search_span.set(candidates=len(documents))
+            if not documents:
+                return query_vector[0], [], np.zeros((0, query_vector.shape[1]), dtype=np.float32)
+            try:
+                vectors = np.stack([store.index.reconstruct(position) for position in positions])
+            except RuntimeError:
+                # Indexes without a direct map cannot return their vectors; the embedding cache serves them.
+                vectors = np.asarray(store.embeddings.embed_documents([doc.page_content for doc in documents]))
+        return self._normalize(query_vector[0]), documents, self._normalize(vectors.astype(np.float32))
+
+    def select(self, query_vector: "np.ndarray", vectors: "np.ndarray") -> List[int]:
+        """Order candidates by maximal marginal relevance, leaving out near-duplicates of earlier picks."""
+        relevance = vectors @ query_vector
+        selected, remaining = [], list(range(len(vectors)))
+        while remaining:
+            if selected:
+                redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.lambda_mult * relevance[remaining] - (1 - self.lambda_mult) * redundancy
+            best = int(np.argmax(scores))
+            candidate = remaining.pop(best)
+            if redundancy[best] < self.dedup_threshold:
+                selected.append(candidate)
+        return selected
+
+    def pack(self, documents: List[Document]) -> List[Document]:
+        """Trim overlaps and keep documents, in order, while they fit in the token budget."""
+        packed, texts, used = [], [], 0
+        for document in documents:
+            if len(packed) >= self.max_chunks:
+                break
+            text = trim_overlap(document.page_content, texts)
+            tokens = self.token_counter(text)
+            if not text or used + tokens > self.token_budget:
+                continue
+            texts.append(text)
+            used += tokens
+            packed.append(Document(page_content=text, metadata=dict(document.metadata)))
+        for document in packed:
+            document.metadata["context_tokens"] = used
+        return packed
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        """Retrieve and pack the context of a query."""
+        query_vector, documents, vectors = self.candidates(query)
+        with tracing.span("pack_context"):
+            return self.pack([documents[position] for position in self.select(query_vector, vectors)])
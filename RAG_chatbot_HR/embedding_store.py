@@ -0,0 +1,149 @@
+"""Chunk-level embedding cache so that only new or changed chunks are sent to Bedrock."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_CHARS = int(os.getenv("EMBEDDING_BATCH_CHARS", "32000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# SQLite refuses statements with more than 999 bound variables on older builds.
+_SQLITE_MAX_VARIABLES = 900
+
+
+class EmbeddingStore:
+    """SQLite-backed store of float32 embeddings keyed by (model_id, sha256(chunk_text))."""
+
+    def __init__(self, path: str):
+        """Open (or create) the store at the given path."""
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model_id TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model_id, text_hash))"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Hash a chunk of text."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model_id: str, text_hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Get the stored embeddings for the given hashes, skipping the ones that are missing."""
+        text_hashes = list(text_hashes)
+        found = {}
+        with self._lock:
+            for start in range(0, len(text_hashes), _SQLITE_MAX_VARIABLES):
+                chunk = text_hashes[start:start + _SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [model_id, *chunk],
+                )
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model_id: str, vectors: Dict[str, List[float]]) -> None:
+        """Store embeddings keyed by their text hash."""
+        rows = [(model_id, text_hash, array("f", vector).tobytes()) for text_hash, vector in vectors.items()]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, text_hash, vector) VALUES (?, ?, ?)", rows
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that reads through an EmbeddingStore and embeds misses in concurrent batches."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_id: str,
+        store: EmbeddingStore,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_batch_chars: int = EMBEDDING_BATCH_CHARS,
+        max_concurrency: int = EMBEDDING_CONCURRENCY,
+    ):
+        """Initialize the cached embeddings.
+
+        Args:
+            embeddings (Embeddings): The embeddings used for cache misses.
+            model_id (str): The model ID the cached vectors belong to.
+            store (EmbeddingStore): The persistent store of vectors.
+            batch_size (int): Maximum number of texts per embedding call.
+            max_batch_chars (int): Maximum number of characters per embedding call.
+            max_concurrency (int): Maximum number of embedding calls in flight.
+        """
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.store = store
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_concurrency = max_concurrency
+
+    def _batches(self, items: List[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+        """Group (hash, text) pairs into batches bounded by count and size."""
+        batch, batch_chars = [], 0
+        for item in items:
+            text_chars = len(item[1])
+            if batch and (len(batch) >= self.batch_size or batch_chars + text_chars > self.max_batch_chars):
+                yield batch
+                batch, batch_chars = [], 0
+            batch.append(item)
+            batch_chars += text_chars
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch: List[Tuple[str, str]]) -> List[List[float]]:
+        """Embed a single batch of texts."""
+        return self.embeddings.embed_documents([text for _, text in batch])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed the texts, only sending the ones missing from the store to the model."""
+        text_hashes = [self.store.text_hash(text) for text in texts]
+        vectors = self.store.get_many(self.model_id, set(text_hashes))
+
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        tracing.record_cache(True, "embedding", len(vectors))
+        tracing.record_cache(False, "embedding", len(missing))
+
+        if missing:
+            batches = list(self._batches(list(missing.items())))
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(batches)))) as pool:
+                for batch, embedded in zip(batches, pool.map(self._embed_batch, batches)):
+                    fresh = {text_hash: vector for (text_hash, _), vector in zip(batch, embedded)}
+                    self.store.put_many(self.model_id, fresh)
+                    vectors.update(fresh)
+
+        return [vectors[text_hash] for text_hash in text_hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query; queries are not cached."""
+        return self.embeddings.embed_query(text)
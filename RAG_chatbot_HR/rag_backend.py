@@ -1,51 +1,221 @@
 """Create a Retrieval Augmented Generation (RAG) chatbot using"""
 
+import asyncio
+import hashlib
+import json
+import logging
 import os
-
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Union
+
+from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableWithMessageHistory
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import BedrockEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.indexes import VectorstoreIndexCreator
-from langchain_aws import ChatBedrock
+
+import common_path  # noqa: F401
+import tracing
+from common import bedrock
+from common.session_store import SessionHistory, add_turn, count_tokens, estimate_tokens
+from context_packer import ContextPacker
+from embedding_store import CachedEmbeddings, EmbeddingStore
+from response_cache import ResponseCache
+
+# The indexing stack (FAISS, numpy, PDF loading, text splitting) and the chain building blocks are imported where
+# they are used, so the plain chat path and a warm start from a saved index do not pay for what they never touch.
+if TYPE_CHECKING:
+    from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.runnables import Runnable, RunnableConfig, RunnableWithMessageHistory
+
+    from ann_index import IndexSpec
 
 PROFILE_NAME = os.getenv("AWS_PROFILE_NAME", "default")
 EMBEDDING_MODEL_ID = os.getenv("AWS_EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v1")
 CHATBOT_MODEL_ID = os.getenv("AWS_CHATBOT_MODEL_ID", "meta.llama3-8b-instruct-v1:0")
 REGION_NAME = os.getenv("AWS_REGION_NAME", "us-west-2")
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".index_cache"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(INDEX_CACHE_DIR, "embeddings.sqlite3"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 50
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+
+logger = logging.getLogger(__name__)
+
+
+def build_embeddings() -> CachedEmbeddings:
+    """Build the Bedrock embeddings backed by the persistent chunk-level cache."""
+    from langchain_community.embeddings import BedrockEmbeddings
+
+    return CachedEmbeddings(
+        BedrockEmbeddings(
+            client=MODEL_POOL.get_bedrock_client(),
+            model_id=EMBEDDING_MODEL_ID,
+            region_name=REGION_NAME
+        ),
+        model_id=EMBEDDING_MODEL_ID,
+        store=EmbeddingStore(EMBEDDING_CACHE_PATH),
+    )
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash the bytes of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most `size` items without materializing it."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class VectorStoreBuilder:
+    """Class to handle adding embedded chunks to a FAISS store built from an IndexSpec.
+
+    Indexes that need training buffer the first `spec.train_size` vectors, train on them and then add
+    everything that follows directly.
+    """
+
+    def __init__(self, embeddings, spec: "IndexSpec", vectorstore: Optional["FAISS"] = None):
+        """Initialize the builder, optionally adding to an existing vector store."""
+        self.embeddings = embeddings
+        self.spec = spec
+        self.vectorstore = vectorstore
+        self.pending = []
+        self.pending_count = 0
+
+    def add(self, chunks: list, ids: list = None) -> None:
+        """Embed a batch of chunks and add them to the vector store."""
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+        text_embeddings = list(zip(texts, self.embeddings.embed_documents(texts)))
+        if self.vectorstore is not None:
+            self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            return
+        self.pending.append((text_embeddings, metadatas, ids))
+        self.pending_count += len(text_embeddings)
+        if not self.spec.needs_training or self.pending_count >= self.spec.train_size:
+            self.create()
+
+    def create(self) -> None:
+        """Create the vector store from the buffered batches, training the index on them if needed."""
+        import numpy as np
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        vectors = np.array(
+            [vector for text_embeddings, _, _ in self.pending for _, vector in text_embeddings], dtype=np.float32
+        )
+        self.spec = self.spec.fit(len(vectors))
+        index = self.spec.create(vectors.shape[1], training_vectors=vectors)
+        self.vectorstore = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        for text_embeddings, metadatas, ids in self.pending:
+            self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        self.pending, self.pending_count = [], 0
+
+    def finish(self) -> Optional["FAISS"]:
+        """Flush buffered batches and return the vector store, or None if nothing was added."""
+        if self.vectorstore is None and self.pending:
+            self.create()
+        return self.vectorstore
+
+
+def delete_vectors(vectorstore: "FAISS", ids: List[str]) -> None:
+    """Delete documents from a FAISS vector store, keeping its labels equal to its positions for IVF indexes."""
+    import faiss
+
+    from ann_index import remove_and_renumber
+
+    if faiss.try_extract_index_ivf(vectorstore.index) is None:
+        vectorstore.delete(ids)
+        return
+    doomed = set(ids)
+    positions = [position for position, doc_id in vectorstore.index_to_docstore_id.items() if doc_id in doomed]
+    remove_and_renumber(vectorstore.index, positions)
+    vectorstore.docstore.delete(list(doomed))
+    remaining = [doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items()) if doc_id not in doomed]
+    vectorstore.index_to_docstore_id = dict(enumerate(remaining))
+
+
+def report_progress(items: Iterable, stage: str, progress: Optional[Callable[[str, int], None]]) -> Iterator:
+    """Pass items through, calling `progress(stage, count)` after each one."""
+    if progress is None:
+        yield from items
+        return
+    for count, item in enumerate(items, start=1):
+        yield item
+        progress(stage, count)
 
 
 class Indexer:
     """Class to handle the indexing of documents."""
 
-    def __init__(self, path):
+    def __init__(self, path, cache_dir: str = INDEX_CACHE_DIR, index_spec: "IndexSpec" = None):
         """Initialize the PDF loader."""
+        from langchain_community.document_loaders import PyPDFLoader
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        from ann_index import IndexSpec
+
         self.path = path
+        self.cache_dir = cache_dir
+        self.index_spec = index_spec or IndexSpec.from_env()
+        self.built_spec = None
+        self.version = None
         self.loader = PyPDFLoader(self.path)
-        self.splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
-        self.embeddings = BedrockEmbeddings(
-            credentials_profile_name=PROFILE_NAME,
-            model_id=EMBEDDING_MODEL_ID,
-            region_name=REGION_NAME
-        )
-        self.vector_store = VectorstoreIndexCreator(
-            embedding=self.embeddings,
-            text_splitter=self.splitter,
-            vectorstore_cls=FAISS
-        )
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_overlap = CHUNK_OVERLAP
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        self.embeddings = build_embeddings()
         self.pages = None
         self.splits = None
 
+    def iter_pages(self) -> Iterator:
+        """Parse the PDF one page at a time."""
+        return self.loader.lazy_load()
+
+    def iter_chunks(self, pages: Iterable) -> Iterator:
+        """Split pages into chunks as they arrive."""
+        for page in pages:
+            yield from self.splitter.split_documents([page])
+
+    def build(self, progress: Callable[[str, int], None] = None, batch_size: int = INDEX_BATCH_SIZE) -> "FAISS":
+        """Stream the PDF through pages, chunks and embedding batches into a new vector store.
+
+        The document is parsed exactly once and at most one batch of chunks is held in memory.
+
+        Args:
+            progress (Callable[[str, int], None]): Called with ("pages" | "chunks" | "embedded", count).
+            batch_size (int): Number of chunks embedded and added to the index at a time.
+
+        Returns:
+            FAISS: The vector store.
+        """
+        pages = report_progress(self.iter_pages(), "pages", progress)
+        chunks = report_progress(self.iter_chunks(pages), "chunks", progress)
+        builder, embedded = VectorStoreBuilder(self.embeddings, self.index_spec), 0
+        for batch in batched(chunks, batch_size):
+            builder.add(batch)
+            embedded += len(batch)
+            if progress is not None:
+                progress("embedded", embedded)
+        vectorstore = builder.finish()
+        if vectorstore is None:
+            raise ValueError(f"No text could be extracted from {self.path}.")
+        self.built_spec = builder.spec
+        return vectorstore
+
     def load(self):
         """Load the PDF."""
-        self.pages = self.loader.load_and_split()
+        self.pages = list(self.iter_pages())
 
     def get_page(self, page_number: int) -> str:
         """Get a page from the PDF."""
@@ -61,72 +231,315 @@ class Indexer:
 
     def embed(self):
         """Embed the PDF."""
-        if self.pages is None:
-            self.load()
-        return self.embeddings.embed_documents(self.splits)
+        if self.splits is None:
+            self.split()
+        return self.embeddings.embed_documents([split.page_content for split in self.splits])
+
+    def fingerprint(self) -> str:
+        """Hash the PDF bytes together with the splitter and embedding settings.
+
+        Returns:
+            str: The hex digest identifying the index built from this document.
+        """
+        # PyPDFLoader has already downloaded remote documents to a local temporary file.
+        digest = hashlib.sha256(file_fingerprint(self.loader.file_path).encode("utf-8"))
+        settings = {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model_id": self.embeddings.model_id,
+            "index": self.index_spec.build_params(),
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def index(self, progress: Callable[[str, int], None] = None) -> "VectorStoreIndexWrapper":
+        """Index the PDF, reusing the on-disk FAISS index when the document and settings are unchanged.
+
+        Args:
+            progress (Callable[[str, int], None]): Progress callback used when the index has to be built.
+        """
+        from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+        from langchain_community.vectorstores import FAISS
+
+        from ann_index import IndexSpec
+
+        self.version = self.fingerprint()
+        cache_path = os.path.join(self.cache_dir, self.version)
+        if os.path.exists(os.path.join(cache_path, "index.faiss")):
+            vectorstore = FAISS.load_local(cache_path, self.embeddings, allow_dangerous_deserialization=True)
+            self.built_spec = IndexSpec.load(cache_path).with_search_params(
+                self.index_spec.nprobe, self.index_spec.ef_search
+            )
+            self.built_spec.tune(vectorstore.index)
+            return VectorStoreIndexWrapper(vectorstore=vectorstore)
+
+        vectorstore = self.build(progress)
+        # Save next to the final location and rename, so a concurrent reader never sees a partial index.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        vectorstore.save_local(tmp_path)
+        self.built_spec.save(tmp_path)
+        try:
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # Another process published the same fingerprint first; its index is equivalent.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return VectorStoreIndexWrapper(vectorstore=vectorstore)
+
+
+class CorpusIndexer:
+    """Class to handle the incremental indexing of a corpus of documents.
+
+    The corpus is either a directory that is searched recursively for PDFs, or a manifest file listing one
+    path per line (or a JSON list of paths). A manifest of per-file fingerprints and vector IDs is stored next
+    to the FAISS index, so a refresh only re-embeds added or modified files and deletes the vectors of removed
+    ones.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, source: str, index_dir: str = None, index_spec: "IndexSpec" = None):
+        """Initialize the corpus indexer.
+
+        Args:
+            source (str): A directory of PDFs or a manifest file listing them.
+            index_dir (str): Where the FAISS index and manifest are kept. Defaults to a folder in INDEX_CACHE_DIR.
+            index_spec (IndexSpec): The FAISS index to build. HNSW is not supported since it cannot delete vectors.
+        """
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        from ann_index import IndexSpec
+
+        self.index_spec = index_spec or IndexSpec.from_env()
+        if self.index_spec.kind == "hnsw":
+            raise ValueError("HNSW indexes cannot delete vectors, use a flat or IVF index for an updatable corpus.")
+        self.source = source
+        source_key = hashlib.sha256(os.path.abspath(source).encode("utf-8")).hexdigest()[:16]
+        self.index_dir = index_dir or os.path.join(INDEX_CACHE_DIR, f"corpus-{source_key}")
+        self.chunk_size = CHUNK_SIZE
+        self.chunk_overlap = CHUNK_OVERLAP
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        self.embeddings = build_embeddings()
+        self.built_spec = None
+        self.vectorstore = None
+        self.files = {}
+
+    @property
+    def settings(self) -> dict:
+        """Settings that invalidate every stored vector when they change."""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model_id": self.embeddings.model_id,
+            "index": self.index_spec.build_params(),
+        }
+
+    @property
+    def version(self) -> str:
+        """Hash of the indexed files and settings, which changes whenever the index content does."""
+        state = {"settings": self.settings, "files": {path: entry["fingerprint"] for path, entry in self.files.items()}}
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def list_files(self) -> list:
+        """List the documents of the corpus."""
+        if os.path.isdir(self.source):
+            paths = []
+            for root, _, names in os.walk(self.source):
+                paths.extend(os.path.join(root, name) for name in names if name.lower().endswith(".pdf"))
+            return sorted(os.path.abspath(path) for path in paths)
+
+        with open(self.source, encoding="utf-8") as manifest:
+            if self.source.endswith(".json"):
+                paths = json.load(manifest)
+            else:
+                paths = [line.strip() for line in manifest if line.strip() and not line.startswith("#")]
+        base_dir = os.path.dirname(os.path.abspath(self.source))
+        return sorted(os.path.abspath(os.path.join(base_dir, path)) for path in paths)
+
+    def load_state(self) -> None:
+        """Load the stored index and manifest, discarding them if they are stale or inconsistent."""
+        from langchain_community.vectorstores import FAISS
+
+        from ann_index import IndexSpec
+
+        manifest_path = os.path.join(self.index_dir, self.MANIFEST_FILE)
+        if not os.path.exists(manifest_path) or not os.path.exists(os.path.join(self.index_dir, "index.faiss")):
+            return
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get("settings") != self.settings:
+            logger.info("Corpus settings changed, rebuilding the index.")
+            return
+        vectorstore = FAISS.load_local(self.index_dir, self.embeddings, allow_dangerous_deserialization=True)
+        if vectorstore.index.ntotal != manifest.get("vector_count"):
+            logger.warning("Corpus index does not match its manifest, rebuilding the index.")
+            return
+        self.built_spec = IndexSpec.load(self.index_dir).with_search_params(self.index_spec.nprobe)
+        self.built_spec.tune(vectorstore.index)
+        self.vectorstore = vectorstore
+        self.files = manifest["files"]
+
+    def save_state(self) -> None:
+        """Persist the index, then atomically publish the manifest that describes it."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.vectorstore.save_local(self.index_dir)
+        self.built_spec.save(self.index_dir)
+        manifest = {
+            "settings": self.settings,
+            "vector_count": self.vectorstore.index.ntotal,
+            "files": self.files,
+        }
+        manifest_path = os.path.join(self.index_dir, self.MANIFEST_FILE)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def index_file(self, builder: VectorStoreBuilder, path: str, fingerprint: str) -> List[str]:
+        """Stream a single document into the vector store one page and one batch at a time.
+
+        Returns:
+            List[str]: The vector IDs of the document's chunks.
+        """
+        from langchain_community.document_loaders import PyPDFLoader
+
+        path_key = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+        chunks = (
+            chunk for page in PyPDFLoader(path).lazy_load() for chunk in self.splitter.split_documents([page])
+        )
+        ids = []
+        for batch in batched(chunks, INDEX_BATCH_SIZE):
+            batch_ids = [f"{path_key}:{fingerprint[:16]}:{len(ids) + number}" for number in range(len(batch))]
+            builder.add(batch, ids=batch_ids)
+            ids.extend(batch_ids)
+        return ids
+
+    def refresh(self) -> dict:
+        """Bring the index up to date with the corpus, touching only the files that changed.
 
-    def index(self):
-        """Index the PDF."""
-        return self.vector_store.from_loaders([self.loader])
+        Returns:
+            dict: The paths that were added, replaced and deleted, and the number left unchanged.
+        """
+        if self.vectorstore is None:
+            self.load_state()
+
+        current = {path: file_fingerprint(path) for path in self.list_files()}
+        summary = {"added": [], "replaced": [], "deleted": [], "unchanged": 0}
+
+        stale_ids = []
+        for path in list(self.files):
+            if path not in current:
+                summary["deleted"].append(path)
+                stale_ids.extend(self.files.pop(path)["ids"])
+            elif self.files[path]["fingerprint"] != current[path]:
+                stale_ids.extend(self.files[path]["ids"])
+        if stale_ids:
+            delete_vectors(self.vectorstore, stale_ids)
+
+        builder = VectorStoreBuilder(self.embeddings, self.built_spec or self.index_spec, self.vectorstore)
+        for path, fingerprint in current.items():
+            entry = self.files.get(path)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                summary["unchanged"] += 1
+                continue
+            summary["replaced" if entry is not None else "added"].append(path)
+            self.files[path] = {"fingerprint": fingerprint, "ids": self.index_file(builder, path, fingerprint)}
+        self.vectorstore = builder.finish()
+        self.built_spec = builder.spec
+
+        if self.vectorstore is None:
+            raise ValueError(f"No documents found in {self.source}.")
+        if summary["added"] or summary["replaced"] or summary["deleted"]:
+            self.save_state()
+        logger.info(
+            "Corpus refresh: %d added, %d replaced, %d deleted, %d unchanged.",
+            len(summary["added"]), len(summary["replaced"]), len(summary["deleted"]), summary["unchanged"],
+        )
+        return summary
+
+    def index(self) -> "VectorStoreIndexWrapper":
+        """Refresh and return the corpus index."""
+        from langchain.indexes.vectorstore import VectorStoreIndexWrapper
 
+        self.refresh()
+        return VectorStoreIndexWrapper(vectorstore=self.vectorstore)
 
-class SessionHistory:
-    """Class to handle the session history."""
 
-    def __init__(self):
-        self.messages = []
-        self.store = {}
+MODEL_POOL = bedrock.ModelPool(PROFILE_NAME, REGION_NAME, CHATBOT_MODEL_ID)
+SESSION_HISTORY = SessionHistory()
 
-    def add_message(self, message):
-        """Add a message to the history."""
-        self.messages.append(message)
+QA_SYSTEM_PROMPT = (
+    "You are an assistant for question-answering tasks. "
+    "Use the following pieces of retrieved context to answer "
+    "the question. If you don't know the answer, say that you "
+    "don't know. Use three sentences maximum and keep the "
+    "answer concise."
+    "\n\n"
+    "{context}"
+)
 
-    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        """Get the session history."""
-        if session_id not in self.store:
-            self.store[session_id] = InMemoryChatMessageHistory()
-        return self.store[session_id]
+
+def build_retriever(vectorstore) -> ContextPacker:
+    """Build the retriever of the QA chain: MMR-deduplicated chunks packed into the context token budget."""
+    return ContextPacker(vectorstore=vectorstore)
 
 
 class ChatBotBackend:
     """Class to handle the backend of the chatbot."""
 
-    def __init__(self, session_id, session_history=None, context=None, index=None, use_rag: bool = False):
-        """Initialize the chatbot backend."""
+    def __init__(
+        self,
+        session_id,
+        session_history=None,
+        context=None,
+        index=None,
+        use_rag: bool = False,
+        response_cache: ResponseCache = None,
+        index_version: str = None,
+    ):
+        """Initialize the chatbot backend.
+
+        Args:
+            response_cache (ResponseCache): Optional cache of answers to standalone questions.
+            index_version (str): Version of the index behind `index`; cached answers are dropped when it changes.
+        """
         self.session_id = session_id
-        self.chat_bedrock = ChatBedrock(
-            credentials_profile_name=PROFILE_NAME,
-            model_id=CHATBOT_MODEL_ID,
-            region_name=REGION_NAME,
-            model_kwargs=dict(temperature=0.5, top_p=0.9),
-        )
-        self.session_history = session_history or SessionHistory()
+        self.response_cache = response_cache
+        self.index_version = index_version
+        self.rewrite_metrics = None
+        self.prompt_tokens = None
+        self.trace_summary = None
+        self.config = {"configurable": {"session_id": session_id}}
+        self.chat_bedrock = MODEL_POOL.get_chat_model()
+        self.session_history = session_history if session_history is not None else SESSION_HISTORY
         self.retriever = index or None
-        self.contextualizer = context or self.init_contextualizer("f")
-        self.with_message_history = self.init_runnable(use_rag)
+        self.contextualizer = None
+        if use_rag:
+            self.contextualizer = context or self.init_contextualizer("f")
+        # Streams run the bare chain and save their turn themselves (see common.session_store.add_turn).
+        self.chain = MODEL_POOL.get_runnable(
+            ("chain", use_rag, self.retriever, self.contextualizer), lambda: self.init_chain(use_rag)
+        )
+        self.with_message_history = MODEL_POOL.get_runnable(
+            ("runnable", use_rag, self.session_history, self.retriever, self.contextualizer),
+            lambda: self.init_runnable(use_rag),
+        )
 
-    def init_runnable(self, use_rag: bool) -> RunnableWithMessageHistory:
-        """Initialize the runnable.
+    def init_chain(self, use_rag: bool) -> "Runnable":
+        """Initialize the chain answering a turn, given its history.
 
         Args:
             use_rag (bool): Whether to use RAG or not.
 
         Returns:
-            RunnableWithMessageHistory: The runnable with message history.
+            Runnable: The RAG chain, taking "input" and "chat_history", or the chat model, taking messages.
         """
         if use_rag:
-            system_prompt = (
-                "You are an assistant for question-answering tasks. "
-                "Use the following pieces of retrieved context to answer "
-                "the question. If you don't know the answer, say that you "
-                "don't know. Use three sentences maximum and keep the "
-                "answer concise."
-                "\n\n"
-                "{context}"
-            )
+            from langchain.chains.combine_documents import create_stuff_documents_chain
+            from langchain.chains.retrieval import create_retrieval_chain
+            from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
             qa_prompt = ChatPromptTemplate.from_messages(
                 [
-                    ("system", system_prompt),
+                    ("system", QA_SYSTEM_PROMPT),
                     MessagesPlaceholder("chat_history"),
                     ("human", "{input}"),
                 ]
@@ -145,30 +558,97 @@ class ChatBotBackend:
 
             print(f"Contextualizer: {self.contextualizer}")
 
-            rag_chain = create_retrieval_chain(self.contextualizer, question_answer_chain)
+            return create_retrieval_chain(self.contextualizer, question_answer_chain)
+        return self.chat_bedrock
+
+    def init_runnable(self, use_rag: bool) -> "RunnableWithMessageHistory":
+        """Initialize the runnable.
+
+        Args:
+            use_rag (bool): Whether to use RAG or not.
+
+        Returns:
+            RunnableWithMessageHistory: The chain with message history.
+        """
+        from langchain_core.runnables import RunnableWithMessageHistory
+
+        if use_rag:
             return RunnableWithMessageHistory(
-                rag_chain,
-                lambda: self.session_history.get_session_history(self.session_id),
+                self.chain,
+                self.session_history.get_session_history,
                 input_messages_key="input",
                 history_messages_key="chat_history",
                 output_messages_key="answer",
             )
         return RunnableWithMessageHistory(
-            self.chat_bedrock,
-            lambda: self.session_history.get_session_history(self.session_id),
+            self.chain,
+            self.session_history.get_session_history,
         )
 
+    def save_turn(self, history, question: str, answer: str) -> None:
+        """Save a streamed turn to the session history."""
+        with tracing.span("insert_history"):
+            add_turn(history, question, answer)
+
     def get_response(self, user_input: str) -> str:
         """Get the response from the chatbot."""
         message = [HumanMessage(content=user_input)]
 
-        response = self.with_message_history.invoke(message)
+        with tracing.trace("chat_response", session_id=self.session_id) as request_trace:
+            response = self.with_message_history.invoke(message, config=request_trace.with_callbacks(self.config))
+        self.trace_summary = request_trace.summary()
         return response.content
 
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """Stream the response from the chatbot token by token."""
+        with tracing.trace("chat_response", session_id=self.session_id, stream=True) as request_trace:
+            with tracing.span("load_history"):
+                history = self.session_history.get_session_history(self.session_id)
+                messages = history.messages + [HumanMessage(content=user_input)]
+            answer = []
+            for chunk in self.chain.stream(messages, config=request_trace.with_callbacks(self.config)):
+                answer.append(chunk.content)
+                yield chunk.content
+            self.save_turn(history, user_input, "".join(answer))
+        self.trace_summary = request_trace.summary()
+
+    async def aget_response(self, user_input: str) -> str:
+        """Get the response from the chatbot without blocking the event loop."""
+        message = [HumanMessage(content=user_input)]
+
+        with tracing.trace("chat_response", session_id=self.session_id) as request_trace:
+            response = await self.with_message_history.ainvoke(
+                message, config=request_trace.with_callbacks(self.config)
+            )
+        self.trace_summary = request_trace.summary()
+        return response.content
+
+    async def astream_response(self, user_input: str) -> AsyncIterator[str]:
+        """Stream the response from the chatbot token by token without blocking the event loop."""
+        with tracing.trace("chat_response", session_id=self.session_id, stream=True) as request_trace:
+            with tracing.span("load_history"):
+                history = self.session_history.get_session_history(self.session_id)
+                messages = history.messages + [HumanMessage(content=user_input)]
+            answer = []
+            async for chunk in self.chain.astream(messages, config=request_trace.with_callbacks(self.config)):
+                answer.append(chunk.content)
+                yield chunk.content
+            self.save_turn(history, user_input, "".join(answer))
+        self.trace_summary = request_trace.summary()
+
     def init_retriever(self, path: str) -> None:
-        """Initialize the retriever."""
-        retriever = Indexer(path).index()
-        self.retriever = retriever.vectorstore.as_retriever()
+        """Initialize the retriever.
+
+        Args:
+            path (str): A PDF path or URL, or a directory or manifest of PDFs to index as a corpus.
+        """
+        if os.path.isdir(path) or path.endswith((".json", ".txt")):
+            indexer = CorpusIndexer(path)
+        else:
+            indexer = Indexer(path)
+        retriever = indexer.index()
+        self.index_version = indexer.version
+        self.retriever = build_retriever(retriever.vectorstore)
 
     def init_contextualizer(self, path: str) -> None:
         """Initialize the contextualizer.
@@ -179,27 +659,296 @@ class ChatBotBackend:
         if self.retriever is None:
             print("Retriever not initialized.")
             self.init_retriever(path)
-        return Contextualizer(self.chat_bedrock, self.retriever).contextualize()
+        contextualizer = MODEL_POOL.get_runnable(
+            ("contextualizer", self.chat_bedrock, self.retriever),
+            lambda: Contextualizer(self.chat_bedrock, self.retriever),
+        )
+        self.rewrite_metrics = contextualizer.metrics
+        return contextualizer.contextualize()
 
     def get_rag_response(self, question: str):
-        """Get a response using the RAG chatbot."""
-        response = self.with_message_history.invoke({"input": question})
+        """Get a response using the RAG chatbot.
+
+        Standalone questions (the first turn of a conversation) are answered from the response cache when
+        possible; a cache hit is still recorded in the session history so follow-ups keep their context.
+        """
+        with tracing.trace("rag_response", session_id=self.session_id) as request_trace:
+            answer = self.answer(question, request_trace.with_callbacks(self.config))
+        self.trace_summary = request_trace.summary()
+        return answer
+
+    def lookup_cache(self, question: str):
+        """Look a standalone question up in the response cache."""
+        with tracing.span("response_cache"):
+            cached = self.response_cache.lookup(question, self.index_version)
+            tracing.record_cache(cached.answer is not None, "response", tier=cached.tier)
+        return cached
+
+    def answer(self, question: str, config: dict) -> str:
+        """Answer a question from the response cache or the RAG chain, run with `config`."""
+        self.prompt_tokens = None
+        with tracing.span("session_lookup"):
+            history = self.session_history.get_session_history(self.session_id)
+        if self.response_cache is None or history.messages:
+            response = self.with_message_history.invoke({"input": question}, config=config)
+            self.record_prompt_tokens(question, response.get("chat_history", []), response.get("context", []))
+            return response["answer"]
+
+        cached = self.lookup_cache(question)
+        if cached.answer is not None:
+            history.add_user_message(question)
+            history.add_ai_message(cached.answer)
+            return cached.answer
+        response = self.with_message_history.invoke({"input": question}, config=config)
+        self.record_prompt_tokens(question, response.get("chat_history", []), response.get("context", []))
+        self.response_cache.put(question, response["answer"], self.index_version, vector=cached.vector)
+        return response["answer"]
+
+    def record_prompt_tokens(self, question: str, chat_history: list, context: List[Document]) -> dict:
+        """Estimate the token count of the QA prompt of a turn, by part, and record it on the current span.
+
+        Returns:
+            dict: Tokens of the system prompt, replayed history, packed context and question, and their total.
+        """
+        usage = {
+            "system": count_tokens(QA_SYSTEM_PROMPT.replace("{context}", "")),
+            "history": sum(estimate_tokens(message) for message in chat_history),
+            "context": context[0].metadata.get("context_tokens", 0) if context else 0,
+            "question": count_tokens(question),
+        }
+        usage["total"] = sum(usage.values())
+        self.prompt_tokens = usage
+        tracing.set_attributes(**{f"prompt_tokens_{part}": tokens for part, tokens in usage.items()})
+        return usage
+
+    def stream_rag_response(self, question: str) -> Iterator[Union[List[Document], str]]:
+        """Stream a response using the RAG chatbot.
+
+        The first item is the list of retrieved source documents (empty for a cached answer), and every
+        following item is a chunk of the answer.
+        """
+        with tracing.trace("rag_response", session_id=self.session_id, stream=True) as request_trace:
+            yield from self.stream_answer(question, request_trace.with_callbacks(self.config))
+        self.trace_summary = request_trace.summary()
+
+    def stream_answer(self, question: str, config: dict) -> Iterator[Union[List[Document], str]]:
+        """Stream the sources and answer of a question from the response cache or the RAG chain."""
+        self.prompt_tokens = None
+        with tracing.span("session_lookup"):
+            history = self.session_history.get_session_history(self.session_id)
+        cacheable = self.response_cache is not None and not history.messages
+        cached = self.lookup_cache(question) if cacheable else None
+        if cached is not None and cached.answer is not None:
+            history.add_user_message(question)
+            history.add_ai_message(cached.answer)
+            yield []
+            yield cached.answer
+            return
+
+        with tracing.span("load_history"):
+            chat_history = history.messages
+        answer = []
+        for chunk in self.chain.stream({"input": question, "chat_history": chat_history}, config=config):
+            if "context" in chunk:
+                self.record_prompt_tokens(question, chat_history, chunk["context"])
+                yield chunk["context"]
+            if "answer" in chunk:
+                answer.append(chunk["answer"])
+                yield chunk["answer"]
+        self.save_turn(history, question, "".join(answer))
+        if cacheable:
+            self.response_cache.put(question, "".join(answer), self.index_version, vector=cached.vector)
+
+    async def aget_rag_response(self, question: str) -> str:
+        """Get a response using the RAG chatbot without blocking the event loop (see `get_rag_response`)."""
+        with tracing.trace("rag_response", session_id=self.session_id) as request_trace:
+            answer = await self.aanswer(question, request_trace.with_callbacks(self.config))
+        self.trace_summary = request_trace.summary()
+        return answer
+
+    async def aanswer(self, question: str, config: dict) -> str:
+        """Async `answer`: the chain runs with `ainvoke` and the cache lookup, which may embed, in a thread."""
+        self.prompt_tokens = None
+        with tracing.span("session_lookup"):
+            history = self.session_history.get_session_history(self.session_id)
+        if self.response_cache is None or history.messages:
+            response = await self.with_message_history.ainvoke({"input": question}, config=config)
+            self.record_prompt_tokens(question, response.get("chat_history", []), response.get("context", []))
+            return response["answer"]
+
+        cached = await asyncio.to_thread(self.lookup_cache, question)
+        if cached.answer is not None:
+            history.add_user_message(question)
+            history.add_ai_message(cached.answer)
+            return cached.answer
+        response = await self.with_message_history.ainvoke({"input": question}, config=config)
+        self.record_prompt_tokens(question, response.get("chat_history", []), response.get("context", []))
+        self.response_cache.put(question, response["answer"], self.index_version, vector=cached.vector)
         return response["answer"]
 
+    async def astream_rag_response(self, question: str) -> AsyncIterator[Union[List[Document], str]]:
+        """Stream a response using the RAG chatbot without blocking the event loop (see `stream_rag_response`)."""
+        with tracing.trace("rag_response", session_id=self.session_id, stream=True) as request_trace:
+            async for item in self.astream_answer(question, request_trace.with_callbacks(self.config)):
+                yield item
+        self.trace_summary = request_trace.summary()
+
+    async def astream_answer(self, question: str, config: dict) -> AsyncIterator[Union[List[Document], str]]:
+        """Async `stream_answer`, streaming the chain with `astream`."""
+        self.prompt_tokens = None
+        with tracing.span("session_lookup"):
+            history = self.session_history.get_session_history(self.session_id)
+        cacheable = self.response_cache is not None and not history.messages
+        cached = await asyncio.to_thread(self.lookup_cache, question) if cacheable else None
+        if cached is not None and cached.answer is not None:
+            history.add_user_message(question)
+            history.add_ai_message(cached.answer)
+            yield []
+            yield cached.answer
+            return
+
+        with tracing.span("load_history"):
+            chat_history = history.messages
+        answer = []
+        async for chunk in self.chain.astream({"input": question, "chat_history": chat_history}, config=config):
+            if "context" in chunk:
+                self.record_prompt_tokens(question, chat_history, chunk["context"])
+                yield chunk["context"]
+            if "answer" in chunk:
+                answer.append(chunk["answer"])
+                yield chunk["answer"]
+        self.save_turn(history, question, "".join(answer))
+        if cacheable:
+            self.response_cache.put(question, "".join(answer), self.index_version, vector=cached.vector)
+
+
+# Words that usually point back at earlier turns ("what about its deadline?", "and for managers?").
+ANAPHORA_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|him|his|she|her|there|then|same|above|"
+    r"previous|former|latter|else|also|too|again)\b|^\s*(and|but|or|so|what about|how about)\b",
+    re.IGNORECASE,
+)
+CONTEXTUALIZER_SKIP_STANDALONE = os.getenv("CONTEXTUALIZER_SKIP_STANDALONE", "false").lower() == "true"
+
+
+def needs_rewrite(question: str) -> bool:
+    """Cheap heuristic: whether a question may depend on the chat history to be understood."""
+    return len(question.split()) <= 3 or ANAPHORA_PATTERN.search(question) is not None
+
+
+def llm_rewrite_classifier(llm) -> Callable[[str], bool]:
+    """Build a classifier that asks a (small, fast) model whether a question needs the chat history."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "Answer only 'yes' or 'no'. Does the following question refer to earlier messages of a "
+                "conversation, so that it cannot be understood on its own?",
+            ),
+            ("human", "{input}"),
+        ]
+    )
+    chain = prompt | llm | StrOutputParser()
+    return lambda question: chain.invoke({"input": question}).strip().lower().startswith("yes")
+
+
+class RewriteMetrics:
+    """Class to handle the metrics of the contextualizer's rewrite decisions."""
+
+    def __init__(self, max_turns: int = 1000):
+        """Initialize the metrics."""
+        self.turns = deque(maxlen=max_turns)
+        self.counts = {"no_history": 0, "standalone": 0, "rewritten": 0}
+        self.rewrite_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, decision: str, seconds: float = 0.0) -> None:
+        """Record the decision of a turn and, for rewritten turns, how long the rewrite took."""
+        with self._lock:
+            self.counts[decision] += 1
+            if decision == "rewritten":
+                self.rewrite_seconds += seconds
+            self.turns.append({"decision": decision, "rewrite_seconds": seconds})
+
+    def summary(self) -> dict:
+        """Summarize how often the rewrite was skipped and an estimate of the time saved."""
+        with self._lock:
+            skipped = self.counts["no_history"] + self.counts["standalone"]
+            total = skipped + self.counts["rewritten"]
+            average = self.rewrite_seconds / self.counts["rewritten"] if self.counts["rewritten"] else 0.0
+            return {
+                **self.counts,
+                "skip_rate": skipped / total if total else 0.0,
+                "average_rewrite_seconds": average,
+                "estimated_seconds_saved": skipped * average,
+            }
+
 
 class Contextualizer:
-    """Class to handle the contextualization of the chatbot."""
+    """Class to handle the contextualization of the chatbot.
+
+    The question is only rewritten into a standalone one by the LLM when there is chat history and, if
+    `skip_standalone` is enabled, when the classifier says the question depends on that history.
+    """
+
+    def __init__(self, llm, retriever, skip_standalone: bool = CONTEXTUALIZER_SKIP_STANDALONE, classifier=None):
+        """Initialize the chatbot backend.
 
-    def __init__(self, llm, retriever):
-        """Initialize the chatbot backend."""
+        Args:
+            skip_standalone (bool): Skip the rewrite for questions the classifier considers standalone.
+            classifier (Callable[[str], bool]): Returns whether a question needs rewriting. Defaults to
+                `needs_rewrite`; `llm_rewrite_classifier` builds one backed by a small model.
+        """
         self.llm = llm
         self.retriever = retriever
+        self.skip_standalone = skip_standalone
+        self.classifier = classifier or needs_rewrite
+        self.metrics = RewriteMetrics()
         self.history_aware_retriever = None
 
+    def route(self, inputs: dict, rewrite_chain, config: "RunnableConfig") -> str:
+        """Return the question to retrieve with, only calling the rewrite chain when it is needed."""
+        if not inputs.get("chat_history"):
+            self.metrics.record("no_history")
+            tracing.set_run_attributes(config, rewrite="no_history")
+            return inputs["input"]
+        if self.skip_standalone and not self.classifier(inputs["input"]):
+            self.metrics.record("standalone")
+            tracing.set_run_attributes(config, rewrite="standalone")
+            return inputs["input"]
+        start = time.perf_counter()
+        question = rewrite_chain.invoke(inputs, config)
+        self.metrics.record("rewritten", time.perf_counter() - start)
+        tracing.set_run_attributes(config, rewrite="rewritten")
+        return question
+
+    async def aroute(self, inputs: dict, rewrite_chain, config: "RunnableConfig") -> str:
+        """Async `route`: the rewrite runs with `ainvoke` and a model-backed classifier in a thread."""
+        if not inputs.get("chat_history"):
+            self.metrics.record("no_history")
+            tracing.set_run_attributes(config, rewrite="no_history")
+            return inputs["input"]
+        if self.skip_standalone and not await asyncio.to_thread(self.classifier, inputs["input"]):
+            self.metrics.record("standalone")
+            tracing.set_run_attributes(config, rewrite="standalone")
+            return inputs["input"]
+        start = time.perf_counter()
+        question = await rewrite_chain.ainvoke(inputs, config)
+        self.metrics.record("rewritten", time.perf_counter() - start)
+        tracing.set_run_attributes(config, rewrite="rewritten")
+        return question
+
     def contextualize(self):
         """Contextualize the chatbot."""
         if self.history_aware_retriever is not None:
             return self.history_aware_retriever
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_core.runnables import RunnableLambda
+
         contextualize_q_system_prompt = (
             "Given a chat history and the latest user question "
             "which might reference context in the chat history, "
@@ -214,9 +963,16 @@ class Contextualizer:
                 ("human", "{input}"),
             ]
         )
-        self.history_aware_retriever = create_history_aware_retriever(
-            self.llm, self.retriever, contextualize_q_prompt
+        rewrite_chain = contextualize_q_prompt | self.llm | StrOutputParser()
+
+        async def aroute(inputs: dict, config: "RunnableConfig") -> str:
+            return await self.aroute(inputs, rewrite_chain, config)
+
+        # Its run is the "contextualize" span, which carries the rewrite decision.
+        route = RunnableLambda(
+            lambda inputs, config: self.route(inputs, rewrite_chain, config), afunc=aroute, name="contextualize"
         )
+        self.history_aware_retriever = route | self.retriever
         return self.history_aware_retriever
 
 
@@ -0,0 +1,149 @@
+"""Cache of RAG answers for repeated questions, with an exact tier and an embedding-similarity tier."""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import common_path  # noqa: F401
+from common.lazy import lazy_import
+
+# numpy is loaded by the first semantic lookup rather than at import time.
+np = lazy_import("numpy")
+
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+class CacheEntry(NamedTuple):
+    """A cached answer."""
+
+    answer: str
+    vector: Optional["np.ndarray"]
+    created_at: float
+
+
+class CacheLookup(NamedTuple):
+    """Result of a cache lookup; `vector` is the question embedding, reusable when storing a miss."""
+
+    answer: Optional[str]
+    tier: Optional[str]
+    vector: Optional["np.ndarray"]
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of answers keyed by normalized question, with TTL and index-version invalidation.
+
+    The exact tier matches questions that are equal after normalization. When embeddings are given, the
+    semantic tier returns the answer of the most similar cached question if its cosine similarity reaches
+    the threshold. Every entry is dropped when the index version changes, since the answers were grounded
+    on the old documents.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        similarity_threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        """Initialize the cache.
+
+        Args:
+            embeddings (Embeddings): Used to embed questions for the semantic tier; None disables it.
+            similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+            ttl_seconds (float): How long an answer stays valid.
+            max_entries (int): Maximum number of answers kept, evicting the least recently used.
+        """
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = None
+        self.stats = {"exact": 0, "semantic": 0, "miss": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normalize a question for exact matching."""
+        question = re.sub(r"\s+", " ", question.lower()).strip()
+        return question.strip(" ?!.,;:")
+
+    def _embed(self, question: str) -> Optional["np.ndarray"]:
+        """Embed a question as a unit vector."""
+        if self.embeddings is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_version(self, version: Optional[str]) -> None:
+        """Drop every entry if the index version changed. Must be called with the lock held."""
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        """Whether an entry outlived the TTL."""
+        return now - entry.created_at > self.ttl_seconds
+
+    def lookup(self, question: str, version: Optional[str] = None) -> CacheLookup:
+        """Look up an answer, first by normalized text and then by embedding similarity."""
+        key = self.normalize(question)
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, time.monotonic()):
+                self._entries.move_to_end(key)
+                self.stats["exact"] += 1
+                return CacheLookup(entry.answer, "exact", entry.vector)
+
+        vector = self._embed(question)
+        if vector is not None:
+            with self._lock:
+                self._sync_version(version)
+                now = time.monotonic()
+                best_key, best_score = None, self.similarity_threshold
+                for cached_key, cached in self._entries.items():
+                    if cached.vector is None or self._expired(cached, now):
+                        continue
+                    score = float(np.dot(vector, cached.vector))
+                    if score >= best_score:
+                        best_key, best_score = cached_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.stats["semantic"] += 1
+                    return CacheLookup(self._entries[best_key].answer, "semantic", vector)
+
+        with self._lock:
+            self.stats["miss"] += 1
+        return CacheLookup(None, None, vector)
+
+    def put(self, question: str, answer: str, version: Optional[str] = None, vector: "np.ndarray" = None) -> None:
+        """Store an answer, evicting expired entries and then the least recently used ones."""
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            self._sync_version(version)
+            now = time.monotonic()
+            key = self.normalize(question)
+            self._entries[key] = CacheEntry(answer, vector, now)
+            self._entries.move_to_end(key)
+            expired = [cached_key for cached_key, cached in self._entries.items() if self._expired(cached, now)]
+            for expired_key in expired:
+                del self._entries[expired_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """Number of cached answers."""
+        return len(self._entries)
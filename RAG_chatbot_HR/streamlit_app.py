@@ -4,20 +4,36 @@ import uuid
 import streamlit as st
 from rag_backend import ChatBotBackend
 from rag_backend import Indexer
-from rag_backend import SessionHistory
+from rag_backend import SESSION_HISTORY
+from rag_backend import build_embeddings
+from rag_backend import build_retriever
+from response_cache import ResponseCache
+
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """Share one answer cache across every session of the app."""
+    return ResponseCache(embeddings=build_embeddings())
+
+
+@st.cache_resource(show_spinner=False)
+def get_index():
+    """Share one retriever, and so one compiled RAG chain, across every session of the app."""
+    indexer = Indexer(path="https://repository.javeriana.edu.co/static/doc/directrices.pdf")
+    index = indexer.index()
+    return build_retriever(index.vectorstore), indexer.version
 
-index = Indexer(path="https://repository.javeriana.edu.co/static/doc/directrices.pdf").index()
 
 # Initialize vector index
 if 'vector_index' not in st.session_state:
     with st.spinner("📀 Wait for magic...All beautiful things in life take time :-)"):
-        st.session_state.vector_index = index.vectorstore.as_retriever()
+        st.session_state.vector_index, st.session_state.index_version = get_index()
 # Initialize or retrieve a session_id
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
-# Initialize session state to store chat messages if not already present
+# Every session keeps its history in the process-wide store, keyed by session_id
 if 'memory' not in st.session_state:
-    st.session_state.memory = SessionHistory()
+    st.session_state.memory = SESSION_HISTORY
 # Initialize session state to store chat messages if not already present
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -26,16 +42,28 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
-chatbot_backend = ChatBotBackend(session_id=st.session_state.session_id, session_history=st.session_state.memory, index=st.session_state.vector_index, use_rag=True)
+chatbot_backend = ChatBotBackend(session_id=st.session_state.session_id, session_history=st.session_state.memory, index=st.session_state.vector_index, use_rag=True, response_cache=get_response_cache(), index_version=st.session_state.index_version)
 
 input_text = st.text_area("Input your question here", "What is the company's policy on remote work?")
 go_button = st.button("Get Answer", type="primary")
 
 if go_button: 
     
+    response_stream = chatbot_backend.stream_rag_response(question=input_text)
     with st.spinner("📢Anytime someone tells me that I can't do something, I want to do it more - Taylor Swift"): ### Spinner message
-        response_content = chatbot_backend.get_rag_response(question=input_text) ### replace with RAG Function from backend file
-        st.write(response_content)
+        sources = next(response_stream)  # retrieval finishes before the first answer token
+    response_content = st.write_stream(response_stream)
+    if chatbot_backend.prompt_tokens:
+        st.caption(f"Prompt: ~{chatbot_backend.prompt_tokens['total']} tokens "
+                   f"({chatbot_backend.prompt_tokens['context']} of retrieved context)")
+    if chatbot_backend.trace_summary:
+        stages = chatbot_backend.trace_summary["stages"]
+        st.caption("Trace: " + ", ".join(f"{name} {stage['total_ms']:.0f} ms" for name, stage in stages.items()))
+    if sources:
+        with st.expander("Sources"):
+            for document in sources:
+                st.caption(f"{document.metadata.get('source', '')} (page {document.metadata.get('page', '?')})")
+                st.markdown(document.page_content)
 
 # # Accept user input in the chat interface
 # if prompt := st.chat_input("What is your question?"):
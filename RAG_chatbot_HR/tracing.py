@@ -0,0 +1,195 @@
+"""Per-request tracing of the chatbot: stage spans, token counts and cache hits, exported as JSON log lines.
+
+A trace is opened around each backend call with `trace()`. The LangChain runs of the chain (history lookup,
+contextualizer rewrite, retrieval, QA generation) become spans through TracingCallbackHandler, and code outside
+the chain adds its own with `span()`. When TRACING is off, `trace()` returns a shared no-op and nothing is
+recorded. Spans, their export (TRACE_EXPORT) and the instrumentation calls are those of common.tracing, which
+the Lambdas use as well; this module adds what is specific to the chains.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import common_path  # noqa: F401
+from common import tracing as common_tracing
+from common.tracing import TRACING, Span, TraceContext, record_cache, set_attributes, span  # noqa: F401
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "rag-chatbot-hr")
+
+# LangChain run names of the chain's stages, and the span names they are reported under. Other runs (prompt
+# templates, parsers, lambdas) are not traced; their children attach to the closest traced run.
+STAGES = {
+    "load_history": "load_history",
+    "insert_history": "insert_history",
+    "contextualize": "contextualize",
+    "retrieve_documents": "retrieval",
+    "stuff_documents_chain": "generation",
+}
+
+
+class Trace(common_tracing.Trace):
+    """Class to handle the spans and counters of one request, started with its root span."""
+
+    service_name = SERVICE_NAME
+
+    def __init__(self, name: str, **attributes):
+        """Start the trace and its root span."""
+        super().__init__(name)
+        self.start_span(name, None, attributes)
+
+    def with_callbacks(self, config: dict) -> dict:
+        """Return a copy of a runnable config that reports the chain's runs to this trace."""
+        return {**config, "callbacks": [TracingCallbackHandler(self)]}
+
+    def summary(self) -> dict:
+        """Summarize the request: its duration and status, the time spent in each stage and the counters."""
+        summary = super().summary()
+        # A request has no Lambda request id or cold start; it has the attributes of its root span instead.
+        del summary["request_id"], summary["cold_start"]
+        summary["attributes"] = self.root.attributes
+        return summary
+
+
+class _NoopTrace(common_tracing._NoopSpan):
+    """Stands in for a trace and its context manager when tracing is off."""
+
+    def with_callbacks(self, config: dict) -> dict:
+        return config
+
+    def summary(self) -> Optional[dict]:
+        return None
+
+
+_NOOP = _NoopTrace()
+
+
+def trace(name: str, **attributes):
+    """Trace a request: `with trace("rag_response", session_id=...) as request_trace: ...`.
+
+    Returns:
+        A context manager yielding the Trace, or a no-op one when TRACING is off.
+    """
+    if not TRACING:
+        return _NOOP
+    return TraceContext(Trace(name, **attributes))
+
+
+def token_usage(response) -> Dict[str, int]:
+    """Read the token counts of an LLM run, from the message usage metadata or the provider's llm_output."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+    usage = (response.llm_output or {}).get("usage") or {}
+    return {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """LangChain callback handler that reports the runs of a chain as spans of a Trace.
+
+    Chain runs named in STAGES, retriever runs and model runs become spans; a model span is named after the
+    stage it runs in (e.g. "contextualize.llm"), and records its token counts and time to first token.
+    """
+
+    def __init__(self, trace: Trace):
+        """Initialize the handler."""
+        self.trace = trace
+        self.spans: Dict[UUID, Span] = {}
+        # Run -> the span its child runs attach to (its own, or its closest traced ancestor's).
+        self.parents: Dict[UUID, Span] = {}
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Span:
+        """The span a run started under `parent_run_id` attaches to."""
+        return self.parents.get(parent_run_id, self.trace.root) if parent_run_id else self.trace.root
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: Optional[str], **attributes) -> None:
+        """Open the span of a run, or link the run to its parent's span when it is not traced."""
+        with self._lock:
+            parent = self._parent(parent_run_id)
+            if name is None:
+                self.parents[run_id] = parent
+                return
+            span = self.trace.start_span(name, parent, attributes)
+            self.spans[run_id] = self.parents[run_id] = span
+
+    def _end(self, run_id: UUID, error: BaseException = None, **attributes) -> None:
+        """Close the span of a run, if it has one."""
+        with self._lock:
+            self.parents.pop(run_id, None)
+            span = self.spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            span.end(error)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, STAGES.get(name))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID,
+                           parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, "retrieve", query_chars=len(query))
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs: Any) -> None:
+        context_tokens = documents[0].metadata.get("context_tokens", 0) if documents else 0
+        self._end(run_id, documents=len(documents), context_tokens=context_tokens)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def _start_model(self, run_id: UUID, parent_run_id: Optional[UUID], kwargs: dict) -> None:
+        """Open the span of a model run, named after the stage it runs in."""
+        parent = self._parent(parent_run_id)
+        name = "llm" if parent is self.trace.root else f"{parent.name}.llm"
+        model = (kwargs.get("metadata") or {}).get("ls_model_name")
+        self._start(run_id, parent_run_id, name, **({"model": model} if model else {}))
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[list], *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start_model(run_id, parent_run_id, kwargs)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start_model(run_id, parent_run_id, kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self.spans.get(run_id)
+        if span is not None and "first_token_ms" not in span.attributes:
+            span.set(first_token_ms=round(span.duration_ms, 3))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = token_usage(response)
+        self.trace.add("input_tokens", usage["input_tokens"])
+        self.trace.add("output_tokens", usage["output_tokens"])
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+
+def set_run_attributes(config: dict, **attributes) -> None:
+    """Add attributes to the span of the run a RunnableLambda was called in, given the config it received.
+
+    Spans opened for runs by TracingCallbackHandler are not the current span of `set_attributes`, so code
+    running inside a traced run finds its span through the run id its config's callbacks are parented to.
+    """
+    callbacks = (config or {}).get("callbacks")
+    run_id = getattr(callbacks, "parent_run_id", None)
+    for handler in getattr(callbacks, "handlers", ()):
+        run_span = handler.spans.get(run_id) if isinstance(handler, TracingCallbackHandler) else None
+        if run_span is not None:
+            run_span.set(**attributes)
+            return
+    set_attributes(**attributes)
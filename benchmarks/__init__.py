@@ -0,0 +1,31 @@
+"""Benchmarks and reports for the examples in this repository.
+
+The examples are self-contained folders that import their siblings by module name, so the helpers below put
+a folder on `sys.path` (or load a Lambda module by file path) before the benchmark imports it.
+"""
+
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_app(folder: str) -> str:
+    """Make the modules of an example folder importable and return the folder's path."""
+    path = os.path.join(REPO_ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return path
+
+
+def load_module(folder: str, name: str, module_name: str = None):
+    """Load `<folder>/<name>.py` under a unique module name, since every Lambda is called lambda_function."""
+    module_name = module_name or f"{folder}.{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, folder, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
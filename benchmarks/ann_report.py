@@ -0,0 +1,136 @@
+"""Recall-vs-latency report of the ANN index kinds against the exact flat index.
+
+Usage:
+    python -m benchmarks.ann_report --vectors 1000000 --dim 1536 --output ann_report.json
+    python -m benchmarks.ann_report --index-dir RAG_chatbot_HR/.index_cache/<fingerprint>
+
+Without --index-dir the vectors are drawn from a Gaussian mixture, which clusters like real embeddings far
+more than uniform noise does. Each index kind is built once and then swept over its query-time parameter.
+"""
+
+import argparse
+import json
+import math
+import time
+from dataclasses import replace
+
+import faiss
+import numpy as np
+
+from benchmarks import use_app
+
+use_app("RAG_chatbot_HR")
+
+from ann_index import IndexSpec  # noqa: E402
+
+NPROBE_SWEEP = (1, 4, 16, 64, 256)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Draw clustered float32 vectors."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 1000), dimension)).astype(np.float32)
+    assignments = rng.integers(len(centers), size=count)
+    return centers[assignments] + 0.5 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+def saved_vectors(index_dir: str) -> np.ndarray:
+    """Reconstruct the vectors of a saved FAISS index."""
+    index = faiss.read_index(f"{index_dir}/index.faiss")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int, single_queries: int) -> dict:
+    """Measure recall@k, single-query latency percentiles and batch throughput."""
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+    latencies = []
+    for query in queries[:single_queries]:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "qps": round(len(queries) / batch_seconds, 1),
+    }
+
+
+def report(vectors: np.ndarray, queries: np.ndarray, k: int, specs: list, single_queries: int) -> list:
+    """Build every spec over the vectors and sweep its query-time parameter."""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for spec in specs:
+        spec = spec.fit(len(vectors))
+        start = time.perf_counter()
+        training = vectors[np.random.default_rng(1).permutation(len(vectors))[:spec.train_size]]
+        index = spec.create(vectors.shape[1], training_vectors=training if spec.needs_training else None)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        index_bytes = faiss.serialize_index(index).nbytes
+
+        if spec.needs_training:
+            sweep = [replace(spec, nprobe=nprobe) for nprobe in NPROBE_SWEEP if nprobe <= spec.nlist]
+        elif spec.kind == "hnsw":
+            sweep = [replace(spec, ef_search=ef_search) for ef_search in EF_SEARCH_SWEEP]
+        else:
+            sweep = [spec]
+        for tuned in sweep:
+            tuned.tune(index)
+            row = {
+                "index": spec.factory_string(),
+                "nprobe": tuned.nprobe if spec.needs_training else None,
+                "ef_search": tuned.ef_search if spec.kind == "hnsw" else None,
+                "build_seconds": round(build_seconds, 2),
+                "index_mb": round(index_bytes / 2 ** 20, 1),
+                **measure(index, queries, truth, k, single_queries),
+            }
+            rows.append(row)
+            print(json.dumps(row))
+    return rows
+
+
+def main():
+    """Run the report."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of synthetic vectors.")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of synthetic vectors (Titan v1: 1536).")
+    parser.add_argument("--index-dir", help="Use the vectors of a saved FAISS index instead of synthetic ones.")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--single-queries", type=int, default=200, help="Queries timed one at a time.")
+    parser.add_argument("--k", type=int, default=4, help="Neighbours per query (the retriever default is 4).")
+    parser.add_argument("--nlist", type=int, help="IVF lists. Defaults to 4 * sqrt(vectors).")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ sub-quantizers; must divide the dimension.")
+    parser.add_argument("--kinds", default="flat,ivf_flat,hnsw,ivf_pq,ivf_sq8")
+    parser.add_argument("--output", help="Write the rows as a JSON list to this file.")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        vectors = saved_vectors(args.index_dir)
+        queries = vectors[np.random.default_rng(2).permutation(len(vectors))[:args.queries]]
+    else:
+        # Queries come from the same mixture as the corpus, but are held out of the index.
+        vectors = synthetic_vectors(args.vectors + args.queries, args.dim)
+        vectors, queries = vectors[:args.vectors], vectors[args.vectors:]
+    nlist = args.nlist or max(1, int(4 * math.sqrt(len(vectors))))
+    specs = [
+        IndexSpec(kind=kind, nlist=nlist, pq_m=args.pq_m, train_size=min(len(vectors), 64 * nlist))
+        for kind in args.kinds.split(",")
+    ]
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    rows = report(vectors, queries, args.k, specs, args.single_queries)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(rows, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Load test of the ASGI service of RAG_chatbot_HR (asgi_app.py) against the stub model of benchmarks/fakes.py.
+
+Usage:
+    python -m benchmarks.asgi_load                                          # 300 conversations of 3 turns
+    python -m benchmarks.asgi_load --conversations 1000 --max-concurrency 512 --stream
+    python -m benchmarks.asgi_load --route rag --pages 20 --output asgi.json
+
+Every conversation is a coroutine sending its turns one after the other to the ASGI application of one process,
+called directly (no server or sockets), so the report measures what a single worker sustains: the event loop,
+the executor the blocking Bedrock calls run on, the concurrency limiter and the session history. All the
+conversations start together; model latencies follow benchmarks.fakes.DEFAULT_LATENCY as in offline_suite.
+The report is JSON, on stdout and in `--output`: throughput, turn latency (and time to first event when
+streaming), the status of every turn, the service's peak in-flight requests, threads and peak RSS.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import REPO_ROOT, use_app
+from benchmarks.fakes import FakeBedrockRuntime, LatencyProfile, Throttler
+from benchmarks.offline_suite import FOLLOW_UPS, QUESTIONS, git_commit, peak_rss_mib, percentile, write_handbook
+
+
+def turn_request(path: str, session_id: str, text: str) -> tuple:
+    """The ASGI scope and receive callable of a turn."""
+    body = json.dumps({"session_id": session_id, "message": text}).encode("utf-8")
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [(b"content-type", b"application/json")]}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive() -> dict:
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    return scope, receive
+
+
+async def send_turn(app, path: str, session_id: str, text: str) -> dict:
+    """Send one turn and time its response."""
+    scope, receive = turn_request(path, session_id, text)
+    result = {"status": None, "first_event_s": None, "error": None}
+    began = time.perf_counter()
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message.get("body"):
+            if result["first_event_s"] is None and message.get("more_body"):
+                result["first_event_s"] = time.perf_counter() - began
+            if message["body"].startswith(b"event: error"):
+                result["error"] = message["body"].decode("utf-8").split("data: ", 1)[-1].strip()
+            elif result["status"] != 200:
+                result["error"] = message["body"].decode("utf-8")
+
+    await app(scope, receive, send)
+    result["latency_s"] = time.perf_counter() - began
+    return result
+
+
+async def converse(app, path: str, number: int, turns: int) -> list:
+    """A conversation: a question, then follow-ups, each sent once the previous answer arrived."""
+    session_id = f"load-{number}"
+    results = []
+    for turn in range(turns):
+        text = QUESTIONS[number % len(QUESTIONS)] if turn == 0 else FOLLOW_UPS[(turn - 1) % len(FOLLOW_UPS)]
+        results.append(await send_turn(app, path, session_id, text))
+    return results
+
+
+async def run_load(service, args) -> tuple:
+    """Start the service, run every conversation at once and return the results, wall time and peak threads."""
+    await service.startup()
+    path = f"/{args.route}/stream" if args.stream else f"/{args.route}"
+    peak_threads = threading.active_count()
+
+    async def sample_threads() -> None:
+        nonlocal peak_threads
+        while True:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_threads())
+    start = time.perf_counter()
+    conversations = await asyncio.gather(*(converse(service, path, n, args.turns) for n in range(args.conversations)))
+    wall = time.perf_counter() - start
+    sampler.cancel()
+    return [result for conversation in conversations for result in conversation], wall, peak_threads
+
+
+def milliseconds(samples: list) -> dict:
+    """Mean and percentiles of durations in seconds, in milliseconds."""
+    samples = sorted(seconds * 1000 for seconds in samples)
+    return {
+        "mean": round(sum(samples) / len(samples), 2),
+        "p50": round(percentile(samples, 0.50), 2),
+        "p95": round(percentile(samples, 0.95), 2),
+        "p99": round(percentile(samples, 0.99), 2),
+        "max": round(samples[-1], 2),
+    }
+
+
+def run(args) -> dict:
+    """Set up the service on the stub model, run the load and summarize it."""
+    with tempfile.TemporaryDirectory(prefix="asgi-load-") as workdir:
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+        os.environ["INDEX_CACHE_DIR"] = os.path.join(workdir, "index_cache")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embeddings.sqlite3")
+        os.environ["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.sqlite3")
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        use_app("RAG_chatbot_HR")
+        latency = LatencyProfile(LatencyProfile.parse_overrides(args.latency), args.latency_scale, args.seed)
+        bedrock = FakeBedrockRuntime(latency, throttler=Throttler(args.throttle_rate, args.seed))
+
+        # The backend prints every request; keep the report alone on stdout.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            import asgi_app
+            import rag_backend
+
+            rag_backend.MODEL_POOL.set_bedrock_client(bedrock)
+            index_path = None
+            if args.route == "rag":
+                index_path = write_handbook(os.path.join(workdir, "handbook.pdf"), args.pages, args.seed)
+            service = asgi_app.ChatService(
+                max_concurrency=args.max_concurrency,
+                queue_timeout=args.queue_timeout,
+                request_timeout=args.request_timeout,
+                index_path=index_path,
+                response_cache=False,
+            )
+            results, wall, peak_threads = asyncio.run(run_load(service, args))
+
+    served = [result for result in results if result["status"] == 200 and result["error"] is None]
+    statuses = {}
+    for result in results:
+        status = str(result["status"]) if result["error"] is None or result["status"] != 200 else "stream_error"
+        statuses[status] = statuses.get(status, 0) + 1
+    report = {
+        "conversations": args.conversations,
+        "turns": len(results),
+        "served": len(served),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(served) / wall, 2) if wall else None,
+        "wall_s": round(wall, 3),
+        "max_in_flight": service.stats["max_in_flight"],
+        "rejected": service.stats["rejected"],
+        "timed_out": service.stats["timed_out"],
+        "peak_threads": peak_threads,
+        "peak_rss_mib": peak_rss_mib(),
+        "model_calls": dict(sorted(bedrock.calls.items())),
+    }
+    if served:
+        report["latency_ms"] = milliseconds([result["latency_s"] for result in served])
+        if args.stream:
+            report["first_event_ms"] = milliseconds([result["first_event_s"] for result in served])
+    errors = [result["error"] for result in results if result["error"] is not None]
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=300, help="Concurrent conversations.")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation.")
+    parser.add_argument("--route", choices=("chat", "rag"), default="chat")
+    parser.add_argument("--stream", action="store_true", help="Use the server-sent events routes.")
+    parser.add_argument("--max-concurrency", type=int, default=256, help="Requests the service runs at once.")
+    parser.add_argument("--queue-timeout", type=float, default=30.0, help="Seconds a request waits for a slot.")
+    parser.add_argument("--request-timeout", type=float, default=60.0, help="Seconds a request may run.")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the generated handbook (rag).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier of every latency (0: none).")
+    parser.add_argument("--latency", nargs="*", metavar="OPERATION=SPEC", help="Latency overrides, see fakes.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of throttled model calls.")
+    parser.add_argument("--output", help="Also write the report to this file.")
+    args = parser.parse_args()
+    try:
+        LatencyProfile.parse_overrides(args.latency)
+    except ValueError as error:
+        parser.error(str(error))
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "result": run(args),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+    sys.exit(1 if report["result"]["served"] < report["result"]["turns"] else 0)
+
+
+if __name__ == "__main__":
+    main()
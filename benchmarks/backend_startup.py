@@ -0,0 +1,92 @@
+"""Per-rerun overhead of building a ChatBotBackend, with and without the process-wide model pool.
+
+Usage:
+    python -m benchmarks.backend_startup --iterations 200
+    python -m benchmarks.backend_startup --app rag --index-dir RAG_chatbot_HR/.index_cache/<fingerprint>
+
+Streamlit builds a backend on every rerun. "cold" clears the pool before each construction, which is what
+every rerun paid before the pool existed (a new ChatBedrock client, boto session and chain graph), while
+"pooled" measures a rerun that reuses them. No model is invoked, but boto3 still resolves the configured
+AWS profile when a client is created.
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+from benchmarks import use_app
+
+
+def time_constructions(build, pool, iterations: int, cold: bool) -> dict:
+    """Time `iterations` constructions, clearing the pool before each one when `cold`."""
+    build()  # Import-time and first-use costs are not part of a rerun.
+    samples = []
+    for _ in range(iterations):
+        if cold:
+            pool.clear()
+        start = time.perf_counter()
+        build()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+
+def chat_builder():
+    """Build the plain chatbot backend of chatbot_streamlit."""
+    use_app("chatbot_streamlit")
+    import chatbot_backend
+
+    return (
+        lambda: chatbot_backend.ChatBotBackend(session_id=str(uuid.uuid4())),
+        chatbot_backend.MODEL_POOL,
+    )
+
+
+def rag_builder(index_dir: str):
+    """Build the RAG backend of RAG_chatbot_HR over a saved index."""
+    use_app("RAG_chatbot_HR")
+    import rag_backend
+    from langchain_community.vectorstores import FAISS
+
+    vectorstore = FAISS.load_local(index_dir, rag_backend.build_embeddings(), allow_dangerous_deserialization=True)
+    retriever = rag_backend.build_retriever(vectorstore)
+
+    def build():
+        return rag_backend.ChatBotBackend(session_id=str(uuid.uuid4()), index=retriever, use_rag=True)
+
+    return build, rag_backend.MODEL_POOL
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=("chat", "rag", "all"), default="chat")
+    parser.add_argument("--index-dir", help="Saved FAISS index used by the RAG backend.")
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    builders = {}
+    if args.app in ("chat", "all"):
+        builders["chat"] = chat_builder()
+    if args.app in ("rag", "all"):
+        if not args.index_dir:
+            parser.error("--index-dir is required for the RAG backend.")
+        builders["rag"] = rag_builder(args.index_dir)
+
+    results = {}
+    for name, (build, pool) in builders.items():
+        results[name] = {
+            "cold": time_constructions(build, pool, args.iterations, cold=True),
+            "pooled": time_constructions(build, pool, args.iterations, cold=False),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
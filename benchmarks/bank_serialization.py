@@ -0,0 +1,82 @@
+"""Serialization cost of a bank agent response, before and after the schema projection and encoder.
+
+Usage:
+    python -m benchmarks.bank_serialization --attributes 50 500 --iterations 2000
+
+Each account item carries the four schema fields plus `--attributes` extra attributes, half Decimal numbers and
+half maps of Decimals, as large items returned by a GetItem without projection do. Every case builds the agent
+response body and then serializes the whole response, as the Lambda runtime does:
+
+- "legacy": the full item through a JSONEncoder whose default() converts each Decimal.
+- "schema_full_item": encode_account on the full item, then the plain C encoder (encoder effect alone).
+- "schema_projected": encode_account on the item DynamoDB returns with the ProjectionExpression.
+"""
+
+import argparse
+import json
+import timeit
+from decimal import Decimal
+
+from benchmarks import use_app
+
+
+class LegacyDecimalEncoder(json.JSONEncoder):
+    """The encoder the Lambda used before: a Python callback per Decimal."""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+def make_item(attributes: int) -> dict:
+    """An account item with the schema fields and `attributes` extra ones."""
+    item = {
+        "AccountID": Decimal(1234567),
+        "AccountStatus": "Active",
+        "Reason": "KYC review completed",
+        "AccountName": "Household checking",
+    }
+    for number in range(attributes):
+        if number % 2:
+            item[f"Metric{number}"] = Decimal(f"{number}.25")
+        else:
+            item[f"Profile{number}"] = {"score": Decimal(number), "limit": Decimal("2500.00"), "tier": "gold"}
+    return item
+
+
+def wrap(body: str) -> dict:
+    """The agent response around a serialized body."""
+    return {
+        "messageVersion": "1.0",
+        "response": {"httpStatusCode": 200, "responseBody": {"application/json": {"body": body}}},
+    }
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attributes", type=int, nargs="+", default=[0, 50, 500])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    use_app("retail_bank_agent")
+    from account_schema import ACCOUNT_FIELDS, encode_account
+
+    results = {}
+    for attributes in args.attributes:
+        item = make_item(attributes)
+        projected = {field: item[field] for field in ACCOUNT_FIELDS}
+        cases = {
+            "legacy": lambda: json.dumps(wrap(json.dumps(item, cls=LegacyDecimalEncoder))),
+            "schema_full_item": lambda: json.dumps(wrap(json.dumps(encode_account(item)))),
+            "schema_projected": lambda: json.dumps(wrap(json.dumps(encode_account(projected)))),
+        }
+        results[f"{attributes}_attributes"] = timings = {}
+        for name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=args.iterations, repeat=3)) / args.iterations
+            timings[name] = {"us_per_call": round(seconds * 1e6, 2), "response_bytes": len(case())}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""Deterministic local stand-ins for Bedrock, S3 and DynamoDB, with configurable latency.
+
+The stand-ins answer the calls the examples make, with the same request and response shapes as boto3:
+
+- FakeBedrockRuntime: invoke_model for Llama 3 (chat), Titan (embeddings), Command (summaries) and SDXL
+  (images), and invoke_model_with_response_stream for Llama 3, as ChatBedrock and BedrockEmbeddings use them.
+- FakeAgentRuntime: retrieve_and_generate and retrieve of a knowledge base.
+- FakeS3: objects and multipart uploads in memory, head_object, and presigned URLs.
+- FakeDynamoDB: a resource whose tables answer get_item and batch_get_item with projections.
+
+Outputs depend only on the request (a hash of the prompt seeds them), so two runs produce the same answers,
+vectors and images. Latencies are drawn from a seeded generator per operation, see Latency.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+# Operation -> latency spec of the default profile, roughly what the models and services take on demand.
+DEFAULT_LATENCY = {
+    "chat": "lognormal:600:1500",
+    "chat_first_token": "lognormal:250:600",
+    "chat_token": "fixed:10",
+    "embed": "lognormal:40:120",
+    "text": "lognormal:800:2000",
+    "image": "lognormal:4000:8000",
+    "knowledge_base": "lognormal:1500:3500",
+    "retrieve": "lognormal:150:400",
+    "s3": "lognormal:15:60",
+    "dynamodb": "lognormal:4:12",
+}
+
+WORDS = (
+    "the policy employee leave benefit request manager approval days annual review line machine shift "
+    "temperature pressure alarm downtime maintenance sensor output batch quality account status active "
+    "course lesson module learner score poster movie scene light color"
+).split()
+
+
+def digest_seed(*parts) -> int:
+    """A stable 64-bit seed from the parts of a request."""
+    return int.from_bytes(hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).digest()[:8], "big")
+
+
+def fake_text(seed: int, words: int) -> str:
+    """Deterministic text of `words` words."""
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def fake_vector(text: str, dimensions: int) -> list:
+    """Deterministic unit vector of a text; texts sharing words get similar vectors."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        rng = random.Random(digest_seed(word))
+        for _ in range(4):
+            vector[rng.randrange(dimensions)] += rng.choice((-1.0, 1.0))
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class Latency:
+    """Seeded latency distribution of one operation.
+
+    Specs: "0" (none), "fixed:<ms>", "uniform:<low ms>:<high ms>" or "lognormal:<median ms>:<p95 ms>".
+    """
+
+    def __init__(self, spec: str = "0", scale: float = 1.0, seed: int = 0):
+        self.spec = spec
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        kind, *values = spec.split(":")
+        self.kind = "fixed" if kind == "0" else kind
+        self.values = [float(value) / 1000 for value in values] or [0.0]
+        if self.kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        """Draw a latency in seconds."""
+        if self.kind == "fixed" or self.scale == 0:
+            return self.values[0] * self.scale
+        with self.lock:
+            if self.kind == "uniform":
+                return self.rng.uniform(*self.values) * self.scale
+            median, p95 = self.values
+            sigma = math.log(p95 / median) / 1.645 if p95 > median else 0.0
+            return self.rng.lognormvariate(math.log(median), sigma) * self.scale
+
+    def wait(self) -> None:
+        """Sleep for one draw."""
+        seconds = self.sample()
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class LatencyProfile:
+    """The Latency of every operation, built from DEFAULT_LATENCY and overrides."""
+
+    def __init__(self, overrides: dict = None, scale: float = 1.0, seed: int = 0):
+        specs = {**DEFAULT_LATENCY, **(overrides or {})}
+        self.latencies = {
+            operation: Latency(spec, scale, digest_seed(seed, operation)) for operation, spec in specs.items()
+        }
+
+    def wait(self, operation: str) -> None:
+        """Sleep for one draw of an operation."""
+        self.latencies[operation].wait()
+
+    @staticmethod
+    def parse_overrides(values: list) -> dict:
+        """Parse "operation=spec" strings."""
+        overrides = {}
+        for value in values or []:
+            operation, _, spec = value.partition("=")
+            if operation not in DEFAULT_LATENCY or not spec:
+                raise ValueError(f"Expected operation=spec with an operation among {', '.join(DEFAULT_LATENCY)}")
+            overrides[operation] = spec
+        return overrides
+
+
+class Throttler:
+    """Rejects a seeded fraction of the calls with ThrottlingException, to exercise the retry paths."""
+
+    def __init__(self, rate: float = 0.0, seed: int = 0):
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def check(self, operation: str) -> None:
+        """Raise ThrottlingException for a `rate` share of the calls."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            throttled = self.rng.random() < self.rate
+        if throttled:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation)
+
+
+class StreamingBody:
+    """The parts of botocore's StreamingBody the examples read: read, iter_lines, iter_chunks and close."""
+
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amount: int = None) -> bytes:
+        return self._stream.read(amount)
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        while chunk := self._stream.read(chunk_size):
+            yield chunk
+
+    def iter_lines(self, chunk_size: int = 1024, keepends: bool = False):
+        for line in self._stream:
+            yield line if keepends else line.rstrip(b"\r\n")
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class CallCounter:
+    """Counts the calls a stand-in served, by operation."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def count(self, operation: str) -> None:
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+
+def response_metadata(headers: dict = None) -> dict:
+    """The ResponseMetadata of a successful call."""
+    return {"HTTPStatusCode": 200, "RequestId": uuid.uuid4().hex, "HTTPHeaders": headers or {}}
+
+
+class FakeBedrockRuntime(CallCounter):
+    """Stands in for the bedrock-runtime client.
+
+    Args:
+        latency (LatencyProfile): Latency of the calls.
+        embedding_dimensions (int): Size of the Titan vectors.
+        image_bytes (int): Size of the SDXL images (incompressible, like a detailed PNG).
+        answer_words (int): Length of the Llama 3 answers (and at most that of the Claude completions).
+        throttler (Throttler): Optional share of throttled calls.
+    """
+
+    def __init__(self, latency: LatencyProfile, embedding_dimensions: int = 1536, image_bytes: int = 1_500_000,
+                 answer_words: int = 60, throttler: Throttler = None):
+        super().__init__()
+        self.latency = latency
+        self.embedding_dimensions = embedding_dimensions
+        self.image_bytes = image_bytes
+        self.answer_words = answer_words
+        self.throttler = throttler or Throttler()
+
+    def invoke_model(self, modelId: str, body, **kwargs) -> dict:
+        request = json.loads(body)
+        self.throttler.check("InvokeModel")
+        if modelId.startswith("amazon.titan-embed"):
+            operation = "embed"
+            response = {"embedding": fake_vector(request["inputText"], self.embedding_dimensions),
+                        "inputTextTokenCount": len(request["inputText"]) // 4 + 1}
+        elif modelId.startswith("stability."):
+            operation = "image"
+            response = self.image_response(request)
+        elif modelId.startswith("cohere."):
+            operation = "text"
+            words = min(request.get("max_tokens", 100), 200) // 2
+            response = {"generations": [{"text": fake_text(digest_seed(modelId, request["prompt"]), words)}]}
+        elif modelId.startswith("meta."):
+            operation = "chat"
+            text = fake_text(digest_seed(modelId, request["prompt"]), self.answer_words)
+            response = {"generation": text, "prompt_token_count": len(request["prompt"]) // 4 + 1,
+                        "generation_token_count": self.answer_words, "stop_reason": "stop"}
+        elif modelId.startswith("anthropic."):
+            operation = "chat"
+            words = min(request.get("max_tokens_to_sample", 300), 2 * self.answer_words) // 2
+            response = {"completion": " " + fake_text(digest_seed(modelId, request["prompt"]), words),
+                        "stop_reason": "stop_sequence"}
+        else:
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": f"Unknown model {modelId}"}},
+                              "InvokeModel")
+        self.count(operation)
+        self.latency.wait(operation)
+        prompt = request.get("prompt") or request.get("inputText") or ""
+        output = response.get("generation") or response.get("completion") or "".join(
+            item["text"] for item in response.get("generations", []))
+        headers = {"x-amzn-bedrock-input-token-count": str(len(prompt) // 4 + 1),
+                   "x-amzn-bedrock-output-token-count": str(len(output) // 4)}
+        return {"body": StreamingBody(json.dumps(response).encode()), "contentType": "application/json",
+                "ResponseMetadata": response_metadata(headers)}
+
+    def image_response(self, request: dict) -> dict:
+        """The SDXL response of a request, with an image seeded by its prompt and parameters."""
+        seed = digest_seed(request["text_prompts"], request.get("seed"), request.get("cfg_scale"),
+                           request.get("steps"))
+        image = random.Random(seed).randbytes(self.image_bytes)
+        artifact = {"seed": request.get("seed", 0), "base64": base64.b64encode(image).decode("ascii"),
+                    "finishReason": "SUCCESS"}
+        return {"result": "success", "artifacts": [artifact]}
+
+    def invoke_model_with_response_stream(self, modelId: str, body, **kwargs) -> dict:
+        request = json.loads(body)
+        self.throttler.check("InvokeModelWithResponseStream")
+        if not modelId.startswith("meta."):
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": f"Unknown model {modelId}"}},
+                              "InvokeModelWithResponseStream")
+        self.count("chat_stream")
+        words = fake_text(digest_seed(modelId, request["prompt"]), self.answer_words).split(" ")
+        return {"body": self.stream_events(words, len(request["prompt"]) // 4 + 1),
+                "contentType": "application/json", "ResponseMetadata": response_metadata()}
+
+    def stream_events(self, words: list, prompt_tokens: int):
+        """Yield the chunk events of a Llama 3 stream, one word per chunk."""
+        self.latency.wait("chat_first_token")
+        for number, word in enumerate(words):
+            if number:
+                self.latency.wait("chat_token")
+            chunk = {"generation": word if number == 0 else f" {word}", "stop_reason": None}
+            if number == len(words) - 1:
+                chunk["stop_reason"] = "stop"
+                chunk["amazon-bedrock-invocationMetrics"] = {
+                    "inputTokenCount": prompt_tokens, "outputTokenCount": len(words),
+                }
+            yield {"chunk": {"bytes": json.dumps(chunk).encode()}}
+
+
+class FakeAgentRuntime(CallCounter):
+    """Stands in for the bedrock-agent-runtime client of a knowledge base."""
+
+    def __init__(self, latency: LatencyProfile, answer_words: int = 80, results: int = 5, throttler: Throttler = None):
+        super().__init__()
+        self.latency = latency
+        self.answer_words = answer_words
+        self.results = results
+        self.throttler = throttler or Throttler()
+
+    def references(self, text: str, count: int) -> list:
+        """The retrieved passages of a query."""
+        seed = digest_seed("retrieve", text)
+        return [
+            {
+                "content": {"text": fake_text(seed + number, 50)},
+                "location": {"type": "S3", "s3Location": {"uri": f"s3://knowledge-base/doc-{(seed + number) % 97}"}},
+                "score": round(1 - number * 0.05, 2),
+            }
+            for number in range(count)
+        ]
+
+    def retrieve_and_generate(self, input: dict, retrieveAndGenerateConfiguration: dict, sessionId: str = None,
+                              **kwargs) -> dict:
+        self.throttler.check("RetrieveAndGenerate")
+        self.count("retrieve_and_generate")
+        self.latency.wait("knowledge_base")
+        text = input["text"]
+        references = self.references(text, 2)
+        return {
+            "sessionId": sessionId or uuid.uuid4().hex,
+            "output": {"text": fake_text(digest_seed("generate", text), self.answer_words)},
+            "citations": [{"generatedResponsePart": {}, "retrievedReferences": references}],
+            "ResponseMetadata": response_metadata(),
+        }
+
+    def retrieve(self, knowledgeBaseId: str, retrievalQuery: dict, retrievalConfiguration: dict = None,
+                 **kwargs) -> dict:
+        self.throttler.check("Retrieve")
+        self.count("retrieve")
+        self.latency.wait("retrieve")
+        count = ((retrievalConfiguration or {}).get("vectorSearchConfiguration") or {}).get(
+            "numberOfResults", self.results)
+        return {"retrievalResults": self.references(retrievalQuery["text"], count),
+                "ResponseMetadata": response_metadata()}
+
+
+def not_found(operation: str, code: str = "NoSuchKey") -> ClientError:
+    """The error S3 raises for a missing object ("404" for HEAD requests)."""
+    return ClientError({"Error": {"Code": code, "Message": "Not Found"}}, operation)
+
+
+class FakeS3(CallCounter):
+    """Stands in for the S3 client, keeping objects in memory."""
+
+    def __init__(self, latency: LatencyProfile):
+        super().__init__()
+        self.latency = latency
+        self.objects = {}
+        self.uploads = {}
+
+    def put_object(self, Bucket: str, Key: str, Body=b"", ContentType: str = None, **kwargs) -> dict:
+        self.count("put_object")
+        self.latency.wait("s3")
+        data = Body.encode() if isinstance(Body, str) else bytes(Body)
+        with self.lock:
+            self.objects[(Bucket, Key)] = data
+        return {"ETag": hashlib.md5(data).hexdigest(), "ResponseMetadata": response_metadata()}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.count("get_object")
+        self.latency.wait("s3")
+        data = self.objects.get((Bucket, Key))
+        if data is None:
+            raise not_found("GetObject")
+        return {"Body": StreamingBody(data), "ContentLength": len(data), "ResponseMetadata": response_metadata()}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.count("head_object")
+        self.latency.wait("s3")
+        data = self.objects.get((Bucket, Key))
+        if data is None:
+            raise not_found("HeadObject", "404")
+        return {"ContentLength": len(data), "ResponseMetadata": response_metadata()}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.count("create_multipart_upload")
+        self.latency.wait("s3")
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body, **kwargs) -> dict:
+        self.count("upload_part")
+        self.latency.wait("s3")
+        data = bytes(Body)
+        with self.lock:
+            self.uploads[UploadId][PartNumber] = data
+        return {"ETag": hashlib.md5(data).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict,
+                                  **kwargs) -> dict:
+        self.count("complete_multipart_upload")
+        self.latency.wait("s3")
+        with self.lock:
+            parts = self.uploads.pop(UploadId)
+            self.objects[(Bucket, Key)] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> dict:
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: dict, ExpiresIn: int = 3600, **kwargs) -> str:
+        return f"https://{Params['Bucket']}.s3.localhost/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def project(item: dict, projection_expression: str = None, attribute_names: dict = None) -> dict:
+    """Keep the attributes of a ProjectionExpression (top-level names only, as the examples use)."""
+    if not projection_expression:
+        return dict(item)
+    names = [(attribute_names or {}).get(name.strip(), name.strip()) for name in projection_expression.split(",")]
+    return {name: item[name] for name in names if name in item}
+
+
+class FakeTable:
+    """Stands in for a DynamoDB Table keyed by a single attribute."""
+
+    def __init__(self, name: str, key: str, latency: LatencyProfile, counter: CallCounter = None):
+        self.name = name
+        self.key = key
+        self.latency = latency
+        self.counter = counter or CallCounter()
+        self.items = {}
+
+    def put_item(self, Item: dict, **kwargs) -> dict:
+        self.items[Item[self.key]] = Item
+        return {}
+
+    def get_item(self, Key: dict, ProjectionExpression: str = None, ExpressionAttributeNames: dict = None,
+                 **kwargs) -> dict:
+        self.counter.count("get_item")
+        self.latency.wait("dynamodb")
+        item = self.items.get(Key[self.key])
+        response = {"ResponseMetadata": response_metadata()}
+        if item is not None:
+            response["Item"] = project(item, ProjectionExpression, ExpressionAttributeNames)
+        return response
+
+
+class FakeDynamoDB(CallCounter):
+    """Stands in for the DynamoDB resource: Table() and batch_get_item over in-memory tables.
+
+    Args:
+        latency (LatencyProfile): Latency of the calls.
+        unprocessed_rate (float): Seeded share of batch keys returned as UnprocessedKeys, as under throttling.
+    """
+
+    def __init__(self, latency: LatencyProfile, unprocessed_rate: float = 0.0, seed: int = 0):
+        super().__init__()
+        self.latency = latency
+        self.tables = {}
+        self.unprocessed_rate = unprocessed_rate
+        self.rng = random.Random(seed)
+
+    def create_table(self, name: str, key: str) -> FakeTable:
+        self.tables[name] = FakeTable(name, key, self.latency, self)
+        return self.tables[name]
+
+    def Table(self, name: str) -> FakeTable:
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems: dict, **kwargs) -> dict:
+        self.count("batch_get_item")
+        self.latency.wait("dynamodb")
+        responses, unprocessed = {}, {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            found, left = [], []
+            for key in request["Keys"]:
+                with self.lock:
+                    skip = self.unprocessed_rate > 0 and self.rng.random() < self.unprocessed_rate
+                if skip:
+                    left.append(key)
+                elif key[table.key] in table.items:
+                    item = table.items[key[table.key]]
+                    found.append(project(item, request.get("ProjectionExpression"),
+                                         request.get("ExpressionAttributeNames")))
+            responses[name] = found
+            if left:
+                unprocessed[name] = {**request, "Keys": left}
+        return {"Responses": responses, "UnprocessedKeys": unprocessed, "ResponseMetadata": response_metadata()}
+
+
+def seed_accounts(table: FakeTable, count: int, extra_attributes: int = 20) -> None:
+    """Fill a table with `count` accounts (AccountID 1..count) carrying extra attributes outside the schema."""
+    statuses = ("Active", "Suspended", "Closed", "Pending")
+    for account_id in range(1, count + 1):
+        item = {
+            "AccountID": Decimal(account_id),
+            "AccountStatus": statuses[account_id % len(statuses)],
+            "Reason": fake_text(account_id, 6),
+            "AccountName": f"Account {account_id}",
+        }
+        for number in range(extra_attributes):
+            item[f"Metric{number}"] = Decimal(f"{account_id}.{number:02d}")
+        table.put_item(Item=item)
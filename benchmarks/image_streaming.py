@@ -0,0 +1,103 @@
+"""Peak memory of storing an SDXL response in S3, buffered versus streamed.
+
+Usage:
+    python -m benchmarks.image_streaming --sizes 1024 2048 4096
+
+"buffered" is what the poster Lambda used to do: read the whole body, json.loads it, base64-decode the artifact
+and put_object the bytes. "streamed" decodes the body in chunks into multipart upload parts
+(image_media_industry/image_stream.py). Each image is incompressible noise of side * side * 3 bytes, the worst
+case for a PNG of that resolution. The response body is built before measuring, since in Lambda it arrives from
+the socket; the S3 client counts the bytes it receives and drops them. Peak memory is measured with tracemalloc.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import time
+import tracemalloc
+
+from benchmarks import use_app
+
+
+class CountingS3Client:
+    """Stands in for the S3 client: accepts puts and multipart uploads, keeping only the byte counts."""
+
+    def __init__(self):
+        self.received = 0
+
+    def put_object(self, Body, **kwargs):
+        self.received += len(Body)
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "benchmark"}
+
+    def upload_part(self, Body, **kwargs):
+        self.received += len(Body)
+        return {"ETag": "benchmark"}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def abort_multipart_upload(self, **kwargs):
+        pass
+
+
+def response_body(size: int) -> bytes:
+    """Build an SDXL-style response for an image of `size` bytes."""
+    image = base64.b64encode(os.urandom(size)).decode("ascii")
+    artifact = {"seed": 0, "base64": image, "finishReason": "SUCCESS"}
+    return json.dumps({"result": "success", "artifacts": [artifact]}).encode()
+
+
+def buffered(body: bytes, client: CountingS3Client) -> None:
+    """Decode the whole response in memory and upload it in one call."""
+    artifact = json.loads(io.BytesIO(body).read())["artifacts"][0]
+    client.put_object(Bucket="posters", Key="poster.png", Body=base64.b64decode(artifact["base64"]))
+
+
+def streamed(body: bytes, client: CountingS3Client) -> None:
+    """Decode the response incrementally into multipart parts."""
+    import image_stream
+
+    writer = image_stream.MultipartWriter(client, "posters", "poster.png", content_type="image/png")
+    image_stream.stream_artifact(io.BytesIO(body), writer)
+    writer.close()
+
+
+def measure(store, body: bytes) -> dict:
+    """Peak traced memory and time of one store call."""
+    client = CountingS3Client()
+    tracemalloc.start()
+    start = time.perf_counter()
+    store(body, client)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_mib": round(peak / 2 ** 20, 2), "seconds": round(elapsed, 3), "stored_bytes": client.received}
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096], help="Image sides in pixels.")
+    args = parser.parse_args()
+    use_app("image_media_industry")
+
+    results = {}
+    for side in args.sizes:
+        image_size = side * side * 3
+        body = response_body(image_size)
+        results[f"{side}px"] = {
+            "image_mib": round(image_size / 2 ** 20, 2),
+            "response_mib": round(len(body) / 2 ** 20, 2),
+            "buffered": measure(buffered, body),
+            "streamed": measure(streamed, body),
+        }
+        del body
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Cold-start import time of every Lambda and backend, checked against a budget.
+
+Usage:
+    python -m benchmarks.import_budget                  # exit status 1 if a target is over budget
+    python -m benchmarks.import_budget --update         # record the current times (+25%) as the budget
+    python -m benchmarks.import_budget --skip-missing   # skip targets whose dependencies are not installed
+
+Each target is imported in a fresh interpreter with `python -X importtime`, from its own folder and with the
+repository root on PYTHONPATH (where the Lambdas find the `common` layer). The time of a target is the cumulative
+import time of its module, the best of `--repeat` runs; the heaviest imports are listed to help find regressions.
+Budgets are read from benchmarks/import_budget.json when it exists, and from BUDGETS_MS otherwise.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+from benchmarks import REPO_ROOT
+
+BUDGET_FILE = os.path.join(REPO_ROOT, "benchmarks", "import_budget.json")
+
+# Folder and module of every target.
+TARGETS = {
+    "image_media_industry": ("image_media_industry", "lambda_function"),
+    "manufacturing_logs_summarization": ("manufacturing_logs_summarization", "lambda_function"),
+    "retail_bank_agent": ("retail_bank_agent", "lambda_function"),
+    "elearn_app_knowledge_base": ("elearn_app_knowledge_base", "lambda_function"),
+    "chatbot_streamlit": ("chatbot_streamlit", "chatbot_backend"),
+    "RAG_chatbot_HR": ("RAG_chatbot_HR", "rag_backend"),
+}
+
+# Default budgets in milliseconds. The Lambdas only import botocore.exceptions up front; the backends import
+# langchain_aws and langchain_core but not the indexing stack.
+BUDGETS_MS = {
+    "image_media_industry": 150,
+    "manufacturing_logs_summarization": 150,
+    "retail_bank_agent": 100,
+    "elearn_app_knowledge_base": 150,
+    "chatbot_streamlit": 2000,
+    "RAG_chatbot_HR": 2500,
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def profile_import(folder: str, module: str) -> dict:
+    """Import a module in a fresh interpreter and parse the `-X importtime` report."""
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, environment.get("PYTHONPATH")]))
+    environment.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(REPO_ROOT, folder),
+        env=environment,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return {"error": error[-1] if error else f"exit status {result.returncode}"}
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3))))
+    # Children are reported before their parent, so the target's imports are the entries since the previous
+    # top-level one; this leaves out the interpreter's own start-up imports.
+    end = max(position for position, entry in enumerate(entries) if entry[0] == module and entry[3] == 1)
+    start = max([position + 1 for position, entry in enumerate(entries[:end]) if entry[3] == 1] or [0])
+    heaviest = sorted(entries[start:end + 1], key=lambda entry: entry[1], reverse=True)[:5]
+    return {
+        "ms": entries[end][2] / 1000,
+        "heaviest": {name: round(self_us / 1000, 1) for name, self_us, _, _ in heaviest},
+    }
+
+
+def load_budgets() -> dict:
+    """Read the budget file, falling back to the defaults."""
+    if os.path.exists(BUDGET_FILE):
+        with open(BUDGET_FILE, encoding="utf-8") as budget_file:
+            return {**BUDGETS_MS, **json.load(budget_file)}
+    return dict(BUDGETS_MS)
+
+
+def main():
+    """Profile the targets and compare them with their budgets."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", help=f"Targets to check, among {', '.join(TARGETS)} (all).")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per target; the fastest one counts.")
+    parser.add_argument("--update", action="store_true", help="Write the measured times, plus 25%%, as budgets.")
+    parser.add_argument("--skip-missing", action="store_true", help="Skip targets that fail to import.")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    budgets = load_budgets()
+    report, failed = {}, False
+    for name in args.targets or TARGETS:
+        runs = [profile_import(*TARGETS[name]) for _ in range(args.repeat)]
+        if "error" in runs[0]:
+            report[name] = {"status": "skipped" if args.skip_missing else "error", "error": runs[0]["error"]}
+            failed = failed or not args.skip_missing
+            continue
+        best = min(runs, key=lambda run: run["ms"])
+        over = best["ms"] > budgets[name]
+        failed = failed or (over and not args.update)
+        report[name] = {
+            "status": "over budget" if over else "ok",
+            "ms": round(best["ms"], 1),
+            "budget_ms": budgets[name],
+            "heaviest_self_ms": best["heaviest"],
+        }
+        if args.update:
+            budgets[name] = int(best["ms"] * 1.25) + 1
+
+    if args.update:
+        with open(BUDGET_FILE, "w", encoding="utf-8") as budget_file:
+            json.dump(budgets, budget_file, indent=2)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""End-to-end benchmarks of every entry point, offline, against the stand-ins of benchmarks/fakes.py.
+
+Usage:
+    python -m benchmarks.offline_suite                                  # every scenario
+    python -m benchmarks.offline_suite chat rag --requests 200 --concurrency 16
+    python -m benchmarks.offline_suite --latency-scale 0 --output results.json   # framework overhead only
+    python -m benchmarks.offline_suite lambda_image --latency image=fixed:500 s3=0
+
+Scenarios:
+    chat                  chatbot_streamlit ChatBotBackend.get_response
+    rag                   RAG_chatbot_HR ChatBotBackend.get_rag_response over an index of a generated PDF
+    indexer               RAG_chatbot_HR Indexer.index of a new generated PDF per request (cold build)
+    lambda_image          image_media_industry lambda_handler, one poster per request
+    lambda_summarization  manufacturing_logs_summarization lambda_handler, a batch of generated logs
+    lambda_bank           retail_bank_agent lambda_handler, alternating single and batch lookups
+    lambda_elearn         elearn_app_knowledge_base lambda_handler, in the `--elearn-mode` knowledge base mode
+
+Every scenario runs in a fresh interpreter (unless --no-isolate), so imports, caches and the peak RSS of one do
+not leak into the next. The Lambdas get their clients through common.aws.set_client and the backends through
+MODEL_POOL.set_bedrock_client; nothing reaches AWS. Each scenario sends `--warmup` untimed requests, then
+`--requests` requests on `--concurrency` threads, and reports throughput, latency percentiles, errors, the
+calls the stand-ins served and the peak RSS. Model latencies follow benchmarks.fakes.DEFAULT_LATENCY, scaled by
+`--latency-scale` and overridden with `--latency operation=spec`; outputs and latencies are seeded by `--seed`,
+so runs on the same commit are comparable. The report is JSON, on stdout and in `--output`.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks import REPO_ROOT, load_module, use_app
+from benchmarks.fakes import (
+    FakeAgentRuntime,
+    FakeBedrockRuntime,
+    FakeDynamoDB,
+    FakeS3,
+    LatencyProfile,
+    Throttler,
+    fake_text,
+    seed_accounts,
+)
+
+QUESTIONS = [
+    "How many days of annual leave do employees get?",
+    "What is the policy for remote work?",
+    "How do I request parental leave?",
+    "Who approves overtime requests?",
+    "What benefits are available to part-time employees?",
+    "How is the annual performance review scored?",
+    "What is the notice period for resignation?",
+    "How are travel expenses reimbursed?",
+]
+FOLLOW_UPS = [
+    "What about its deadline?",
+    "And does that apply to managers too?",
+    "Can you summarize it in one sentence?",
+]
+LOG_TEMPLATES = [
+    "{time} INFO line-{line} shift {shift} batch {batch} completed in {value} s",
+    "{time} WARN line-{line} sensor T{sensor} temperature {value} C above threshold",
+    "{time} ERROR line-{line} pressure valve {sensor} fault code E{code}",
+    "{time} INFO line-{line} maintenance check passed for machine M{sensor}",
+]
+
+
+def percentile(samples: list, share: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    return samples[max(0, min(len(samples) - 1, math.ceil(share * len(samples)) - 1))]
+
+
+def peak_rss_mib() -> float:
+    """Peak resident set size of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes.
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def make_pdf(pages: list) -> bytes:
+    """A minimal PDF with one page of Helvetica text lines per item of `pages` (lists of lines)."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+            "/Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{number} 0 R' for number in page_ids)}] /Count {len(pages)} >>"
+
+    output, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(output)
+
+
+def write_handbook(path: str, pages: int, seed: int) -> str:
+    """Write a generated HR handbook of `pages` pages of 60 lines and return its path."""
+    with open(path, "wb") as pdf:
+        pdf.write(make_pdf([[fake_text(seed * 100_000 + page * 100 + line, 12) for line in range(60)]
+                            for page in range(pages)]))
+    return path
+
+
+def make_log(lines: int, seed: int) -> str:
+    """A generated manufacturing log of mostly repeated templates."""
+    rows = []
+    for number in range(lines):
+        value = (seed * 7919 + number * 104729) % 1000
+        rows.append(LOG_TEMPLATES[value % len(LOG_TEMPLATES)].format(
+            time=f"2024-05-01T{number // 3600 % 24:02d}:{number // 60 % 60:02d}:{number % 60:02d}",
+            line=value % 4, shift=value % 3, batch=seed * 1000 + number // 100, value=value / 10,
+            sensor=value % 16, code=100 + value % 5,
+        ))
+    return "\n".join(rows)
+
+
+def question(number: int, sessions: int) -> tuple:
+    """The session and question of a request: each session asks a question, then follow-ups."""
+    session, turn = number % sessions, number // sessions
+    text = QUESTIONS[session % len(QUESTIONS)] if turn == 0 else FOLLOW_UPS[(turn - 1) % len(FOLLOW_UPS)]
+    return f"session-{session}", text
+
+
+def make_fakes(args) -> dict:
+    """Build the stand-ins of a scenario."""
+    latency = LatencyProfile(LatencyProfile.parse_overrides(args.latency), args.latency_scale, args.seed)
+    throttler = Throttler(args.throttle_rate, args.seed)
+    return {
+        "bedrock-runtime": FakeBedrockRuntime(latency, image_bytes=args.image_bytes, throttler=throttler),
+        "bedrock-agent-runtime": FakeAgentRuntime(latency, throttler=throttler),
+        "s3": FakeS3(latency),
+        "dynamodb": FakeDynamoDB(latency, args.unprocessed_rate, args.seed),
+    }
+
+
+def use_lambda_fakes(fakes: dict) -> None:
+    """Serve every client of the shared layer from the stand-ins."""
+    from common import aws
+
+    for service, client in fakes.items():
+        aws.set_client(service, client)
+
+
+def setup_chat(fakes: dict, args):
+    use_app("chatbot_streamlit")
+    import chatbot_backend
+
+    chatbot_backend.MODEL_POOL.set_bedrock_client(fakes["bedrock-runtime"])
+    sessions = max(1, args.requests // args.turns)
+
+    def request(number: int):
+        session_id, text = question(number, sessions)
+        backend = chatbot_backend.ChatBotBackend(session_id=session_id)
+        if args.stream:
+            return "".join(backend.stream_response(text))
+        return backend.get_response(text)
+
+    return request
+
+
+def setup_rag(fakes: dict, args):
+    use_app("RAG_chatbot_HR")
+    import rag_backend
+
+    rag_backend.MODEL_POOL.set_bedrock_client(fakes["bedrock-runtime"])
+    path = write_handbook(os.path.join(args.workdir, "handbook.pdf"), args.pages, args.seed)
+    retriever = rag_backend.build_retriever(rag_backend.Indexer(path).index().vectorstore)
+    sessions = max(1, args.requests // args.turns)
+
+    def request(number: int):
+        session_id, text = question(number, sessions)
+        backend = rag_backend.ChatBotBackend(session_id=session_id, index=retriever, use_rag=True)
+        if args.stream:
+            return [chunk for chunk in backend.stream_rag_response(text)]
+        return backend.get_rag_response(text)
+
+    return request
+
+
+def setup_indexer(fakes: dict, args):
+    use_app("RAG_chatbot_HR")
+    import rag_backend
+
+    rag_backend.MODEL_POOL.set_bedrock_client(fakes["bedrock-runtime"])
+    # A distinct document per request, so every build embeds and indexes from scratch.
+    paths = [
+        write_handbook(os.path.join(args.workdir, f"handbook-{number}.pdf"), args.pages, args.seed + number + 1)
+        for number in range(args.requests + args.warmup)
+    ]
+
+    def request(number: int):
+        return rag_backend.Indexer(paths[number], cache_dir=os.path.join(args.workdir, "indexes")).index()
+
+    return request
+
+
+def setup_lambda_image(fakes: dict, args):
+    use_lambda_fakes(fakes)
+    use_app("image_media_industry")
+    function = load_module("image_media_industry", "lambda_function")
+    # Requests cycle through `--distinct` prompts, so the rest are generation cache hits.
+    distinct = max(1, args.distinct)
+    return lambda number: function.lambda_handler(
+        {"prompt": f"Movie poster of a {fake_text(number % distinct, 6).lower()}"}, None
+    )
+
+
+def setup_lambda_summarization(fakes: dict, args):
+    use_lambda_fakes(fakes)
+    use_app("manufacturing_logs_summarization")
+    function = load_module("manufacturing_logs_summarization", "lambda_function")
+    events = [
+        {"documents": [{"name": f"line-{document}.log", "text": make_log(args.log_lines, number * 10 + document)}
+                       for document in range(args.documents)]}
+        for number in range(args.requests + args.warmup)
+    ]
+    return lambda number: function.lambda_handler(events[number], None)
+
+
+def setup_lambda_bank(fakes: dict, args):
+    use_lambda_fakes(fakes)
+    use_app("retail_bank_agent")
+    function = load_module("retail_bank_agent", "lambda_function")
+    seed_accounts(fakes["dynamodb"].create_table(function.DYNAMODB_TABLE, "AccountID"), args.accounts)
+
+    def request(number: int):
+        event = {"actionGroup": "accountStatus", "httpMethod": "GET"}
+        first = number * 7919 % args.accounts + 1
+        if number % 2:
+            ids = ", ".join(str((first + offset) % args.accounts + 1) for offset in range(args.batch_size))
+            event.update(apiPath="/getAccountStatuses", parameters=[{"name": "accountNumbers", "value": ids}])
+        else:
+            event.update(apiPath="/getAccountStatus/{accountNumber}",
+                         parameters=[{"name": "accountNumber", "value": str(first)}])
+        return function.lambda_handler(event, None)
+
+    return request
+
+
+def setup_lambda_elearn(fakes: dict, args):
+    use_lambda_fakes(fakes)
+    use_app("elearn_app_knowledge_base")
+    function = load_module("elearn_app_knowledge_base", "lambda_function")
+    return lambda number: function.lambda_handler(
+        {"prompt": QUESTIONS[number % len(QUESTIONS)], "mode": args.elearn_mode}, None
+    )
+
+
+SCENARIOS = {
+    "chat": setup_chat,
+    "rag": setup_rag,
+    "indexer": setup_indexer,
+    "lambda_image": setup_lambda_image,
+    "lambda_summarization": setup_lambda_summarization,
+    "lambda_bank": setup_lambda_bank,
+    "lambda_elearn": setup_lambda_elearn,
+}
+
+
+def run_scenario(name: str, args) -> dict:
+    """Set up a scenario, send its requests and summarize the measurements."""
+    with tempfile.TemporaryDirectory(prefix=f"offline-{name}-") as workdir:
+        args.workdir = workdir
+        # Caches start empty on every run; the examples read these when they are first imported.
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+        os.environ["INDEX_CACHE_DIR"] = os.path.join(workdir, "index_cache")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embeddings.sqlite3")
+        os.environ["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.sqlite3")
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        fakes = make_fakes(args)
+
+        # The examples print every request; keep the report alone on stdout.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            request = SCENARIOS[name](fakes, args)
+            setup_seconds = time.perf_counter() - start
+            for number in range(args.warmup):
+                request(number)
+            setup_rss = peak_rss_mib()
+
+            def timed(number: int):
+                began = time.perf_counter()
+                try:
+                    request(args.warmup + number)
+                except Exception as error:  # Reported, so one failure does not hide the other measurements.
+                    return time.perf_counter() - began, f"{type(error).__name__}: {error}"
+                return time.perf_counter() - began, None
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                results = list(executor.map(timed, range(args.requests)))
+            wall = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for seconds, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "wall_s": round(wall, 3),
+        "setup_s": round(setup_seconds, 3),
+        "peak_rss_mib": peak_rss_mib(),
+        "setup_peak_rss_mib": setup_rss,
+        "calls": {service: dict(sorted(fake.calls.items())) for service, fake in fakes.items() if fake.calls},
+    }
+    if latencies:
+        report["latency_ms"] = {
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+        }
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def run_isolated(name: str, args) -> dict:
+    """Run a scenario in a new interpreter and return its report, or the error that stopped it."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        try:
+            return executor.submit(run_scenario, name, args).result()
+        except Exception as error:
+            return {"error": f"{type(error).__name__}: {error}"}
+
+
+def git_commit() -> str:
+    """The commit being measured, if the tree is a git checkout."""
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main():
+    """Run the suite."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run, among {', '.join(SCENARIOS)} (all).")
+    parser.add_argument("--requests", type=int, default=50, help="Timed requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads sending the requests.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests sent first.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier of every latency (0: none).")
+    parser.add_argument("--latency", nargs="*", metavar="OPERATION=SPEC", help="Latency overrides, see fakes.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of throttled model calls.")
+    parser.add_argument("--unprocessed-rate", type=float, default=0.0, help="Share of unprocessed batch keys.")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming methods of the backends.")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per chat session.")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the generated PDFs.")
+    parser.add_argument("--distinct", type=int, default=10, help="Distinct poster prompts.")
+    parser.add_argument("--image-bytes", type=int, default=1_500_000, help="Size of the generated images.")
+    parser.add_argument("--documents", type=int, default=3, help="Logs per summarization batch.")
+    parser.add_argument("--log-lines", type=int, default=2000, help="Lines per generated log.")
+    parser.add_argument("--accounts", type=int, default=10_000, help="Accounts in the DynamoDB table.")
+    parser.add_argument("--batch-size", type=int, default=25, help="Accounts per batch lookup.")
+    parser.add_argument(
+        "--elearn-mode", choices=("managed", "split"), default="managed",
+        help="Knowledge base mode of lambda_elearn: RetrieveAndGenerate, or cached Retrieve then InvokeModel.",
+    )
+    parser.add_argument(
+        "--no-isolate", action="store_true",
+        help="Run every scenario in this interpreter instead of one interpreter per scenario.",
+    )
+    parser.add_argument("--output", help="Also write the report to this file.")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    try:
+        LatencyProfile.parse_overrides(args.latency)
+    except ValueError as error:
+        parser.error(str(error))
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("scenarios", "output")},
+        "scenarios": {},
+    }
+    for name in args.scenarios or SCENARIOS:
+        report["scenarios"][name] = run_scenario(name, args) if args.no_isolate else run_isolated(name, args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+    sys.exit(1 if any("error" in result or result["errors"] for result in report["scenarios"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
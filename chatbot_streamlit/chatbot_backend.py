@@ -1,34 +1,23 @@
 """File to handle the backend of the chatbot."""
 import os
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 
-from langchain_core.chat_history import (
-    BaseChatMessageHistory,
-    InMemoryChatMessageHistory,
-)
 from langchain_core.messages import HumanMessage
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_aws import ChatBedrock
 
-PROFILE_NAME = os.getenv("AWS_PROFILE_NAME", "default")
-MODEL_ID = os.getenv("AWS_MODEL_ID", "meta.llama3-8b-instruct-v1:0")
+import common_path  # noqa: F401
+from common import bedrock
+from common.session_store import SessionHistory, add_turn
 
+if TYPE_CHECKING:
+    from langchain_core.runnables.history import RunnableWithMessageHistory
 
-class SessionHistory:
-    """Class to handle the session history."""
-
-    def __init__(self):
-        self.messages = []
-        self.store = {}
+PROFILE_NAME = os.getenv("AWS_PROFILE_NAME", "default")
+MODEL_ID = os.getenv("AWS_MODEL_ID", "meta.llama3-8b-instruct-v1:0")
+REGION_NAME = "us-west-2"
 
-    def add_message(self, message):
-        """Add a message to the history."""
-        self.messages.append(message)
 
-    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        """Get the session history."""
-        if session_id not in self.store:
-            self.store[session_id] = InMemoryChatMessageHistory()
-        return self.store[session_id]
+MODEL_POOL = bedrock.ModelPool(PROFILE_NAME, REGION_NAME, MODEL_ID)
+SESSION_HISTORY = SessionHistory()
 
 
 class ChatBotBackend:
@@ -37,21 +26,52 @@ class ChatBotBackend:
     def __init__(self, session_id, session_history=None):
         """Initialize the chatbot backend."""
         self.session_id = session_id
-        self.chat_bedrock = ChatBedrock(
-            credentials_profile_name=PROFILE_NAME,
-            model_id=MODEL_ID,
-            region_name="us-west-2",
-            model_kwargs=dict(temperature=0.5, top_p=0.9),
-        )
-        self.session_history = session_history or SessionHistory()
-        self.with_message_history = RunnableWithMessageHistory(
-            self.chat_bedrock,
-            lambda: self.session_history.get_session_history(self.session_id),
-        )
+        self.config = {"configurable": {"session_id": session_id}}
+        self.chat_bedrock = MODEL_POOL.get_chat_model()
+        self.session_history = session_history if session_history is not None else SESSION_HISTORY
+        # Runnables are built once per session history store, and the session is picked at call time through the
+        # `session_id` configurable, so every session shares them.
+        self.with_message_history = MODEL_POOL.get_runnable(("runnable", self.session_history), self.init_runnable)
+
+    def init_runnable(self) -> "RunnableWithMessageHistory":
+        """Initialize the runnable that keeps its history in the session history store."""
+        from langchain_core.runnables.history import RunnableWithMessageHistory
+
+        return RunnableWithMessageHistory(self.chat_bedrock, self.session_history.get_session_history)
 
     def get_response(self, user_input: str) -> str:
         """Get the response from the chatbot."""
         message = [HumanMessage(content=user_input)]
 
-        response = self.with_message_history.invoke(message)
+        response = self.with_message_history.invoke(message, config=self.config)
         return response.content
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """Stream the response from the chatbot token by token."""
+        # Streams run the bare model and save their turn themselves (see common.session_store.add_turn).
+        history = self.session_history.get_session_history(self.session_id)
+        messages = history.messages + [HumanMessage(content=user_input)]
+
+        answer = []
+        for chunk in self.chat_bedrock.stream(messages, config=self.config):
+            answer.append(chunk.content)
+            yield chunk.content
+        add_turn(history, user_input, "".join(answer))
+
+    async def aget_response(self, user_input: str) -> str:
+        """Get the response from the chatbot without blocking the event loop."""
+        message = [HumanMessage(content=user_input)]
+
+        response = await self.with_message_history.ainvoke(message, config=self.config)
+        return response.content
+
+    async def astream_response(self, user_input: str) -> AsyncIterator[str]:
+        """Stream the response from the chatbot token by token without blocking the event loop."""
+        history = self.session_history.get_session_history(self.session_id)
+        messages = history.messages + [HumanMessage(content=user_input)]
+
+        answer = []
+        async for chunk in self.chat_bedrock.astream(messages, config=self.config):
+            answer.append(chunk.content)
+            yield chunk.content
+        add_turn(history, user_input, "".join(answer))
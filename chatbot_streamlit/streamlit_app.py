@@ -1,7 +1,7 @@
 """Streamlit app for the chatbot."""
 import streamlit as st
 from chatbot_backend import ChatBotBackend
-from chatbot_backend import SessionHistory
+from chatbot_backend import SESSION_HISTORY
 import uuid
 
 
@@ -11,9 +11,9 @@ st.title('🦜🔗 Chatbot Llama')
 # Initialize or retrieve a session_id
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
-# Initialize session state to store chat messages if not already present
+# Every session keeps its history in the process-wide store, keyed by session_id
 if 'memory' not in st.session_state:
-    st.session_state.memory = SessionHistory()
+    st.session_state.memory = SESSION_HISTORY
 # Initialize session state to store chat messages if not already present
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -32,12 +32,8 @@ if prompt := st.chat_input("What is your question?"):
     # Append user input to session state
     st.session_state.messages.append({"role": "user", "content": prompt})
 
-    # Get response from the chatbot based on user input
-    response = chatbot_backend.get_response(user_input=prompt)
-
-    # Display response from the chatbot as a chat message
+    # Display response from the chatbot as a chat message, rendering tokens as they arrive
     with st.chat_message("assistant"):
-        # Write response with modified output (if any)
-        st.markdown(response)
+        response = st.write_stream(chatbot_backend.stream_response(user_input=prompt))
     # Append chatbot response to session state
     st.session_state.messages.append({"role": "assistant", "content": response})
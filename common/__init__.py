@@ -0,0 +1 @@
+"""Helpers shared by the Lambdas, deployed to them as a Lambda layer (see the README), and by the chatbot backends."""
@@ -0,0 +1,154 @@
+"""
+boto3 clients and resources created on first use, memoized per container and configured for warm reuse:
+a larger connection pool for the threaded Lambdas, TCP keep-alive and bounded retries and timeouts
+"""
+import os
+import threading
+
+from common.lazy import lazy_import
+
+# boto3 and botocore take a large share of a cold start; they are only loaded when a client is first created.
+boto3 = lazy_import('boto3')
+
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_CONNECT_TIMEOUT = float(os.getenv('AWS_CONNECT_TIMEOUT', '5'))
+# Image generation regularly takes longer than botocore's default of 60 seconds.
+AWS_READ_TIMEOUT = float(os.getenv('AWS_READ_TIMEOUT', '120'))
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', '3'))
+
+_clients = {}
+_overrides = {}
+_lock = threading.Lock()
+
+
+def client_config(**overrides):
+    """
+    Build the botocore Config shared by every client
+    :param overrides: Config arguments replacing the defaults
+    :return: Returns the Config
+    """
+    # A lazy botocore.config would import botocore itself up front, see lazy_import.
+    from botocore.config import Config
+
+    settings = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'tcp_keepalive': True,
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        # max_attempts would count the retries only; total_max_attempts counts the first call too.
+        'retries': {'mode': 'standard', 'total_max_attempts': AWS_MAX_ATTEMPTS},
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def retry_config(max_attempts=None):
+    """
+    Build the botocore Config of a client making at most max_attempts attempts per call
+    :param max_attempts: Attempts per call, e.g. 1 for a caller running its own retry loop, or None for AWS_MAX_ATTEMPTS
+    :return: Returns the Config
+    """
+    if max_attempts is None:
+        return client_config()
+    return client_config(retries={'mode': 'standard', 'total_max_attempts': max_attempts})
+
+
+def create_client(service, profile_name=None, max_attempts=None, **kwargs):
+    """
+    Create a new client configured by client_config, outside the shared ones, e.g. for a pool of its own
+    :param service: Name of the service, e.g. 'bedrock-runtime'
+    :param profile_name: AWS profile to take the credentials from, or None for the default ones
+    :param max_attempts: Attempts botocore makes per call, or None for AWS_MAX_ATTEMPTS
+    :param kwargs: Other boto3.client arguments, e.g. region_name or endpoint_url
+    :return: Returns the client
+    """
+    session = boto3.Session(profile_name=profile_name) if profile_name else boto3
+    return session.client(service, config=retry_config(max_attempts), **kwargs)
+
+
+def _get(kind, service, kwargs):
+    """Return the memoized client or resource, creating it on first use."""
+    if service in _overrides:
+        return _overrides[service]
+    key = (kind, service, tuple(sorted(kwargs.items())))
+    item = _clients.get(key)
+    if item is None:
+        with _lock:
+            item = _clients.get(key)
+            if item is None:
+                if kind == 'client':
+                    item = _clients[key] = create_client(service, **kwargs)
+                else:
+                    kwargs = dict(kwargs)
+                    config = retry_config(kwargs.pop('max_attempts', None))
+                    item = _clients[key] = boto3.resource(service, config=config, **kwargs)
+    return item
+
+
+def get_client(service, **kwargs):
+    """
+    Get the shared client of a service
+    :param service: Name of the service, e.g. 'bedrock-runtime'
+    :param kwargs: Other create_client arguments, e.g. profile_name, max_attempts, region_name or endpoint_url
+    :return: Returns the client
+    """
+    return _get('client', service, kwargs)
+
+
+def get_resource(service, **kwargs):
+    """
+    Get the shared resource of a service
+    :param service: Name of the service, e.g. 'dynamodb'
+    :param kwargs: max_attempts, or other boto3.resource arguments, e.g. endpoint_url
+    :return: Returns the resource
+    """
+    return _get('resource', service, kwargs)
+
+
+def set_client(service, client):
+    """
+    Serve a stand-in (a stubbed client, a moto client or a fake) for every client or resource of a service
+    :param service: Name of the service
+    :param client: The stand-in, or None to go back to real clients
+    """
+    with _lock:
+        if client is None:
+            _overrides.pop(service, None)
+        else:
+            _overrides[service] = client
+
+
+def reset():
+    """Drop every memoized client and stand-in."""
+    with _lock:
+        _clients.clear()
+        _overrides.clear()
+
+
+class LazyClient:
+    """
+    Placeholder bound at import time in place of a client: the client is created (or the stand-in looked up) when
+    one of its methods is first used
+    """
+
+    def __init__(self, service, kind='client', **kwargs):
+        self.service = service
+        self.kind = kind
+        self.kwargs = kwargs
+
+    def resolve(self):
+        """Return the client or resource this placeholder stands for."""
+        return _get(self.kind, self.service, self.kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+def lazy_client(service, **kwargs):
+    """Return a placeholder for the shared client of a service, created on first use."""
+    return LazyClient(service, 'client', **kwargs)
+
+
+def lazy_resource(service, **kwargs):
+    """Return a placeholder for the shared resource of a service, created on first use."""
+    return LazyClient(service, 'resource', **kwargs)
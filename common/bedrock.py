@@ -0,0 +1,121 @@
+"""
+Process-wide pool of the bedrock-runtime client and of the LangChain models and chains built on it, shared by
+every session of the chatbot backends
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from common import aws
+
+# Runnables are keyed on the objects they are built from (retrievers, history stores), which a long-running app may
+# replace, so only the most recently used ones are kept.
+MODEL_POOL_MAX_RUNNABLES = int(os.getenv('MODEL_POOL_MAX_RUNNABLES', '32'))
+
+
+class _Ref:
+    """Hashable by identity, so that any object, e.g. an unhashable retriever, can be part of a pool key"""
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Ref) and other.obj is self.obj
+
+
+class ModelPool:
+    """
+    Thread-safe pool of items built once per process: the Bedrock client, configured by common.aws.client_config
+    so its connection pool covers every session and embedding thread, the ChatBedrock models using it, and the
+    most recently used chains built from them (see get_runnable)
+    """
+
+    def __init__(self, profile_name=None, region_name=None, model_id=None, model_kwargs=None,
+                 max_runnables=MODEL_POOL_MAX_RUNNABLES):
+        """
+        :param profile_name: AWS profile of the Bedrock client, or None for the default credentials
+        :param region_name: Region of the Bedrock client
+        :param model_id: Default model of get_chat_model
+        :param model_kwargs: Inference parameters of the chat models
+        :param max_runnables: Number of runnables kept by get_runnable
+        """
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.model_id = model_id
+        self.model_kwargs = model_kwargs or {'temperature': 0.5, 'top_p': 0.9}
+        self.max_runnables = max_runnables
+        self._items = {}
+        self._runnables = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, factory):
+        """
+        Get the item stored under a key, building it on first use
+        :param key: Hashable key naming the item and what it depends on
+        :param factory: Function building the item
+        :return: Returns the item
+        """
+        item = self._items.get(key)
+        if item is None:
+            with self._lock:
+                item = self._items.get(key)
+                if item is None:
+                    item = self._items[key] = factory()
+        return item
+
+    def get_runnable(self, key, factory):
+        """
+        Get a chain or runnable built from the pooled models and other objects, building it on first use; only the
+        max_runnables most recently used ones are kept
+        :param key: Tuple naming the runnable and the objects it is built from, which are compared by identity
+        :param factory: Function building the runnable
+        :return: Returns the runnable
+        """
+        key = tuple(part if isinstance(part, (str, int, float, bool, type(None))) else _Ref(part) for part in key)
+        with self._lock:
+            runnable = self._runnables.get(key)
+            if runnable is None:
+                runnable = self._runnables[key] = factory()
+            self._runnables.move_to_end(key)
+            while len(self._runnables) > self.max_runnables:
+                self._runnables.popitem(last=False)
+            return runnable
+
+    def get_bedrock_client(self):
+        """Get the shared bedrock-runtime client."""
+        return self.get(('bedrock_client',), lambda: aws.create_client(
+            'bedrock-runtime', profile_name=self.profile_name, region_name=self.region_name))
+
+    def set_bedrock_client(self, client):
+        """Serve every model and embedding built from now on through a client, e.g. a local stand-in."""
+        with self._lock:
+            self._items.clear()
+            self._runnables.clear()
+            self._items[('bedrock_client',)] = client
+
+    def get_chat_model(self, model_id=None):
+        """
+        Get the shared ChatBedrock model
+        :param model_id: The Bedrock model, the pool's default one when None
+        :return: Returns the ChatBedrock model
+        """
+        model_id = model_id or self.model_id
+
+        def build():
+            from langchain_aws import ChatBedrock
+
+            return ChatBedrock(client=self.get_bedrock_client(), model_id=model_id, region_name=self.region_name,
+                               model_kwargs=dict(self.model_kwargs))
+
+        return self.get(('chat_model', model_id), build)
+
+    def clear(self):
+        """Drop every pooled client, model and chain."""
+        with self._lock:
+            self._items.clear()
+            self._runnables.clear()
@@ -0,0 +1,25 @@
+"""Deferred imports: the module is found at import time but only executed on first attribute access."""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Import a module lazily. A missing module still fails immediately, but its code (and the imports it makes)
+    only runs when an attribute of it is first used. Finding a submodule needs the __path__ of its package, so
+    for a dotted name the parent packages are imported right away; defer a submodule with a function-level
+    import instead when its package is costly
+    :param name: Name of the module
+    :return: Returns the module, loaded on first use
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,320 @@
+"""Bounded chat history stores (in-memory LRU with TTL, or SQLite) and windowed history replay."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    get_buffer_string,
+    message_to_dict,
+    messages_from_dict,
+)
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+# The default database sits next to this module, wherever the app is started from.
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.sqlite3")
+)
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+SESSION_WINDOW_TURNS = int(os.getenv("SESSION_WINDOW_TURNS", "10"))
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and an assistant in a few sentences, keeping names, "
+    "facts and decisions that later questions may refer to. If a previous summary is given, extend it."
+)
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count of a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Rough token count of a message: its text and a few tokens of role and separators."""
+    return count_tokens(message.content) + 3
+
+
+def add_turn(history: BaseChatMessageHistory, question: str, answer: str) -> None:
+    """Add a question and its answer to a history, as RunnableWithMessageHistory does once a run ends.
+
+    Streamed turns run the bare chain and are saved with this: in langchain-core 0.2 the listener that saves
+    the history of `RunnableWithMessageHistory.stream` also fires on the runnable's internal branch and fails.
+    """
+    history.add_messages([HumanMessage(content=question), AIMessage(content=answer)])
+
+
+class InMemorySessionStore:
+    """Class to handle per-session histories in memory, evicting idle and least recently used sessions."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        """Initialize the store."""
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """Get the history of a session, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry is not None and now - entry[1] <= self.ttl_seconds else None
+            if history is None:
+                history = InMemoryChatMessageHistory()
+            self._sessions[session_id] = (history, now)
+            # The dict is ordered by last access, so idle sessions are always at the front.
+            while self._sessions:
+                oldest_id, (_, last_access) = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and now - last_access <= self.ttl_seconds:
+                    break
+                del self._sessions[oldest_id]
+            return self._sessions[session_id][0]
+
+    def __len__(self) -> int:
+        """Number of sessions kept."""
+        return len(self._sessions)
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history of one session stored in a SQLiteSessionStore."""
+
+    def __init__(self, store: "SQLiteSessionStore", session_id: str):
+        """Initialize the history."""
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Read the messages of the session."""
+        rows = self.store.execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (self.session_id,)
+        )
+        return messages_from_dict([json.loads(message) for message, in rows])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Append messages to the session."""
+        rows = [(self.session_id, json.dumps(message_to_dict(message))) for message in messages]
+        self.store.executemany("INSERT INTO messages (session_id, message) VALUES (?, ?)", rows)
+
+    def clear(self) -> None:
+        """Delete the messages of the session."""
+        self.store.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+
+
+class SQLiteSessionStore:
+    """Class to handle per-session histories persisted in SQLite, deleting sessions idle for longer than the TTL."""
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+    ):
+        """Open (or create) the store at the given path; `max_sessions` bounds the history objects kept in memory."""
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+        )
+        self._connection.commit()
+        self._last_purge = 0.0
+        self._histories = OrderedDict()
+
+    def execute(self, statement: str, parameters: Sequence = ()) -> list:
+        """Run a statement and return its rows."""
+        with self._lock:
+            rows = self._connection.execute(statement, parameters).fetchall()
+            self._connection.commit()
+            return rows
+
+    def executemany(self, statement: str, rows: Sequence[Sequence]) -> None:
+        """Run a statement for each row."""
+        with self._lock:
+            self._connection.executemany(statement, rows)
+            self._connection.commit()
+
+    def purge(self) -> None:
+        """Delete the sessions that have been idle for longer than the TTL."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+                (cutoff,),
+            )
+            self._connection.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+            self._connection.commit()
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """Get the history of a session, recording the access."""
+        now = time.time()
+        if now - self._last_purge > min(self.ttl_seconds, 600):
+            self._last_purge = now
+            self.purge()
+        self.execute("INSERT OR REPLACE INTO sessions (session_id, last_access) VALUES (?, ?)", (session_id, now))
+        with self._lock:
+            # Reuse the history objects of recent sessions so wrappers around them keep their state.
+            history = self._histories.pop(session_id, None)
+            if history is None:
+                history = SQLiteChatMessageHistory(self, session_id)
+            self._histories[session_id] = history
+            while len(self._histories) > self.max_sessions:
+                self._histories.popitem(last=False)
+            return history
+
+
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    """Chat history that stores every message but only replays recent turns into the prompt.
+
+    The window holds the last `max_turns` turns and, if `max_tokens` is set, only as many of them as fit
+    in that budget (the latest turn is always kept). With a `summarizer` LLM, the turns that fall out of
+    the window are folded into a rolling summary that is replayed as a system message.
+    """
+
+    def __init__(
+        self,
+        history: BaseChatMessageHistory,
+        max_turns: int = None,
+        max_tokens: int = None,
+        summarizer=None,
+        token_counter: Callable[[BaseMessage], int] = estimate_tokens,
+    ):
+        """Initialize the windowed history."""
+        self.history = history
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self.summary = None
+        self.summarized_count = 0
+
+    @staticmethod
+    def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """Group messages into turns, each starting with a human message."""
+        turns = []
+        for message in messages:
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def window(self, messages: List[BaseMessage]) -> int:
+        """Return how many of the oldest messages fall outside the window."""
+        turns = self.split_turns(messages)
+        if self.max_turns:
+            turns = turns[-self.max_turns:]
+        if self.max_tokens:
+            kept, used = [], 0
+            for turn in reversed(turns):
+                cost = sum(self.token_counter(message) for message in turn)
+                if kept and used + cost > self.max_tokens:
+                    break
+                kept.insert(0, turn)
+                used += cost
+            turns = kept
+        return len(messages) - sum(len(turn) for turn in turns)
+
+    def summarize(self, dropped: List[BaseMessage]) -> Optional[str]:
+        """Extend the rolling summary with the messages that left the window since the last call."""
+        if self.summarizer is None or len(dropped) <= self.summarized_count:
+            return self.summary
+        new_messages = dropped[self.summarized_count:]
+        text = get_buffer_string(new_messages)
+        if self.summary:
+            text = f"Previous summary: {self.summary}\n\n{text}"
+        response = self.summarizer.invoke([SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=text)])
+        self.summary = response.content
+        self.summarized_count = len(dropped)
+        return self.summary
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """The messages replayed into the prompt."""
+        messages = self.history.messages
+        cut = self.window(messages)
+        summary = self.summarize(messages[:cut]) if cut else None
+        window = messages[cut:]
+        if summary:
+            return [SystemMessage(content=f"Summary of the earlier conversation: {summary}"), *window]
+        return window
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Store new messages."""
+        self.history.add_messages(messages)
+
+    def clear(self) -> None:
+        """Clear the stored messages and the summary."""
+        self.history.clear()
+        self.summary = None
+        self.summarized_count = 0
+
+
+def build_store():
+    """Build the store selected by SESSION_STORE ("memory" or "sqlite")."""
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    return InMemorySessionStore()
+
+
+class SessionHistory:
+    """Class to handle the session history.
+
+    Histories live in a bounded store and are replayed through a window of the last `max_turns` turns
+    and/or `max_tokens` tokens (0 disables either), optionally summarizing older turns with `summarizer`.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        max_turns: int = SESSION_WINDOW_TURNS,
+        max_tokens: int = SESSION_TOKEN_BUDGET,
+        summarizer=None,
+    ):
+        """Initialize the session history.
+
+        Args:
+            store: An InMemorySessionStore or SQLiteSessionStore. Defaults to the one selected by SESSION_STORE.
+            max_turns (int): Number of recent turns replayed into the prompt.
+            max_tokens (int): Token budget of the replayed turns.
+            summarizer: Chat model used to summarize the turns that leave the window.
+        """
+        self.store = store if store is not None else build_store()
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        """Get the session history."""
+        history = self.store.get(session_id)
+        if not self.max_turns and not self.max_tokens and self.summarizer is None:
+            return history
+        with self._lock:
+            window = self._windows.pop(session_id, None)
+            if window is None or window.history is not history:
+                window = WindowedChatMessageHistory(history, self.max_turns, self.max_tokens, self.summarizer)
+            self._windows[session_id] = window
+            # A window is only useful while its store still holds the session.
+            while len(self._windows) > self.store.max_sessions:
+                self._windows.popitem(last=False)
+            return window
@@ -0,0 +1,350 @@
+"""
+Lightweight tracing of Lambda invocations: a span per stage, token counts, cache hits and retries, exported as
+structured JSON log lines or as OpenTelemetry (OTLP/JSON) spans, followed by a summary of the invocation.
+When TRACING is off, traced_handler returns the handler unchanged and every other function returns at once.
+The chatbot backends build their request traces on the same spans, see RAG_chatbot_HR/tracing.py
+"""
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+
+TRACING = os.getenv('TRACING', 'false').lower() == 'true'
+# 'json': a log line per span, 'otel': one OTLP/JSON export of the spans, 'summary': the summary alone.
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', 'json')
+SERVICE_NAME = os.getenv('AWS_LAMBDA_FUNCTION_NAME', 'lambda')
+# Bedrock reports the token counts of invoke_model in these response headers.
+INPUT_TOKENS_HEADER = 'x-amzn-bedrock-input-token-count'
+OUTPUT_TOKENS_HEADER = 'x-amzn-bedrock-output-token-count'
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+_cold_start = True
+
+
+class Span:
+    """One timed stage of a trace, with attributes and events (cache hits, retries)"""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'events', 'error')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.error = None
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def add_event(self, name, **attributes):
+        """Record a point in time of the span."""
+        self.events.append((name, time.time_ns(), attributes))
+
+    def end(self, error=None):
+        """Close the span, marking it failed if an exception ended it."""
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f'{type(error).__name__}: {error}'
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_log(self):
+        """The span as a structured log record."""
+        record = {
+            'type': 'span', 'trace_id': self.trace.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+            'name': self.name, 'start_ns': self.start_ns, 'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+        }
+        if self.events:
+            record['events'] = [{'name': name, 'time_ns': at, **attributes} for name, at, attributes in self.events]
+        if self.error:
+            record['error'] = self.error
+        return record
+
+    def to_otel(self):
+        """The span in the OTLP/JSON encoding."""
+        span = {
+            'traceId': self.trace.trace_id, 'spanId': self.span_id, 'name': self.name, 'kind': 1,
+            'startTimeUnixNano': str(self.start_ns), 'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': otel_attributes(self.attributes),
+            'events': [{'name': name, 'timeUnixNano': str(at), 'attributes': otel_attributes(attributes)}
+                       for name, at, attributes in self.events],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def otel_attributes(attributes):
+    """Encode attributes as OTLP key-values."""
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            encoded.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            encoded.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            encoded.append({'key': key, 'value': {'stringValue': str(value)}})
+    return encoded
+
+
+class Trace:
+    """The spans and counters of one invocation; spans may be opened from several threads"""
+
+    service_name = SERVICE_NAME
+
+    def __init__(self, name, request_id=None):
+        self.trace_id = secrets.token_hex(16)
+        self.name = name
+        self.request_id = request_id
+        self.spans = []
+        self.counters = {'input_tokens': 0, 'output_tokens': 0, 'cache_hits': 0, 'cache_misses': 0, 'retries': 0}
+        self.lock = threading.Lock()
+
+    def start_span(self, name, parent=None, attributes=None):
+        span = Span(self, name, parent.span_id if parent else None, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] += value
+
+    @property
+    def root(self):
+        """The first span of the trace, which the others descend from."""
+        return self.spans[0]
+
+    def summary(self):
+        """
+        Summarize the invocation: its duration and status, the time spent in each stage and the counters
+        :return: Returns the summary record
+        """
+        root, stages = self.root, {}
+        for span in self.spans[1:]:
+            stage = stages.setdefault(span.name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+            stage['count'] += 1
+            stage['total_ms'] += span.duration_ms
+            stage['max_ms'] = max(stage['max_ms'], span.duration_ms)
+            stage['errors'] += span.error is not None
+        for stage in stages.values():
+            stage['total_ms'] = round(stage['total_ms'], 3)
+            stage['max_ms'] = round(stage['max_ms'], 3)
+        return {
+            'type': 'trace_summary', 'trace_id': self.trace_id, 'request_id': self.request_id, 'name': self.name,
+            'status': 'error' if root.error else 'ok', 'duration_ms': round(root.duration_ms, 3),
+            'cold_start': root.attributes.get('cold_start', False), 'stages': stages, **self.counters,
+        }
+
+    def export(self):
+        """Write the spans in the TRACE_EXPORT format, then the summary, as JSON log lines."""
+        if TRACE_EXPORT == 'json':
+            for span in self.spans:
+                print(json.dumps(span.to_log(), default=str))
+        elif TRACE_EXPORT == 'otel':
+            print(json.dumps({'resourceSpans': [{
+                'resource': {'attributes': otel_attributes({'service.name': self.service_name})},
+                'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otel() for span in self.spans]}],
+            }]}, default=str))
+        print(json.dumps(self.summary(), default=str))
+
+
+class TraceContext:
+    """Context manager making the root span of a trace current, then ending it and exporting the trace on exit"""
+
+    __slots__ = ('trace', 'token')
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.trace.root)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.trace.root.end(exc)
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # A streaming generator closed from another context; its context is discarded anyway.
+            pass
+        self.trace.export()
+        return False
+
+
+class _SpanContext:
+    """Context manager opening a child span of the current one"""
+
+    __slots__ = ('parent', 'name', 'attributes', 'span', 'token')
+
+    def __init__(self, parent, name, attributes):
+        self.parent = parent
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.span = self.parent.trace.start_span(self.name, self.parent, self.attributes)
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.span.end(exc)
+        _current.reset(self.token)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span and its context manager outside a traced invocation"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attributes):
+    """
+    Time a stage of the current invocation: `with tracing.span('invoke_model', model=MODEL_ID): ...`
+    :param name: Name of the stage; the summary adds up the spans of the same name
+    :param attributes: Attributes of the span
+    :return: Returns a context manager yielding the span (a no-op outside a traced invocation)
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanContext(parent, name, attributes)
+
+
+def set_attributes(**attributes):
+    """Add attributes to the current span."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def record_tokens(input_tokens=0, output_tokens=0):
+    """Add token counts to the current span and the invocation."""
+    current = _current.get()
+    if current is None:
+        return
+    current.set(input_tokens=current.attributes.get('input_tokens', 0) + input_tokens,
+                output_tokens=current.attributes.get('output_tokens', 0) + output_tokens)
+    current.trace.add('input_tokens', input_tokens)
+    current.trace.add('output_tokens', output_tokens)
+
+
+def record_usage(response):
+    """Record the token counts Bedrock returns in the headers of an invoke_model response."""
+    if _current.get() is None:
+        return
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    record_tokens(int(headers.get(INPUT_TOKENS_HEADER, 0)), int(headers.get(OUTPUT_TOKENS_HEADER, 0)))
+
+
+def record_cache(hit, cache, count=1, **attributes):
+    """
+    Record cache lookups of the current span
+    :param hit: Whether the lookups were hits
+    :param cache: Name of the cache
+    :param count: Number of lookups with this outcome
+    :param attributes: Other attributes of the event, e.g. the tier that answered
+    """
+    current = _current.get()
+    if current is None or not count:
+        return
+    current.add_event('cache_hit' if hit else 'cache_miss', cache=cache, count=count, **attributes)
+    current.trace.add('cache_hits' if hit else 'cache_misses', count)
+
+
+def record_retry(operation, reason):
+    """Record that the current span retries an operation, e.g. after a ThrottlingException."""
+    current = _current.get()
+    if current is None:
+        return
+    current.add_event('retry', operation=operation, reason=reason)
+    current.trace.add('retries')
+
+
+def propagate(function):
+    """
+    Bind the current span to a function run on a worker thread, so its spans join the invocation's trace
+    (threads of a ThreadPoolExecutor do not inherit context variables)
+    :param function: The function submitted to the executor
+    :return: Returns the bound function, or the function itself outside a traced invocation
+    """
+    parent = _current.get()
+    if parent is None:
+        return function
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return bound
+
+
+def response_status(response):
+    """Find the status code of a handler's response (API Gateway style or Bedrock agent style)."""
+    if not isinstance(response, dict):
+        return None
+    if 'statusCode' in response:
+        return response['statusCode']
+    return response.get('response', {}).get('httpStatusCode')
+
+
+def traced_handler(handler):
+    """
+    Trace every invocation of a lambda_handler: a root span with the shape of the event (its keys, never its
+    payload), the spans its stages open, and an export of the trace when it returns or raises
+    :param handler: The lambda_handler
+    :return: Returns the traced handler, or the handler itself when TRACING is off
+    """
+    if not TRACING:
+        return handler
+
+    @functools.wraps(handler)
+    def traced(event, context):
+        global _cold_start
+        trace = Trace(handler.__module__, getattr(context, 'aws_request_id', None))
+        root = trace.start_span('lambda_handler', attributes={
+            'cold_start': _cold_start,
+            'event.keys': ','.join(sorted(event)) if isinstance(event, dict) else type(event).__name__,
+        })
+        _cold_start = False
+        with TraceContext(trace):
+            response = handler(event, context)
+            status = response_status(response)
+            if status is not None:
+                root.set(status_code=status)
+            return response
+
+    return traced
@@ -1,25 +1,261 @@
-"""Lambda function to access the foundational model using the knowledge base API."""
+"""
+Lambda function answering learners' questions from the course knowledge base, in one of two modes:
+'managed' calls RetrieveAndGenerate, whose sessionId carries the conversation across turns, and 'split' calls
+Retrieve, keeping the passages of each normalized question in the container for a while, then generates the
+answer with InvokeModel. A batch of quiz questions is answered in one invocation with bounded concurrency
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
+from botocore.exceptions import BotoCoreError, ClientError
 
-bedrock = boto3.client('bedrock-agent-runtime')
+from common import aws, tracing
 
+# The shared clients are created on first use. with_retries runs the throttling retries, so botocore makes a single
+# attempt per call.
+bedrock = aws.lazy_client('bedrock-agent-runtime', max_attempts=1)
+bedrock_runtime = aws.lazy_client('bedrock-runtime', max_attempts=1)
 
-def lambda_handler(event, context):
-    """Lambda handler to access the foundational model using the knowledge base API."""
-    user_prompt = event['prompt']
-    response = bedrock.retrieve_and_generate(
-        input={'text': user_prompt},
-        retrieveAndGenerateConfiguration={
-            'type': 'KNOWLEDGE_BASE',
-            'knowledgeBaseConfiguration': {
-                'knowledgeBaseId': 'UBOCLDWDCM',
-                'modelArn': 'arn:aws:bedrock:us-west-2::foundation-model/anthropic.claude-v2:1'
-            }
-        }
-    )
-
-    return {
-        'statusCode': 200,
-        'body': response['output']['text']
+KNOWLEDGE_BASE_ID = os.getenv('KNOWLEDGE_BASE_ID', 'UBOCLDWDCM')
+MODEL_ID = 'anthropic.claude-v2:1'
+MODEL_ARN = f'arn:aws:bedrock:us-west-2::foundation-model/{MODEL_ID}'
+# 'managed' (RetrieveAndGenerate) or 'split' (cached Retrieve, then InvokeModel); a request may override it.
+RETRIEVAL_MODE = os.getenv('KB_RETRIEVAL_MODE', 'managed')
+RETRIEVAL_RESULTS = int(os.getenv('KB_RETRIEVAL_RESULTS', '5'))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv('KB_RETRIEVAL_CACHE_TTL_SECONDS', '600'))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv('KB_RETRIEVAL_CACHE_MAX_ENTRIES', '1024'))
+GENERATION_MAX_TOKENS = int(os.getenv('KB_GENERATION_MAX_TOKENS', '500'))
+MAX_WORKERS = int(os.getenv('KB_MAX_WORKERS', '8'))
+MAX_QUESTIONS = int(os.getenv('KB_MAX_QUESTIONS', '100'))
+MAX_RETRIES = int(os.getenv('KB_MAX_RETRIES', '4'))
+# Stripped from the end of a question before it is cached or deduplicated, with the spacing around it.
+TRAILING_PUNCTUATION = '?!.,;: '
+# Response header carrying the sessionId to send with the next turn.
+SESSION_HEADER = 'X-Session-Id'
+RETRYABLE_ERRORS = {'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+                    'ServiceQuotaExceededException'}
+
+GENERATION_PROMPT = (
+    '\n\nHuman: You are a course assistant. Answer the learner\'s question using only the passages from the '
+    'course material below. If they do not contain the answer, say that you do not know.\n\n'
+    '<passages>\n{passages}\n</passages>\n\nQuestion: {question}\n\nAssistant:'
+)
+
+
+class RetrievalCache:
+    """Helper class to keep the passages retrieved for a question for a while in the container, so the same
+    course question asked again (by other learners or in a quiz batch) skips the vector search"""
+
+    def __init__(self, ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS, max_entries=RETRIEVAL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached passages of a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, passages):
+        """Cache the passages of a key, evicting the least recently used ones."""
+        with self._lock:
+            self._entries[key] = (passages, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+retrieval_cache = RetrievalCache()
+
+
+def normalize_question(question):
+    """
+    Normalize a question for the cache and the batch: case, spacing and trailing punctuation do not change what
+    is asked, while every other character does ('2+2' and '2-2', 'C' and 'C++' are different questions)
+    :param question: The question
+    :return: Returns the normalized question
+    """
+    return ' '.join(question.lower().split()).rstrip(TRAILING_PUNCTUATION)
+
+
+def is_question(value):
+    """Whether a request value is a question: a string with more than spacing and punctuation in it."""
+    return isinstance(value, str) and bool(normalize_question(value))
+
+
+def with_retries(operation, call):
+    """
+    Call the knowledge base or the model, retrying with exponential backoff and jitter when it throttles
+    :param operation: Name of the operation, for the traces
+    :param call: Function making the call
+    :return: Returns the response of the call
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return call()
+        except ClientError as error:
+            if error.response['Error']['Code'] not in RETRYABLE_ERRORS or attempt == MAX_RETRIES:
+                raise
+            tracing.record_retry(operation, error.response['Error']['Code'])
+            time.sleep(random.uniform(0, min(10, 0.5 * 2 ** attempt)))
+
+
+def retrieve_and_generate(question, session_id=None):
+    """
+    Answer a question with RetrieveAndGenerate, continuing the learner's session when there is one
+    :param question: The learner's question
+    :param session_id: The sessionId returned by a previous turn, if any
+    :return: Returns the answer and the sessionId of the conversation
+    """
+    request = {
+        'input': {'text': question},
+        'retrieveAndGenerateConfiguration': {'type': 'KNOWLEDGE_BASE', 'knowledgeBaseConfiguration': {
+            'knowledgeBaseId': KNOWLEDGE_BASE_ID,
+            'modelArn': MODEL_ARN}},
     }
+    if session_id:
+        request['sessionId'] = session_id
+    with tracing.span('retrieve_and_generate', session=bool(session_id)):
+        response = with_retries('retrieve_and_generate', lambda: bedrock.retrieve_and_generate(**request))
+    return response['output']['text'], response.get('sessionId')
+
+
+def retrieve(question):
+    """
+    Retrieve the passages of a question from the container cache or the knowledge base
+    :param question: The learner's question
+    :return: Returns the list of passage texts
+    """
+    key = (KNOWLEDGE_BASE_ID, RETRIEVAL_RESULTS, normalize_question(question))
+    passages = retrieval_cache.get(key)
+    tracing.record_cache(passages is not None, 'retrieval')
+    if passages is None:
+        with tracing.span('retrieve', results=RETRIEVAL_RESULTS):
+            response = with_retries('retrieve', lambda: bedrock.retrieve(
+                knowledgeBaseId=KNOWLEDGE_BASE_ID,
+                retrievalQuery={'text': question},
+                retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': RETRIEVAL_RESULTS}}))
+        passages = [result['content']['text'] for result in response['retrievalResults']]
+        retrieval_cache.put(key, passages)
+    return passages
+
+
+def generate(question, passages):
+    """
+    Generate the answer of a question from retrieved passages with the knowledge base's model
+    :param question: The learner's question
+    :param passages: The passage texts
+    :return: Returns the answer
+    """
+    prompt = GENERATION_PROMPT.format(passages='\n\n'.join(passages), question=question)
+    with tracing.span('invoke_model', model=MODEL_ID, prompt_chars=len(prompt)):
+        response = with_retries('invoke_model', lambda: bedrock_runtime.invoke_model(
+            contentType='application/json',
+            accept='application/json',
+            modelId=MODEL_ID,
+            body=json.dumps({
+                'prompt': prompt,
+                'max_tokens_to_sample': GENERATION_MAX_TOKENS,
+                'temperature': 0,
+                'stop_sequences': ['\n\nHuman:']})))
+        tracing.record_usage(response)
+    return json.loads(response['body'].read())['completion'].strip()
+
+
+def answer(question, mode=RETRIEVAL_MODE, session_id=None):
+    """
+    Answer a question. A turn of an existing session always goes through RetrieveAndGenerate: a follow-up
+    only makes sense with the conversation, which Bedrock keeps with the session, so it is neither cached nor
+    retrieved on its own
+    :param question: The learner's question
+    :param mode: 'managed' or 'split'
+    :param session_id: The sessionId of the conversation, if any
+    :return: Returns the answer and the sessionId (None in split mode)
+    """
+    if mode == 'split' and not session_id:
+        return generate(question, retrieve(question)), None
+    return retrieve_and_generate(question, session_id)
+
+
+def answer_questions(questions, mode=RETRIEVAL_MODE, max_workers=MAX_WORKERS):
+    """
+    Answer a batch of independent questions (e.g. a quiz) concurrently; repeated questions are answered once.
+    A question that fails gets an error instead of an answer, so it does not fail the whole batch
+    :param questions: The list of questions
+    :param mode: 'managed' or 'split'
+    :param max_workers: Maximum number of questions answered at once
+    :return: Returns a list of {'question', 'answer'} or {'question', 'error'} objects, in order
+    """
+    distinct = list(dict.fromkeys(normalize_question(question) for question in questions))
+    first_asked = {}
+    for question in questions:
+        first_asked.setdefault(normalize_question(question), question)
+
+    def answer_one(key):
+        try:
+            return {'answer': answer(first_asked[key], mode)[0]}
+        except ClientError as error:
+            return {'error': error.response['Error']['Code']}
+        except BotoCoreError as error:
+            # A read timeout or an unreachable endpoint fails this question only.
+            return {'error': str(error)}
+
+    with tracing.span('batch', questions=len(questions), distinct=len(distinct)):
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(distinct)))) as executor:
+            results = dict(zip(distinct, executor.map(tracing.propagate(answer_one), distinct)))
+    return [{'question': question, **results[normalize_question(question)]} for question in questions]
+
+
+@tracing.traced_handler
+def lambda_handler(event, context):
+    """
+    Lambda handler to access the foundational model using the knowledge base API
+    :param event: {'prompt', optional 'sessionId'} for a question, or {'questions': [...], optional
+        'max_workers' up to MAX_WORKERS} for a batch; both accept 'mode' ('managed' or 'split')
+    :param context: Context is the runtime information of the function
+    :return: Returns the answer as the body, with the sessionId to send with the next turn in the X-Session-Id
+        header, or the batch's answers as a JSON body
+    """
+    mode = event.get('mode', RETRIEVAL_MODE)
+    if mode not in ('managed', 'split'):
+        return {'statusCode': 400, 'body': "mode must be 'managed' or 'split'"}
+
+    if 'questions' in event:
+        questions = event['questions']
+        if not isinstance(questions, list) or not questions or len(questions) > MAX_QUESTIONS:
+            return {'statusCode': 400, 'body': f'Provide between 1 and {MAX_QUESTIONS} questions'}
+        if not all(is_question(question) for question in questions):
+            return {'statusCode': 400, 'body': 'Every question must be a non-empty string'}
+        max_workers = event.get('max_workers', MAX_WORKERS)
+        if isinstance(max_workers, bool) or not isinstance(max_workers, int):
+            return {'statusCode': 400, 'body': 'max_workers must be an integer'}
+        # The caller may lower the concurrency, never raise it past what the function is sized for.
+        answers = answer_questions(questions, mode, max(1, min(max_workers, MAX_WORKERS)))
+        return {'statusCode': 200, 'body': json.dumps({'answers': answers})}
+
+    if not is_question(event.get('prompt')):
+        return {'statusCode': 400, 'body': 'prompt must be a non-empty string'}
+    text, session_id = answer(event['prompt'], mode, event.get('sessionId'))
+    response = {'statusCode': 200, 'body': text}
+    if session_id:
+        # A proxy integration only passes statusCode, headers and body on, so the session id goes in a header.
+        response['headers'] = {SESSION_HEADER: session_id}
+    return response
@@ -0,0 +1,167 @@
+"""
+Streaming decode of Bedrock image responses into S3: the base64 artifact is decoded incrementally from the response
+body and written to S3 in multipart upload parts, so memory stays bounded by the part size instead of several
+copies of the image
+"""
+import base64
+import binascii
+import json
+import os
+
+READ_CHUNK_BYTES = int(os.getenv('POSTER_READ_CHUNK_BYTES', str(64 * 1024)))
+# S3 parts must be at least 5 MiB, except the last one.
+PART_SIZE_BYTES = max(5 * 1024 * 1024, int(os.getenv('POSTER_PART_SIZE_BYTES', str(8 * 1024 * 1024))))
+
+
+class Base64FieldDecoder:
+    """
+    Incremental decoder for one base64 string field of a JSON document (the first "base64" key by default).
+    feed() takes raw JSON bytes and returns the decoded bytes of the field found so far. Every other byte of the
+    document is kept, with the field's value left empty, so the small metadata around it (seed, finishReason)
+    can be parsed with metadata() once the document ends
+    """
+
+    def __init__(self, field='base64'):
+        self.marker = json.dumps(field).encode('utf-8')
+        self.state = 'key'
+        self.pending = b''
+        self.remainder = b''
+        self.rest = bytearray()
+
+    def feed(self, chunk):
+        """
+        Consume the next bytes of the document
+        :param chunk: Raw JSON bytes
+        :return: Returns the decoded bytes of the field contained in this chunk (possibly empty)
+        """
+        data = self.pending + chunk
+        self.pending = b''
+        decoded = b''
+        while data:
+            if self.state == 'key':
+                position = data.find(self.marker)
+                if position < 0:
+                    # Keep a possible partial marker for the next chunk.
+                    keep = len(self.marker) - 1
+                    self.rest += data[:-keep] if len(data) > keep else b''
+                    self.pending = data[-keep:] if len(data) > keep else data
+                    return decoded
+                self.rest += data[:position + len(self.marker)]
+                data = data[position + len(self.marker):]
+                self.state = 'colon'
+            elif self.state == 'colon':
+                stripped = data.lstrip(b' \t\r\n:')
+                self.rest += data[:len(data) - len(stripped)]
+                data = stripped
+                if data:
+                    if data[:1] != b'"':
+                        raise ValueError('The image field is not a string')
+                    self.rest += b'"'
+                    data = data[1:]
+                    self.state = 'value'
+            elif self.state == 'value':
+                end = data.find(b'"')
+                value, data = (data, b'') if end < 0 else (data[:end], data[end:])
+                decoded += self.decode(value)
+                if end >= 0:
+                    if self.remainder:
+                        raise ValueError('The image field is not valid base64')
+                    self.state = 'done'
+            else:
+                self.rest += data
+                data = b''
+        return decoded
+
+    def decode(self, value):
+        """Decode whole 4-character groups, carrying the rest over to the next chunk."""
+        # JSON may escape '/' as '\/'; base64 never contains a backslash.
+        value = self.remainder + value.replace(b'\\', b'')
+        usable = len(value) - len(value) % 4
+        self.remainder = value[usable:]
+        try:
+            return base64.b64decode(value[:usable], validate=True)
+        except binascii.Error as error:
+            raise ValueError(f'The image field is not valid base64: {error}') from error
+
+    def metadata(self):
+        """
+        Parse the document without the field, once it has been fed completely
+        :return: Returns the document with the field's value replaced by an empty string
+        """
+        if self.state != 'done':
+            raise ValueError('The response has no complete image field')
+        return json.loads(bytes(self.rest + self.pending))
+
+
+class MultipartWriter:
+    """
+    File-like writer that uploads to S3 in fixed-size parts. An object smaller than one part is sent with a single
+    put_object when the writer is closed; call abort() instead of close() to discard a failed upload
+    """
+
+    def __init__(self, client, bucket, key, content_type='application/octet-stream', part_size=PART_SIZE_BYTES):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        """Buffer data, uploading a part whenever the buffer is full."""
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(memoryview(self.buffer)[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def upload_part(self, data):
+        """Upload one part, starting the multipart upload on the first one."""
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                                 ContentType=self.content_type)['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+    def close(self):
+        """Upload what is left and complete the object."""
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=self.buffer,
+                                   ContentType=self.content_type)
+        else:
+            if self.buffer:
+                self.upload_part(self.buffer)
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+        self.buffer = bytearray()
+
+    def abort(self):
+        """Discard the upload."""
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self.buffer = bytearray()
+
+
+def stream_artifact(body, writer, chunk_size=READ_CHUNK_BYTES):
+    """
+    Decode the image of a Bedrock response body into a writer, reading the body in fixed-size chunks.
+    The writer is not closed, so the caller can check the metadata before committing the object
+    :param body: The response's StreamingBody (anything with read(size))
+    :param writer: A MultipartWriter (anything with write(data))
+    :param chunk_size: Number of bytes read at a time
+    :return: Returns the first artifact of the response, without its base64 data
+    """
+    decoder = Base64FieldDecoder()
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        decoded = decoder.feed(chunk)
+        if decoded:
+            writer.write(decoded)
+    return decoder.metadata()['artifacts'][0]
@@ -1,14 +1,320 @@
-import json
-# 1. import boto3
-import boto3
-import base64
 import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# 1. import the shared clients
+from common import aws, tracing
+from image_stream import MultipartWriter, stream_artifact
+
+# 2. Create client connection with Bedrock and S3 Services – Link; the clients are created on first use.
+# invoke_image_model runs its own throttling retries, so botocore makes a single attempt per call.
+client_bedrock = aws.lazy_client('bedrock-runtime', max_attempts=1)
+client_s3 = aws.lazy_client('s3')
+
+MODEL_ID = 'stability.stable-diffusion-xl-v1'
+POSTER_BUCKET = os.getenv('POSTER_BUCKET', 'movie-poster-design-dfvanegas')
+URL_EXPIRES_IN = int(os.getenv('POSTER_URL_EXPIRES_IN', '3600'))
+MAX_WORKERS = int(os.getenv('POSTER_MAX_WORKERS', '8'))
+# SDXL on-demand quotas are counted in requests per minute, so calls are spread out rather than sent in bursts.
+REQUESTS_PER_SECOND = float(os.getenv('POSTER_REQUESTS_PER_SECOND', '2'))
+MAX_RETRIES = int(os.getenv('POSTER_MAX_RETRIES', '6'))
+MAX_VARIANTS = int(os.getenv('POSTER_MAX_VARIANTS', '100'))
+POSTER_CACHE = os.getenv('POSTER_CACHE', 'true').lower() == 'true'
+DEFAULT_OPTIONS = {'cfg_scale': 10, 'steps': 30}
+RETRYABLE_ERRORS = {'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+                    'ModelTimeoutException'}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the worker threads: allows `rate` calls per second with bursts of up to `burst`
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def invoke_image_model(prompt, seed=0, cfg_scale=DEFAULT_OPTIONS['cfg_scale'], steps=DEFAULT_OPTIONS['steps'],
+                       rate_limiter=None):
+    """
+    Generate an image with SDXL, retrying with exponential backoff and jitter when Bedrock throttles
+    :param prompt: Text prompt of the image
+    :param seed: Seed of the generation, so variants of a prompt differ
+    :param cfg_scale: How strictly the image follows the prompt
+    :param steps: Number of diffusion steps
+    :param rate_limiter: Optional RateLimiter acquired before every call
+    :return: Returns the unread response body
+    """
+    body = json.dumps({"text_prompts": [{"text": prompt}], "cfg_scale": cfg_scale, "steps": steps, "seed": seed})
+    with tracing.span('invoke_model', model=MODEL_ID, seed=seed, steps=steps):
+        for attempt in range(MAX_RETRIES + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                response_bedrock = client_bedrock.invoke_model(contentType='application/json',
+                                                               accept='application/json', modelId=MODEL_ID, body=body)
+            except ClientError as error:
+                if error.response['Error']['Code'] not in RETRYABLE_ERRORS or attempt == MAX_RETRIES:
+                    raise
+                tracing.record_retry('invoke_model', error.response['Error']['Code'])
+                time.sleep(random.uniform(0, min(20, 0.5 * 2 ** attempt)))
+                continue
+            return response_bedrock['body']
+
 
-# 2. Create client connection with Bedrock and S3 Services – Link
-client_bedrock = boto3.client('bedrock-runtime')
-client_s3 = boto3.client('s3')
+def check_artifact(artifact):
+    """Raise if the model did not finish the image, e.g. because the content filter blocked it."""
+    if artifact.get('finishReason') not in (None, 'SUCCESS'):
+        raise ValueError(f"Image generation finished with {artifact['finishReason']}")
 
 
+def generate_to_s3(key, prompt, seed=0, rate_limiter=None, **options):
+    """
+    Generate an image and stream it to S3: the response body is read in small chunks, decoded incrementally and
+    uploaded in multipart parts, so the whole image is never held in memory
+    :param key: Key of the image
+    :param prompt: Text prompt of the image
+    :param seed: Seed of the generation
+    :param rate_limiter: Optional RateLimiter acquired before every call
+    :param options: cfg_scale and steps
+    :return: Returns the size of the image in bytes
+    """
+    body = invoke_image_model(prompt, seed, rate_limiter=rate_limiter, **options)
+    writer = MultipartWriter(client_s3, POSTER_BUCKET, key, content_type='image/png')
+    with tracing.span('stream_to_s3') as stream_span:
+        try:
+            check_artifact(stream_artifact(body, writer))
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        stream_span.set(bytes=writer.size, parts=len(writer.parts))
+    return writer.size
+
+
+def artifact_key(prompt, seed=0, cfg_scale=DEFAULT_OPTIONS['cfg_scale'], steps=DEFAULT_OPTIONS['steps']):
+    """
+    Derive the S3 key of an image from everything that determines it. SDXL is deterministic for a given model,
+    prompt, seed and parameters, so the key addresses the image's content
+    :param prompt: Text prompt of the image
+    :param seed: Seed of the generation
+    :param cfg_scale: How strictly the image follows the prompt
+    :param steps: Number of diffusion steps
+    :return: Returns the key of the image
+    """
+    params = json.dumps({'model': MODEL_ID, 'prompt': prompt, 'seed': seed, 'cfg_scale': cfg_scale, 'steps': steps},
+                        sort_keys=True)
+    return f"posters/{hashlib.sha256(params.encode('utf-8')).hexdigest()}.png"
+
+
+def artifact_exists(key, bucket=POSTER_BUCKET):
+    """
+    Check with a HEAD request whether an image was already generated
+    :param key: Key of the image
+    :param bucket: Bucket of the image
+    :return: Returns True if the object exists
+    """
+    try:
+        client_s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as error:
+        if error.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def get_or_generate(prompt, seed=0, use_cache=POSTER_CACHE, rate_limiter=None, **options):
+    """
+    Return the key of the image for a prompt and parameters, generating and uploading it only when it is not
+    stored yet
+    :param prompt: Text prompt of the image
+    :param seed: Seed of the generation
+    :param use_cache: Whether to reuse an existing image
+    :param rate_limiter: Optional RateLimiter acquired before every model call
+    :param options: cfg_scale and steps
+    :return: Returns the key and whether it was a cache hit
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    key = artifact_key(prompt, seed, **options)
+    if use_cache:
+        with tracing.span('cache_lookup'):
+            cached = artifact_exists(key)
+            tracing.record_cache(cached, 'poster')
+        if cached:
+            return key, True
+    size = generate_to_s3(key, prompt, seed, rate_limiter=rate_limiter, **options)
+    print(f'Stored {key} ({size} bytes)')
+    return key, False
+
+
+def presigned_url(key, bucket=POSTER_BUCKET):
+    """
+    Generate a pre-signed URL to download an object
+    :param key: Key of the object
+    :param bucket: Bucket of the object
+    :return: Returns the pre-signed URL
+    """
+    return client_s3.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key},
+                                            ExpiresIn=URL_EXPIRES_IN)
+
+
+def parse_variants(event):
+    """
+    Read the variants of a job event: either 'variants' (a list of {'prompt', 'seed'} objects, where the prompt
+    defaults to the event's) or a 'prompt' with 'count' variants and optional 'seeds'
+    :param event: The job event
+    :return: Returns the list of variants
+    """
+    if 'variants' in event:
+        if not isinstance(event['variants'], list) or not all(isinstance(variant, dict)
+                                                              for variant in event['variants']):
+            raise ValueError('variants must be a list of objects')
+        variants = [{'prompt': variant.get('prompt', event.get('prompt')), 'seed': variant.get('seed', number)}
+                    for number, variant in enumerate(event['variants'])]
+    else:
+        if 'seeds' in event and not isinstance(event['seeds'], list):
+            raise ValueError('seeds must be a list of integers')
+        count = event.get('count', 1)
+        if isinstance(count, bool) or not isinstance(count, int):
+            raise ValueError('count must be an integer')
+        seeds = event.get('seeds') or range(min(count, MAX_VARIANTS + 1))
+        variants = [{'prompt': event['prompt'], 'seed': seed} for seed in seeds]
+    if not variants or len(variants) > MAX_VARIANTS:
+        raise ValueError(f'A job needs between 1 and {MAX_VARIANTS} variants')
+    if any(not variant['prompt'] or not isinstance(variant['prompt'], str) for variant in variants):
+        raise ValueError('Every variant needs a prompt')
+    if any(isinstance(variant['seed'], bool) or not isinstance(variant['seed'], int) for variant in variants):
+        raise ValueError('Every seed must be an integer')
+    return variants
+
+
+def parse_options(event):
+    """
+    Read the generation options of a job event shared by its variants
+    :param event: The job event, with optional 'cfg_scale' (a number) and 'steps' (an integer)
+    :return: Returns the options the event sets
+    """
+    options = {name: event[name] for name in DEFAULT_OPTIONS if name in event}
+    cfg_scale, steps = options.get('cfg_scale', 0), options.get('steps', 0)
+    if isinstance(cfg_scale, bool) or not isinstance(cfg_scale, (int, float)):
+        raise ValueError('cfg_scale must be a number')
+    if isinstance(steps, bool) or not isinstance(steps, int):
+        raise ValueError('steps must be an integer')
+    return options
+
+
+def run_variant(job_id, number, variant, options, use_cache, rate_limiter):
+    """
+    Generate one variant, or reuse the stored image of an identical one, and upload it as soon as it is decoded
+    :param job_id: Id of the job
+    :param number: Position of the variant in the job
+    :param variant: The variant's prompt and seed
+    :param options: Generation options shared by the job (cfg_scale, steps)
+    :param use_cache: Whether to reuse existing images
+    :param rate_limiter: The job's RateLimiter
+    :return: Returns the variant's result
+    """
+    result = {'index': number, 'prompt': variant['prompt'], 'seed': variant['seed']}
+    try:
+        with tracing.span('variant', index=number, seed=variant['seed']):
+            key, cached = get_or_generate(variant['prompt'], variant['seed'], use_cache, rate_limiter, **options)
+    except (BotoCoreError, ClientError, KeyError, ValueError) as error:
+        # BotoCoreError covers the transport failures (read timeouts, unreachable endpoints) left after retries.
+        print(f'Variant {number} of job {job_id} failed: {error}')
+        return {**result, 'status': 'failed', 'error': str(error)}
+    return {**result, 'status': 'succeeded', 'key': key, 'cached': cached}
+
+
+def job_handler(event, context):
+    """
+    This function is used to generate many poster variants concurrently. Variants are generated on up to
+    MAX_WORKERS threads behind a shared rate limiter, each image is uploaded as soon as it is ready, and a
+    manifest of the job is stored next to the images
+    :param event: Event with 'variants', or a 'prompt' with 'count' or 'seeds'
+    :param context: Context is the runtime information of the function
+    :return: Returns the job id and the pre-signed URL of every variant
+    """
+    try:
+        variants = parse_variants(event)
+        options = parse_options(event)
+    except (KeyError, ValueError) as error:
+        return {'statusCode': 400, 'body': json.dumps({'error': str(error)})}
+    requests_per_second = event.get('requests_per_second', REQUESTS_PER_SECOND)
+    if isinstance(requests_per_second, bool) or not isinstance(requests_per_second, (int, float)) \
+            or not requests_per_second > 0:
+        return {'statusCode': 400, 'body': json.dumps({'error': 'requests_per_second must be a number above 0'})}
+    use_cache = POSTER_CACHE and not event.get('refresh', False)
+    rate_limiter = RateLimiter(requests_per_second)
+    job_id = uuid.uuid4().hex
+    print(f'Job {job_id}: generating {len(variants)} variants')
+
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(variants))) as executor:
+        futures = [executor.submit(tracing.propagate(run_variant), job_id, number, variant, options, use_cache,
+                                   rate_limiter)
+                   for number, variant in enumerate(variants)]
+        results = sorted((future.result() for future in as_completed(futures)), key=lambda result: result['index'])
+
+    manifest = {'job_id': job_id, 'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'variants': results}
+    with tracing.span('put_manifest'):
+        client_s3.put_object(Bucket=POSTER_BUCKET, Key=f'jobs/{job_id}/manifest.json', Body=json.dumps(manifest),
+                             ContentType='application/json')
+    return {'statusCode': 200, 'body': json.dumps(with_urls(manifest))}
+
+
+def with_urls(manifest):
+    """
+    Add a fresh pre-signed URL to every stored variant of a job manifest
+    :param manifest: The job manifest
+    :return: Returns the manifest with URLs
+    """
+    variants = [{**variant, 'url': presigned_url(variant['key'])} if variant['status'] == 'succeeded' else variant
+                for variant in manifest['variants']]
+    return {**manifest, 'variants': variants}
+
+
+def job_status_handler(event, context):
+    """
+    This function is used to read a finished job again, with URLs that have not expired
+    :param event: Event with the 'job_id'
+    :param context: Context is the runtime information of the function
+    :return: Returns the job manifest with the pre-signed URL of every variant
+    """
+    try:
+        response_s3 = client_s3.get_object(Bucket=POSTER_BUCKET, Key=f"jobs/{event['job_id']}/manifest.json")
+    except ClientError as error:
+        if error.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return {'statusCode': 404, 'body': json.dumps({'error': f"Job {event['job_id']} not found"})}
+    return {'statusCode': 200, 'body': json.dumps(with_urls(json.loads(response_s3['Body'].read())))}
+
+
+@tracing.traced_handler
 def lambda_handler(event, context):
     """
     This function is used to generate a movie poster design using the Bedrock Service. The input data is the prompt
@@ -16,43 +322,22 @@ def lambda_handler(event, context):
     :param context: Context is the runtime information of the function
     :return: Returns the pre_signed URL of the image stored in S3
     """
+    if 'job_id' in event:
+        return job_status_handler(event, context)
+    if 'variants' in event or 'count' in event or 'seeds' in event:
+        return job_handler(event, context)
+
     # 3. Store the input data (prompt) in a variable
     input_prompt = event['prompt']
     print(input_prompt)
 
-    # 4. Create a Request Syntax to access the Bedrock Service
-    response_bedrock = client_bedrock.invoke_model(contentType='application/json', accept='application/json',
-                                                   modelId='stability.stable-diffusion-xl-v1',
-                                                   body=json.dumps(
-                                                       {"text_prompts": [{"text": input_prompt}], "cfg_scale": 10,
-                                                        "steps": 30, "seed": 0}))
-    # print(response_bedrock)
-
-    # 5. 5a. Retrieve from Dictionary, 5b. Convert Streaming Body to Byte using json load 5c. Print
-
-    response_bedrock_byte = json.loads(response_bedrock['body'].read())
-    print(response_bedrock_byte)
-    # 6. 6a. Retrieve data with artifact key, 6b. Import Base 64, 6c. Decode from Base64
-    response_bedrock_base64 = response_bedrock_byte['artifacts'][0]['base64']
-    response_bedrock_final_image = base64.b64decode(response_bedrock_base64)
-    print(response_bedrock_final_image)
-
-    # 7. 7a. Upload the File to S3 using Put Object Method – Link 7b. Import datetime 7c. Generate the image name to
-    # be stored in S3 - Link
-    poster_name = 'posterName' + datetime.datetime.today().strftime('%Y-%M-%D-%M-%S')
-
-    response_s3 = client_s3.put_object(
-        Bucket='movie-poster-design-dfvanegas',
-        Body=response_bedrock_final_image,
-        Key=poster_name)
-
-    # 8. Generate Pre-Signed URL
-    generate_pre_signed_url = client_s3.generate_presigned_url('get_object',
-                                                               Params={
-                                                                   'Bucket': 'movie-poster-design-dfvanegas',
-                                                                   'Key': poster_name
-                                                               },
-                                                               ExpiresIn=3600)
+    # 4. Name the image after a hash of the model, prompt and parameters, and reuse it if it already exists
+    # 5. Otherwise call the Bedrock Service, decode the image from Base64 and upload it to S3
+    poster_name, cached = get_or_generate(input_prompt, use_cache=POSTER_CACHE and not event.get('refresh', False))
+    print(f"{'Cache hit' if cached else 'Generated'}: {poster_name}")
+
+    # 6. Generate Pre-Signed URL
+    generate_pre_signed_url = presigned_url(poster_name)
     print(generate_pre_signed_url)
     return {
         'statusCode': 200,
@@ -1,13 +1,219 @@
 """
 Lambda function to call Bedrock API for text summarization based on reports from manufacturing industry
 """
+import io
 import json
-# 1 Import boto3 and create client connection with bedrock
-import boto3
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-client_bedrock = boto3.client('bedrock-runtime')
+# 1 Create client connection with bedrock; the shared clients are created on first use
+from botocore.exceptions import ClientError
 
+from common import aws, tracing
+from log_filter import prefilter
 
+# invoke_model runs its own throttling retries, so botocore makes a single attempt per call.
+client_bedrock = aws.lazy_client('bedrock-runtime', max_attempts=1)
+client_s3 = aws.lazy_client('s3')
+
+MODEL_ID = 'cohere.command-light-text-v14'
+# Command Light has a 4k token window; ~4 characters per token leaves room for the instructions and output.
+CHUNK_CHARS = int(os.getenv('SUMMARY_CHUNK_CHARS', '12000'))
+MAX_WORKERS = int(os.getenv('SUMMARY_MAX_WORKERS', '8'))
+MAX_RETRIES = int(os.getenv('SUMMARY_MAX_RETRIES', '6'))
+CHUNK_MAX_TOKENS = int(os.getenv('SUMMARY_CHUNK_MAX_TOKENS', '200'))
+REDUCE_MAX_TOKENS = int(os.getenv('SUMMARY_REDUCE_MAX_TOKENS', '300'))
+LOG_PREFILTER = os.getenv('LOG_PREFILTER', 'true').lower() == 'true'
+# Short prompts are instructions or questions rather than logs, and are sent as they are.
+LOG_PREFILTER_MIN_LINES = int(os.getenv('LOG_PREFILTER_MIN_LINES', '50'))
+RETRYABLE_ERRORS = {'ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException',
+                    'ModelTimeoutException'}
+
+CHUNK_PROMPT = 'Summarize the following manufacturing log, highlighting errors, anomalies and downtime:\n\n{text}'
+REDUCE_PROMPT = 'Combine the following summaries of manufacturing logs into a single concise summary:\n\n{text}'
+
+
+def invoke_model(prompt, max_tokens=100):
+    """
+    Invoke the Command model, retrying with exponential backoff and jitter when Bedrock throttles
+    :param prompt: Prompt sent to the model
+    :param max_tokens: Maximum number of tokens to generate
+    :return: Returns the generated text
+    """
+    with tracing.span('invoke_model', model=MODEL_ID, prompt_chars=len(prompt), max_tokens=max_tokens):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                client_bedrock_request = client_bedrock.invoke_model(
+                    contentType='application/json',
+                    accept='application/json',
+                    modelId=MODEL_ID,
+                    body=json.dumps({
+                        "prompt": prompt,
+                        "temperature": 0.9,
+                        "p": 0.75,
+                        "k": 0,
+                        "max_tokens": max_tokens}))
+            except ClientError as error:
+                if error.response['Error']['Code'] not in RETRYABLE_ERRORS or attempt == MAX_RETRIES:
+                    raise
+                tracing.record_retry('invoke_model', error.response['Error']['Code'])
+                time.sleep(random.uniform(0, min(20, 0.5 * 2 ** attempt)))
+                continue
+            tracing.record_usage(client_bedrock_request)
+            return json.loads(client_bedrock_request['body'].read())['generations'][0]['text']
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS):
+    """
+    Split a log into chunks of at most chunk_chars characters, on line boundaries where possible
+    :param text: The log text
+    :param chunk_chars: Maximum size of a chunk
+    :return: Returns the list of chunks
+    """
+    chunks, current, current_size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        if current and current_size + len(line) > chunk_chars:
+            chunks.append(''.join(current))
+            current, current_size = [], 0
+        # A line longer than a chunk is cut, after the lines before it so the order is kept.
+        while len(line) > chunk_chars:
+            chunks.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        current.append(line)
+        current_size += len(line)
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def group_summaries(summaries, chunk_chars=CHUNK_CHARS):
+    """
+    Group summaries into batches whose combined size fits in one reduce call
+    :param summaries: The summaries to group
+    :param chunk_chars: Maximum size of a batch
+    :return: Returns the list of joined batches
+    """
+    return chunk_text('\n\n'.join(summary.strip() + '\n' for summary in summaries), chunk_chars)
+
+
+def iter_documents(event):
+    """
+    Iterate over the log documents of a batch event without reading them whole. The event provides one of:
+    'documents' (a list of strings or {'name', 'text'} objects), 's3_objects' (a list of {'bucket', 'key'})
+    or 'local_paths' (a list of files, the local stand-in for S3)
+    :param event: The batch event
+    :return: Yields (name, lines) tuples, where lines is an iterable of str or bytes
+    """
+    for number, document in enumerate(event.get('documents', [])):
+        if isinstance(document, str):
+            yield f'document-{number}', io.StringIO(document)
+        else:
+            yield document.get('name', f'document-{number}'), io.StringIO(document['text'])
+    for s3_object in event.get('s3_objects', []):
+        response_s3 = client_s3.get_object(Bucket=s3_object['bucket'], Key=s3_object['key'])
+        yield f"s3://{s3_object['bucket']}/{s3_object['key']}", response_s3['Body'].iter_lines(keepends=True)
+    for path in event.get('local_paths', []):
+        with open(path, encoding='utf-8') as log_file:
+            yield path, log_file
+
+
+def prepare_document(name, lines, use_prefilter):
+    """
+    Turn a stream of log lines into the text sent to the model, filtering it first if enabled
+    :param name: Name of the document, for logging
+    :param lines: Iterable of log lines
+    :param use_prefilter: Whether to collapse the log into a digest first
+    :return: Returns the text and the pre-filter stats (None when disabled)
+    """
+    if not use_prefilter:
+        return ''.join(line.decode('utf-8', errors='replace') if isinstance(line, bytes) else line
+                       for line in lines), None
+    with tracing.span('prefilter') as prefilter_span:
+        digest, stats = prefilter(lines)
+        prefilter_span.set(lines=stats['lines'], compression_ratio=stats['compression_ratio'])
+    print(f"{name}: {stats['lines']} lines compressed {stats['compression_ratio']}x")
+    return digest, stats
+
+
+def reduce_summaries(groups, executor):
+    """
+    Reduce the chunk summaries of every document level by level until each has a single summary.
+    Every level of every document is summarized concurrently on the executor
+    :param groups: Dictionary of document name to its list of summaries
+    :param executor: The thread pool used for model calls
+    :return: Returns a dictionary of document name to its summary
+    """
+    while any(len(summaries) > 1 for summaries in groups.values()):
+        tasks = [(name, batch) for name, summaries in groups.items() if len(summaries) > 1
+                 for batch in group_summaries(summaries)]
+        with tracing.span('reduce', calls=len(tasks)):
+            results = executor.map(tracing.propagate(
+                lambda task: invoke_model(REDUCE_PROMPT.format(text=task[1]), REDUCE_MAX_TOKENS)), tasks)
+            reduced = {name: [] for name, _ in tasks}
+            for (name, _), summary in zip(tasks, results):
+                reduced[name].append(summary)
+        groups.update(reduced)
+    return {name: summaries[0] if summaries else '' for name, summaries in groups.items()}
+
+
+def summarize_documents(documents, max_workers=MAX_WORKERS):
+    """
+    Summarize many log documents with map-reduce: chunks are summarized concurrently, then the chunk
+    summaries of each document are reduced hierarchically, and finally the document summaries are reduced
+    into an overall summary
+    :param documents: List of (name, text) tuples
+    :param max_workers: Maximum number of concurrent model calls
+    :return: Returns the per-document summaries and the overall summary
+    """
+    tasks = [(name, chunk) for name, text in documents for chunk in chunk_text(text)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with tracing.span('map', calls=len(tasks)):
+            results = executor.map(tracing.propagate(
+                lambda task: invoke_model(CHUNK_PROMPT.format(text=task[1]), CHUNK_MAX_TOKENS)), tasks)
+            groups = {name: [] for name, _ in documents}
+            for (name, _), summary in zip(tasks, results):
+                groups[name].append(summary)
+        document_summaries = reduce_summaries(groups, executor)
+        overall = reduce_summaries({'overall': list(document_summaries.values())}, executor)['overall']
+    return {
+        'documents': [{'name': name, 'summary': summary} for name, summary in document_summaries.items()],
+        'summary': overall,
+        'chunks': len(tasks),
+    }
+
+
+def batch_handler(event, context):
+    """
+    This function is used to summarize a batch of manufacturing logs using the Bedrock Service
+    :param event: Event with 'documents', 's3_objects' or 'local_paths', and an optional 'max_workers' up to
+        MAX_WORKERS
+    :param context: Context is the runtime information of the function
+    :return: Returns the per-document summaries and the overall summary
+    """
+    max_workers = event.get('max_workers', MAX_WORKERS)
+    if isinstance(max_workers, bool) or not isinstance(max_workers, int):
+        return {'statusCode': 400, 'body': json.dumps('max_workers must be an integer')}
+    # The caller may lower the concurrency, never raise it past what the function is sized for.
+    max_workers = max(1, min(max_workers, MAX_WORKERS))
+    use_prefilter = event.get('prefilter', LOG_PREFILTER)
+    documents, stats = [], {}
+    for name, lines in iter_documents(event):
+        text, stats[name] = prepare_document(name, lines, use_prefilter)
+        documents.append((name, text))
+    print(f'Summarizing {len(documents)} documents')
+    result = summarize_documents(documents, max_workers)
+    if use_prefilter:
+        for document in result['documents']:
+            document['prefilter'] = stats[document['name']]
+    return {
+        'statusCode': 200,
+        'body': json.dumps(result)
+    }
+
+
+@tracing.traced_handler
 def lambda_handler(event, context):
     """
     This function is used to generate a text summary using the Bedrock Service. The input data is the prompt
@@ -15,33 +221,20 @@ def lambda_handler(event, context):
     :param context: Context is the runtime information of the function
     :return: Returns the text summary
     """
-    # 2 a. Store the input in a variable, b. print the event
+    if 'prompt' not in event:
+        return batch_handler(event, context)
+
+    # 2 a. Store the input in a variable, b. collapse large logs into a digest before sending them
     input_prompt = event['prompt']
-    print(input_prompt)
+    if event.get('prefilter', LOG_PREFILTER) and input_prompt.count('\n') + 1 >= LOG_PREFILTER_MIN_LINES:
+        input_prompt, _ = prepare_document('prompt', io.StringIO(input_prompt), True)
+    # Logs run to megabytes; the size is enough in the function's own logs.
+    print(f'Prompt: {len(input_prompt)} characters')
 
     # 3. Create  Request Syntax - Get details from console & body should be json object - use   json.dumps for body
-
-    client_bedrock_request = client_bedrock.invoke_model(
-        contentType='application/json',
-        accept='application/json',
-        modelId='cohere.command-light-text-v14',
-        body=json.dumps({
-            "prompt": input_prompt,
-            "temperature": 0.9,
-            "p": 0.75,
-            "k": 0,
-            "max_tokens": 100}))
-    # print(client_bedrock_request)
-
     # 4. Convert Streaming Body to Byte(.read method) and then Byte to String using json.loads#
-    client_bedrock_byte = client_bedrock_request['body'].read()
-
-    # 5 a. Print the event and type , b. Store the input in a variable
-    client_bedrock_string = json.loads(client_bedrock_byte)
-    # print(client_bedrock_string)
-
-    # 6. Update the 'return' by changing the 'body'
-    client_final_response = client_bedrock_string['generations'][0]['text']
+    # 5. Retrieve the generated text, retrying if Bedrock throttles the request
+    client_final_response = invoke_model(input_prompt, max_tokens=100)
     print(client_final_response)
 
     return {
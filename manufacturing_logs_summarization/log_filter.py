@@ -0,0 +1,207 @@
+"""
+Streaming pre-filter for manufacturing logs: drops noise levels, collapses repeated lines into templates with
+counts (Drain-style template mining) and ranks anomalous lines, in bounded memory
+"""
+import itertools
+import math
+import os
+import re
+from collections import OrderedDict
+
+DROP_LEVELS = {level.strip().upper() for level in os.getenv('LOG_DROP_LEVELS', 'TRACE,DEBUG').split(',') if level}
+MAX_TEMPLATES = int(os.getenv('LOG_MAX_TEMPLATES', '5000'))
+MAX_OUTPUT_TEMPLATES = int(os.getenv('LOG_MAX_OUTPUT_TEMPLATES', '200'))
+MAX_ANOMALIES = int(os.getenv('LOG_MAX_ANOMALIES', '20'))
+SIMILARITY_THRESHOLD = float(os.getenv('LOG_SIMILARITY_THRESHOLD', '0.5'))
+
+WILDCARD = '<*>'
+LEVEL_PATTERN = re.compile(r'\b(TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|SEVERE|CRITICAL|FATAL|ALARM)\b',
+                           re.IGNORECASE)
+LEVEL_WEIGHTS = {'TRACE': 0.1, 'DEBUG': 0.2, 'INFO': 1, 'NOTICE': 1, 'WARN': 3, 'WARNING': 3, 'ERROR': 6,
+                 'SEVERE': 6, 'ALARM': 6, 'CRITICAL': 8, 'FATAL': 10}
+# Tokens that are almost always variables: numbers, hex IDs, IPs, UUIDs, dates, times and key=number pairs.
+VARIABLE_PATTERN = re.compile(
+    r'^(?:[-+]?\d+(?:[.,:]\d+)*%?|0x[0-9a-f]+|[0-9a-f]{8,}|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?'
+    r'|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d{4}-\d{2}-\d{2}[T ]?[\d:.]*Z?'
+    r'|[\w.]+=[-+]?[\d.]+\w*)$',
+    re.IGNORECASE,
+)
+
+
+class LogTemplate:
+    """A cluster of log lines sharing the same template."""
+
+    __slots__ = ('tokens', 'count', 'level', 'sample', 'first_seen')
+
+    def __init__(self, tokens, level, sample, first_seen):
+        self.tokens = tokens
+        self.count = 1
+        self.level = level
+        self.sample = sample
+        self.first_seen = first_seen
+
+    def similarity(self, tokens):
+        """Fraction of the constant positions of the template that the tokens match, from 0 to 1."""
+        constants = matches = 0
+        for template_token, token in zip(self.tokens, tokens):
+            if template_token != WILDCARD:
+                constants += 1
+                matches += template_token == token
+        return matches / constants if constants else 1.0
+
+    def merge(self, tokens):
+        """Turn the positions where the tokens differ into wildcards."""
+        self.tokens = [template_token if template_token == token else WILDCARD
+                       for template_token, token in zip(self.tokens, tokens)]
+        self.count += 1
+
+    @property
+    def text(self):
+        """The template as text."""
+        return ' '.join(self.tokens)
+
+
+class LogFilter:
+    """
+    Drain-style template miner. Lines are tokenized, obvious variables are masked, and each line joins the
+    most similar template with the same length and level (or first constant token, for lines without a level),
+    or starts a new one. Templates are kept in
+    LRU order and at most max_templates are held, so memory is bounded whatever the input size
+    """
+
+    def __init__(self, drop_levels=None, max_templates=MAX_TEMPLATES, similarity_threshold=SIMILARITY_THRESHOLD):
+        self.drop_levels = DROP_LEVELS if drop_levels is None else {level.upper() for level in drop_levels}
+        self.max_templates = max_templates
+        self.similarity_threshold = similarity_threshold
+        self.groups = {}
+        self.templates = OrderedDict()
+        self.lines = 0
+        self.dropped_lines = 0
+        self.evicted_lines = 0
+        self.input_chars = 0
+
+    @staticmethod
+    def tokenize(line):
+        """Split a line into tokens, masking the ones that look like variables."""
+        return [WILDCARD if VARIABLE_PATTERN.match(token) else token for token in line.split()]
+
+    def add(self, line):
+        """Add a single log line."""
+        self.lines += 1
+        self.input_chars += len(line)
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            return
+        level_match = LEVEL_PATTERN.search(line)
+        level = level_match.group(1).upper() if level_match else 'INFO'
+        if level in self.drop_levels:
+            self.dropped_lines += 1
+            return
+
+        tokens = self.tokenize(line)
+        # Lines usually start with a timestamp, masked to a wildcard, so the level (or the first constant token)
+        # tells the groups apart; keying on the level also keeps errors out of the templates of routine lines.
+        if level_match:
+            anchor = level
+        else:
+            anchor = next((token for token in tokens if token != WILDCARD), WILDCARD)
+        key = (len(tokens), anchor)
+        group = self.groups.setdefault(key, [])
+        best, best_score = None, self.similarity_threshold
+        for template in group:
+            score = template.similarity(tokens)
+            if score >= best_score:
+                best, best_score = template, score
+        if best is not None:
+            best.merge(tokens)
+            self.templates.move_to_end(id(best))
+            return
+
+        template = LogTemplate(tokens, level, line, self.lines)
+        group.append(template)
+        self.templates[id(template)] = (key, template)
+        if len(self.templates) > self.max_templates:
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently matched template."""
+        _, (key, template) = self.templates.popitem(last=False)
+        self.groups[key].remove(template)
+        if not self.groups[key]:
+            del self.groups[key]
+        self.evicted_lines += template.count
+
+    def process(self, lines):
+        """
+        Consume an iterable of lines (str or bytes), e.g. a file or a StreamingBody.iter_lines()
+        :param lines: The log lines
+        :return: Returns the filter itself
+        """
+        for line in lines:
+            self.add(line.decode('utf-8', errors='replace') if isinstance(line, bytes) else line)
+        return self
+
+    def anomaly_score(self, template, total):
+        """Rank rare, severe templates first: level weight times the rarity of the template."""
+        return LEVEL_WEIGHTS.get(template.level, 1) * math.log(1 + total / template.count)
+
+    def digest(self, max_templates=MAX_OUTPUT_TEMPLATES, max_anomalies=MAX_ANOMALIES):
+        """
+        Render the filtered log: the most anomalous lines first, then the retained templates in order of first
+        appearance with their counts. Lines seen once are kept verbatim
+        :param max_templates: Maximum number of templates rendered
+        :param max_anomalies: Maximum number of anomalous lines listed
+        :return: Returns the digest text
+        """
+        templates = [template for _, template in self.templates.values()]
+        total = sum(template.count for template in templates) or 1
+        ranked = sorted(templates, key=lambda template: self.anomaly_score(template, total), reverse=True)
+
+        anomalies = [template for template in ranked if LEVEL_WEIGHTS.get(template.level, 1) > 1][:max_anomalies]
+        # Keep the most anomalous templates and the most frequent ones, which dominate the log's volume.
+        by_count = sorted(templates, key=lambda template: template.count, reverse=True)
+        retained = {}
+        for template in itertools.chain(ranked[:max_templates // 2], by_count, ranked):
+            if len(retained) >= max_templates:
+                break
+            retained.setdefault(id(template), template)
+        retained = sorted(retained.values(), key=lambda template: template.first_seen)
+
+        lines = [f'Log digest: {self.lines} lines, {len(templates)} templates, '
+                 f'{self.dropped_lines} {"/".join(sorted(self.drop_levels))} lines dropped.']
+        if anomalies:
+            lines.append('Most anomalous lines:')
+            lines.extend(f'- [x{template.count}] {template.sample}' for template in anomalies)
+        lines.append('Log:')
+        for template in retained:
+            lines.append(template.sample if template.count == 1 else f'[x{template.count}] {template.text}')
+        if len(templates) > len(retained):
+            lines.append(f'... {len(templates) - len(retained)} more templates omitted.')
+        return '\n'.join(lines)
+
+    def stats(self, digest):
+        """
+        Report how much the digest compresses the input
+        :param digest: The digest produced by this filter
+        :return: Returns the line counts and the compression ratio
+        """
+        return {
+            'lines': self.lines,
+            'dropped_lines': self.dropped_lines,
+            'evicted_lines': self.evicted_lines,
+            'templates': len(self.templates),
+            'input_chars': self.input_chars,
+            'output_chars': len(digest),
+            'compression_ratio': round(self.input_chars / max(1, len(digest)), 2),
+        }
+
+
+def prefilter(lines, **kwargs):
+    """
+    Filter a log in one pass
+    :param lines: An iterable of log lines
+    :return: Returns the digest text and its stats
+    """
+    log_filter = LogFilter(**kwargs).process(lines)
+    digest = log_filter.digest()
+    return digest, log_filter.stats(digest)
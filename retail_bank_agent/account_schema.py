@@ -0,0 +1,37 @@
+"""Fields of an account as declared in openapi.yaml, and the projection and encoder derived from them."""
+from decimal import Decimal
+
+# Keep in sync with the AccountStatus schema in openapi.yaml.
+ACCOUNT_FIELDS = {
+    'AccountStatus': str,
+    'AccountID': int,
+    'Reason': str,
+    'AccountName': str,
+}
+
+# Placeholders keep the projection valid even if a field name is a DynamoDB reserved word.
+EXPRESSION_ATTRIBUTE_NAMES = {f'#f{number}': field for number, field in enumerate(ACCOUNT_FIELDS)}
+PROJECTION_EXPRESSION = ', '.join(EXPRESSION_ATTRIBUTE_NAMES)
+PROJECTION = {'ProjectionExpression': PROJECTION_EXPRESSION, 'ExpressionAttributeNames': EXPRESSION_ATTRIBUTE_NAMES}
+
+
+def encode_account(item):
+    """
+    Convert a DynamoDB item into the plain dict of the schema, in one pass over the declared fields. Decimals
+    become int or str as the schema says, so the result serializes with the C JSON encoder and no default hook.
+    Fields the item does not have are left out, and attributes outside the schema are dropped.
+    """
+    account = {}
+    for field, field_type in ACCOUNT_FIELDS.items():
+        value = item.get(field)
+        if value is None:
+            continue
+        if field_type is int:
+            account[field] = int(value)
+        elif isinstance(value, str):
+            account[field] = value
+        elif isinstance(value, Decimal) and value == value.to_integral_value():
+            account[field] = str(int(value))
+        else:
+            account[field] = str(value)
+    return account
@@ -1,25 +1,77 @@
 """Lambda function responsible to retrieve the data from DynamoDB and return the response to the chatbot."""
 import json
 import os
-from decimal import Decimal
+import random
+import re
+import time
+from collections import OrderedDict
 
-import boto3
+from account_schema import PROJECTION, encode_account
+from common import aws, tracing
 
 DYNAMODB_TABLE = os.getenv('DYNAMODB_TABLE', 'customerAccountStatus')
-dynamo_db = boto3.resource('dynamodb')
+# Point the function at DynamoDB Local or another stand-in, e.g. http://localhost:8000.
+DYNAMODB_ENDPOINT_URL = os.getenv('DYNAMODB_ENDPOINT_URL') or None
+ACCOUNT_CACHE_TTL_SECONDS = float(os.getenv('ACCOUNT_CACHE_TTL_SECONDS', '30'))
+ACCOUNT_CACHE_MAX_ENTRIES = int(os.getenv('ACCOUNT_CACHE_MAX_ENTRIES', '1024'))
+BATCH_MAX_RETRIES = int(os.getenv('BATCH_MAX_RETRIES', '5'))
+# BatchGetItem reads at most 100 keys per call.
+BATCH_SIZE = 100
+MAX_ACCOUNTS = int(os.getenv('MAX_ACCOUNTS', '100'))
 
+# The resource and table are created on first use and reused by every warm invocation of the container.
+dynamo_db = aws.lazy_resource('dynamodb', endpoint_url=DYNAMODB_ENDPOINT_URL)
+table = None
 
-class DecimalEncoder(json.JSONEncoder):
-    """Helper class to convert a DynamoDB item to JSON."""
-    def default(self, obj):
-        """Convert decimal to float."""
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+
+def get_table():
+    """Return the container's Table object, creating it on first use."""
+    global table
+    if table is None:
+        table = dynamo_db.Table(DYNAMODB_TABLE)
+    return table
+
+
+class AccountCache:
+    """Helper class to keep hot accounts for a few seconds in the container, so repeated lookups skip DynamoDB."""
+
+    def __init__(self, ttl_seconds=ACCOUNT_CACHE_TTL_SECONDS, max_entries=ACCOUNT_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, account_id):
+        """Return the cached item of an account, or None."""
+        entry = self._entries.get(account_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl_seconds:
+            del self._entries[account_id]
+            return None
+        self._entries.move_to_end(account_id)
+        return entry[0]
+
+    def put(self, account_id, item):
+        """Cache the item of an account, evicting the least recently used ones."""
+        self._entries[account_id] = (item, time.monotonic())
+        self._entries.move_to_end(account_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry."""
+        self._entries.clear()
+
+
+account_cache = AccountCache()
 
 
 def return_response(event, status_code, body):
-    """Return the response with the status code and body."""
+    """
+    Return the response with the status code and body. The body must only hold JSON types (accounts are converted
+    by encode_account), so it is serialized by the C encoder in a single pass. The agent contract requires the
+    body as a JSON string inside the response.
+    """
     return {
         "messageVersion": "1.0",
         "response": {
@@ -29,7 +81,7 @@ def return_response(event, status_code, body):
             "httpStatusCode": status_code,
             "responseBody": {
                 "application/json": {
-                    "body": json.dumps(body, cls=DecimalEncoder)
+                    "body": json.dumps(body)
                 }
             }
         },
@@ -37,14 +89,97 @@ def return_response(event, status_code, body):
     }
 
 
+def get_parameter(event, name):
+    """Return the value of a parameter of the agent's request, by name."""
+    for parameter in event.get('parameters', []):
+        if parameter['name'] == name:
+            return parameter['value']
+    raise KeyError(name)
+
+
+def parse_account_numbers(value):
+    """Parse a list of account numbers sent as "1, 2, 3" or "[1, 2, 3]", dropping duplicates."""
+    return list(dict.fromkeys(int(number) for number in re.findall(r'[^\s,\[\]"\']+', value)))
+
+
+def get_account(account_id):
+    """Get one encoded account, from the container cache or DynamoDB, reading only the fields of the schema."""
+    item = account_cache.get(account_id)
+    tracing.record_cache(item is not None, 'account')
+    if item is None:
+        with tracing.span('get_item'):
+            item = get_table().get_item(Key={'AccountID': account_id}, **PROJECTION).get('Item')
+        if item:
+            item = encode_account(item)
+            account_cache.put(account_id, item)
+    return item
+
+
+def get_accounts(account_ids):
+    """
+    Get many encoded accounts with BatchGetItem, reading only the fields of the schema and serving hot accounts
+    from the container cache. Keys that DynamoDB leaves unprocessed (throttling or the 16 MB response limit) are
+    retried with exponential backoff. Returns a dictionary of account ID to item; accounts that do not exist are
+    missing from it.
+    """
+    items = {}
+    missing = []
+    for account_id in account_ids:
+        item = account_cache.get(account_id)
+        if item is None:
+            missing.append(account_id)
+        else:
+            items[account_id] = item
+    tracing.record_cache(True, 'account', len(items))
+    tracing.record_cache(False, 'account', len(missing))
+
+    for start in range(0, len(missing), BATCH_SIZE):
+        keys = [{'AccountID': account_id} for account_id in missing[start:start + BATCH_SIZE]]
+        request = {DYNAMODB_TABLE: {'Keys': keys, **PROJECTION}}
+        for attempt in range(BATCH_MAX_RETRIES + 1):
+            with tracing.span('batch_get_item', keys=len(request[DYNAMODB_TABLE]['Keys'])):
+                response = dynamo_db.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(DYNAMODB_TABLE, []):
+                item = encode_account(item)
+                account_id = item['AccountID']
+                items[account_id] = item
+                account_cache.put(account_id, item)
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+            if attempt == BATCH_MAX_RETRIES:
+                raise RuntimeError(f'DynamoDB left {len(request[DYNAMODB_TABLE]["Keys"])} keys unprocessed')
+            tracing.record_retry('batch_get_item', 'UnprocessedKeys')
+            time.sleep(random.uniform(0, min(2, 0.05 * 2 ** attempt)))
+    return items
+
+
+def account_statuses_handler(event):
+    """Return the status of several accounts at once, served with BatchGetItem."""
+    try:
+        account_ids = parse_account_numbers(get_parameter(event, 'accountNumbers'))
+    except (KeyError, ValueError):
+        return return_response(event, 400, 'accountNumbers must be a list of account numbers.')
+    if not account_ids or len(account_ids) > MAX_ACCOUNTS:
+        return return_response(event, 400, f'Provide between 1 and {MAX_ACCOUNTS} account numbers.')
+
+    items = get_accounts(account_ids)
+    return return_response(event, 200, {
+        'accounts': [items[account_id] for account_id in account_ids if account_id in items],
+        'notFound': [account_id for account_id in account_ids if account_id not in items],
+    })
+
+
+@tracing.traced_handler
 def lambda_handler(event, context):
     """
     Lambda function responsible to get item from DynamoDB based in Account ID and return the response to the chatbot.
     """
+    if event['apiPath'] == '/getAccountStatuses':
+        return account_statuses_handler(event)
+
     account_id = event['parameters'][0]['value']
-    table = dynamo_db.Table(DYNAMODB_TABLE)
-    response = table.get_item(Key={'AccountID': int(account_id)})
-    item = response.get('Item', {})
+    item = get_account(int(account_id))
 
     if not item:
         return return_response(event, 404, 'Account not found.')
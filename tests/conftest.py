@@ -0,0 +1,73 @@
+"""Shared fixtures of the tests: the example folders on sys.path, caches in a temporary directory and the
+AWS stand-ins of benchmarks/fakes.py, so nothing reaches AWS.
+
+Run them from the repository root with `python -m pytest`.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# The examples read these when they are first imported, so they are set before any test imports one.
+_CACHE_DIR = tempfile.mkdtemp(prefix="tests-")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+os.environ["INDEX_CACHE_DIR"] = os.path.join(_CACHE_DIR, "index_cache")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_CACHE_DIR, "embeddings.sqlite3")
+os.environ["SESSION_DB_PATH"] = os.path.join(_CACHE_DIR, "sessions.sqlite3")
+
+from benchmarks import load_module, use_app  # noqa: E402
+from benchmarks.fakes import FakeBedrockRuntime, LatencyProfile  # noqa: E402
+
+
+@pytest.fixture
+def latency():
+    """Stand-ins that answer at once."""
+    return LatencyProfile(scale=0)
+
+
+@pytest.fixture
+def bedrock(latency):
+    """The bedrock-runtime stand-in."""
+    return FakeBedrockRuntime(latency)
+
+
+@pytest.fixture
+def rag_backend(bedrock, tmp_path, monkeypatch):
+    """The RAG_chatbot_HR backend module, on the stand-in model, with its caches in the test's directory."""
+    pytest.importorskip("faiss")
+    pytest.importorskip("langchain_aws")
+    use_app("RAG_chatbot_HR")
+    import rag_backend
+
+    monkeypatch.setattr(rag_backend, "INDEX_CACHE_DIR", str(tmp_path / "index_cache"))
+    monkeypatch.setattr(rag_backend, "EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+    rag_backend.MODEL_POOL.set_bedrock_client(bedrock)
+    yield rag_backend
+    rag_backend.MODEL_POOL.clear()
+
+
+@pytest.fixture
+def lambda_module():
+    """Load the lambda_function of an example folder, with its folder importable."""
+    pytest.importorskip("botocore")
+
+    def load(folder):
+        use_app(folder)
+        return load_module(folder, "lambda_function")
+
+    return load
+
+
+@pytest.fixture
+def aws_client():
+    """Serve stand-ins for the shared clients of the Lambdas, and drop them after the test."""
+    from common import aws
+
+    yield aws.set_client
+    aws.reset()
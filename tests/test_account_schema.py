@@ -0,0 +1,60 @@
+"""Tests of the account schema of the retail bank agent: its projection, its encoder and openapi.yaml."""
+
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+from benchmarks import REPO_ROOT, use_app
+
+JSON_TYPES = {"string": str, "integer": int}
+
+
+@pytest.fixture
+def account_schema():
+    use_app("retail_bank_agent")
+    import account_schema
+
+    return account_schema
+
+
+def schema_properties():
+    """The account properties of each response of openapi.yaml."""
+    yaml = pytest.importorskip("yaml")
+    with open(os.path.join(REPO_ROOT, "retail_bank_agent", "openapi.yaml"), encoding="utf-8") as spec_file:
+        spec = yaml.safe_load(spec_file)
+    single = spec["paths"]["/getAccountStatus/{accountNumber}"]["get"]["responses"]["200"]
+    batch = spec["paths"]["/getAccountStatuses"]["get"]["responses"]["200"]
+    return [
+        single["content"]["application/json"]["schema"]["properties"],
+        batch["content"]["application/json"]["schema"]["properties"]["accounts"]["items"]["properties"],
+    ]
+
+
+def test_the_fields_match_the_openapi_schema(account_schema):
+    for properties in schema_properties():
+        assert {name: JSON_TYPES[field["type"]] for name, field in properties.items()} == account_schema.ACCOUNT_FIELDS
+
+
+def test_the_projection_reads_every_field_through_a_placeholder(account_schema):
+    names = account_schema.PROJECTION["ExpressionAttributeNames"]
+    placeholders = account_schema.PROJECTION["ProjectionExpression"].split(", ")
+
+    assert sorted(placeholders) == sorted(names)
+    assert all(placeholder.startswith("#") for placeholder in placeholders)
+    assert [names[placeholder] for placeholder in placeholders] == list(account_schema.ACCOUNT_FIELDS)
+
+
+def test_an_item_is_encoded_to_the_json_types_of_the_schema(account_schema):
+    item = {"AccountID": Decimal("1042"), "AccountStatus": "Active", "AccountName": Decimal("7"),
+            "Reason": Decimal("2.50"), "Balance": Decimal("99.10")}
+
+    account = account_schema.encode_account(item)
+
+    assert account == {"AccountStatus": "Active", "AccountID": 1042, "Reason": "2.50", "AccountName": "7"}
+    assert json.loads(json.dumps(account)) == account
+
+
+def test_missing_fields_are_left_out(account_schema):
+    assert account_schema.encode_account({"AccountID": Decimal("7"), "Reason": None}) == {"AccountID": 7}
@@ -0,0 +1,158 @@
+"""Tests of the admission control, timeouts and per-session ordering of the chatbot's ASGI service."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+
+class StubBackend:
+    """Answers a turn once `release` is set, or at once when it is None."""
+
+    def __init__(self, session_id, release=None):
+        self.session_id = session_id
+        self.release = release
+
+    async def aget_response(self, message):
+        if self.release is not None:
+            await self.release.wait()
+        return f"answer to {message}"
+
+
+@pytest.fixture
+def asgi_app(rag_backend):
+    import asgi_app
+
+    return asgi_app
+
+
+@pytest.fixture
+def make_service(asgi_app, monkeypatch):
+    """Build a service answered by StubBackend, and the event the turns of the `blocked` sessions wait on."""
+
+    def make(blocked=(), **limits):
+        service = asgi_app.ChatService(index_path=None, **limits)
+        release = asyncio.Event()
+        monkeypatch.setattr(service, "backend", lambda session_id, use_rag: StubBackend(
+            session_id, release if session_id in blocked else None))
+        return service, release
+
+    return make
+
+
+async def post(service, path, payload):
+    """Send one request to the service and return its status and JSON body."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await service({"type": "http", "method": "POST", "path": path}, receive, send)
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return messages[0]["status"], json.loads(body)
+
+
+async def settle():
+    """Let the requests started so far run up to where they wait."""
+    await asyncio.sleep(0.01)
+
+
+def test_a_request_finding_no_free_slot_is_refused_with_503(make_service):
+    service, release = make_service(blocked={"a"}, max_concurrency=1, queue_timeout=0.05, request_timeout=5)
+
+    async def scenario():
+        first = asyncio.create_task(post(service, "/chat", {"session_id": "a", "message": "hi"}))
+        await settle()
+        refused = await post(service, "/chat", {"session_id": "b", "message": "hi"})
+        release.set()
+        return await first, refused
+
+    first, refused = asyncio.run(scenario())
+
+    assert first == (200, {"session_id": "a", "answer": "answer to hi"})
+    assert refused[0] == 503 and "capacity" in refused[1]["error"]
+    assert service.stats["rejected"] == 1 and service.stats["in_flight"] == 0
+
+
+def test_a_request_running_past_the_timeout_gets_504(make_service):
+    service, release = make_service(blocked={"a"}, max_concurrency=1, queue_timeout=1, request_timeout=0.05)
+
+    status, body = asyncio.run(post(service, "/chat", {"session_id": "a", "message": "hi"}))
+
+    assert status == 504 and "No answer" in body["error"]
+    assert service.stats["timed_out"] == 1 and service.stats["in_flight"] == 0
+
+
+def test_a_turn_waiting_for_its_session_holds_no_slot(make_service):
+    service, release = make_service(blocked={"a"}, max_concurrency=2, queue_timeout=0.05, request_timeout=5)
+
+    async def scenario():
+        turns = [asyncio.create_task(post(service, "/chat", {"session_id": "a", "message": f"turn {number}"}))
+                 for number in (1, 2)]
+        await settle()
+        in_flight = service.stats["in_flight"]
+        other_session = await post(service, "/chat", {"session_id": "b", "message": "hi"})
+        release.set()
+        return in_flight, other_session, await asyncio.gather(*turns)
+
+    in_flight, other_session, turns = asyncio.run(scenario())
+
+    assert in_flight == 1
+    assert other_session[0] == 200
+    assert turns == [(200, {"session_id": "a", "answer": f"answer to turn {number}"}) for number in (1, 2)]
+    assert service.stats["rejected"] == 0 and service.stats["served"] == 3
+
+
+def test_a_turn_stuck_behind_its_session_gets_504(make_service):
+    service, _ = make_service(max_concurrency=1, queue_timeout=1, request_timeout=0.05)
+
+    async def scenario():
+        lock = service.session_lock("a")
+        async with lock:
+            return await post(service, "/chat", {"session_id": "a", "message": "hi"})
+
+    status, body = asyncio.run(scenario())
+
+    assert status == 504 and "earlier turn" in body["error"]
+    assert service.stats["in_flight"] == 0 and service.stats["timed_out"] == 1
+
+
+def test_a_backend_that_cannot_be_built_gets_a_json_500(asgi_app, monkeypatch):
+    service = asgi_app.ChatService(index_path=None)
+
+    def backend(session_id, use_rag):
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(service, "backend", backend)
+
+    status, body = asyncio.run(post(service, "/chat", {"message": "hi"}))
+
+    assert (status, body) == (500, {"error": "RuntimeError: no credentials"})
+    assert service.stats["failed"] == 1 and service.stats["in_flight"] == 0
+
+
+def test_concurrent_first_requests_start_the_service_once(asgi_app, monkeypatch):
+    service = asgi_app.ChatService(index_path="handbook.pdf", response_cache=False)
+    loads = []
+
+    def load_index():
+        loads.append(service.index_path)
+        time.sleep(0.05)
+        return "retriever", "v1"
+
+    monkeypatch.setattr(service, "load_index", load_index)
+    monkeypatch.setattr(service, "backend", lambda session_id, use_rag: StubBackend(session_id))
+
+    async def scenario():
+        return await asyncio.gather(*(post(service, "/chat", {"session_id": f"s{number}", "message": "hi"})
+                                      for number in range(5)))
+
+    responses = asyncio.run(scenario())
+
+    assert loads == ["handbook.pdf"]
+    assert [status for status, _ in responses] == [200] * 5
+    assert service.started and service.index_version == "v1"
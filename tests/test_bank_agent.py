@@ -0,0 +1,74 @@
+"""Tests of the batched account lookup of the retail bank agent Lambda."""
+
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeDynamoDB, seed_accounts
+
+
+def statuses_event(account_numbers):
+    return {"actionGroup": "accountStatus", "httpMethod": "GET", "apiPath": "/getAccountStatuses",
+            "parameters": [{"name": "accountNumbers", "value": account_numbers}]}
+
+
+def body(response):
+    return json.loads(response["response"]["responseBody"]["application/json"]["body"])
+
+
+@pytest.fixture
+def bank(lambda_module, monkeypatch):
+    module = lambda_module("retail_bank_agent")
+    monkeypatch.setattr(module, "table", None)
+    module.account_cache.clear()
+    yield module
+    module.account_cache.clear()
+
+
+@pytest.fixture
+def sleeps(bank, monkeypatch):
+    """The backoff delays of the Lambda, which are recorded instead of slept."""
+    sleeps = []
+    monkeypatch.setattr(bank.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def use_dynamodb(bank, aws_client, latency, unprocessed_rate=0.0, accounts=300):
+    dynamodb = FakeDynamoDB(latency, unprocessed_rate, seed=3)
+    seed_accounts(dynamodb.create_table(bank.DYNAMODB_TABLE, "AccountID"), accounts)
+    aws_client("dynamodb", dynamodb)
+    return dynamodb
+
+
+def test_unprocessed_keys_are_retried_until_every_account_is_read(bank, sleeps, aws_client, latency, monkeypatch):
+    monkeypatch.setattr(bank, "MAX_ACCOUNTS", 300)
+    dynamodb = use_dynamodb(bank, aws_client, latency, unprocessed_rate=0.25)
+    ids = list(range(1, 251))
+
+    response = bank.lambda_handler(statuses_event(", ".join(map(str, ids)) + ", 9999"), None)
+
+    assert response["response"]["httpStatusCode"] == 200
+    result = body(response)
+    assert [account["AccountID"] for account in result["accounts"]] == ids
+    assert result["notFound"] == [9999]
+    assert dynamodb.calls["batch_get_item"] > 3
+    assert len(sleeps) == dynamodb.calls["batch_get_item"] - 3
+    assert "Metric0" not in result["accounts"][0]
+
+
+def test_keys_left_unprocessed_after_every_retry_fail_the_lookup(bank, sleeps, aws_client, latency):
+    use_dynamodb(bank, aws_client, latency, unprocessed_rate=1.0)
+
+    with pytest.raises(RuntimeError, match="unprocessed"):
+        bank.lambda_handler(statuses_event("1, 2, 3"), None)
+    assert len(sleeps) == bank.BATCH_MAX_RETRIES
+
+
+def test_cached_accounts_skip_dynamodb(bank, aws_client, latency):
+    dynamodb = use_dynamodb(bank, aws_client, latency)
+    bank.lambda_handler(statuses_event("[1, 2]"), None)
+
+    result = body(bank.lambda_handler(statuses_event("2, 1, 2"), None))
+
+    assert [account["AccountID"] for account in result["accounts"]] == [2, 1]
+    assert dynamodb.calls["batch_get_item"] == 1
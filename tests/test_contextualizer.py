@@ -0,0 +1,97 @@
+"""Tests of the contextualizer of RAG_chatbot_HR, which only rewrites the questions that need the chat history."""
+
+import pytest
+
+HISTORY = [("human", "How many days of paid leave do I get?"), ("ai", "Twenty days a year.")]
+
+
+@pytest.fixture
+def queries():
+    """The queries the contextualizer retrieved with."""
+    return []
+
+
+@pytest.fixture
+def make_contextualizer(rag_backend, queries):
+    from langchain_core.runnables import RunnableLambda
+
+    def retrieve(query):
+        queries.append(query)
+        return []
+
+    def make(**options):
+        return rag_backend.Contextualizer(rag_backend.MODEL_POOL.get_chat_model(), RunnableLambda(retrieve), **options)
+
+    return make
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How many days of paid leave do new employees get?", False),
+    ("Which documents describe the travel expense policy?", False),
+    ("What about managers?", True),
+    ("And for part-time staff?", True),
+    ("Does it also apply to contractors?", True),
+    ("Why?", True),
+])
+def test_needs_rewrite_flags_short_and_anaphoric_questions(rag_backend, question, expected):
+    assert rag_backend.needs_rewrite(question) is expected
+
+
+def test_a_standalone_follow_up_skips_the_rewrite(make_contextualizer, queries, bedrock):
+    contextualizer = make_contextualizer(skip_standalone=True)
+    question = "Which documents describe the travel expense policy?"
+
+    contextualizer.contextualize().invoke({"input": question, "chat_history": HISTORY})
+
+    assert queries == [question]
+    assert "chat" not in bedrock.calls
+    assert contextualizer.metrics.counts == {"no_history": 0, "standalone": 1, "rewritten": 0}
+
+
+def test_an_anaphoric_follow_up_is_rewritten(make_contextualizer, queries, bedrock):
+    contextualizer = make_contextualizer(skip_standalone=True)
+
+    contextualizer.contextualize().invoke({"input": "What about managers?", "chat_history": HISTORY})
+
+    assert bedrock.calls["chat"] == 1
+    assert len(queries) == 1 and queries[0] != "What about managers?"
+    assert contextualizer.metrics.counts == {"no_history": 0, "standalone": 0, "rewritten": 1}
+
+
+def test_every_follow_up_is_rewritten_when_skipping_is_off(make_contextualizer, bedrock):
+    contextualizer = make_contextualizer(skip_standalone=False)
+
+    contextualizer.contextualize().invoke(
+        {"input": "Which documents describe the travel expense policy?", "chat_history": HISTORY}
+    )
+
+    assert bedrock.calls["chat"] == 1
+    assert contextualizer.metrics.counts["rewritten"] == 1
+
+
+def test_a_first_turn_is_never_rewritten(make_contextualizer, queries, bedrock):
+    contextualizer = make_contextualizer(skip_standalone=False)
+
+    contextualizer.contextualize().invoke({"input": "What about managers?", "chat_history": []})
+
+    assert queries == ["What about managers?"] and "chat" not in bedrock.calls
+    assert contextualizer.metrics.counts["no_history"] == 1
+
+
+def test_rewrite_metrics_estimate_the_time_saved(rag_backend):
+    metrics = rag_backend.RewriteMetrics(max_turns=3)
+    for decision, seconds in [("no_history", 0.0), ("rewritten", 0.4), ("standalone", 0.0), ("rewritten", 0.2)]:
+        metrics.record(decision, seconds)
+
+    summary = metrics.summary()
+
+    assert summary["skip_rate"] == 0.5
+    assert summary["average_rewrite_seconds"] == pytest.approx(0.3)
+    assert summary["estimated_seconds_saved"] == pytest.approx(0.6)
+    assert [turn["decision"] for turn in metrics.turns] == ["rewritten", "standalone", "rewritten"]
+
+
+def test_empty_rewrite_metrics_summarize_to_zero(rag_backend):
+    summary = rag_backend.RewriteMetrics().summary()
+
+    assert summary["skip_rate"] == 0.0 and summary["estimated_seconds_saved"] == 0.0
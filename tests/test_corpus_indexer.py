@@ -0,0 +1,203 @@
+"""Tests of the incremental corpus indexer of RAG_chatbot_HR."""
+
+import json
+import os
+
+import pytest
+
+from benchmarks.offline_suite import make_pdf
+
+
+def write_pdf(path, *lines):
+    """Write a one-page PDF with the given lines."""
+    with open(path, "wb") as pdf:
+        pdf.write(make_pdf([list(lines)]))
+    return str(path)
+
+
+def sources(vectorstore):
+    """The files the documents of a vector store come from, by document."""
+    return sorted(
+        os.path.basename(vectorstore.docstore.search(doc_id).metadata["source"])
+        for doc_id in vectorstore.index_to_docstore_id.values()
+    )
+
+
+def assert_consistent(vectorstore):
+    """The index, the position map and the docstore describe the same documents."""
+    assert vectorstore.index.ntotal == len(vectorstore.index_to_docstore_id)
+    assert sorted(vectorstore.index_to_docstore_id) == list(range(vectorstore.index.ntotal))
+    assert len(vectorstore.docstore._dict) == vectorstore.index.ntotal
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "corpus"
+    directory.mkdir()
+    write_pdf(directory / "leave.pdf", "Employees get twenty days of paid leave.")
+    write_pdf(directory / "travel.pdf", "Travel expenses are refunded within a month.")
+    return directory
+
+
+@pytest.fixture
+def flat_indexer(rag_backend, corpus, tmp_path):
+    from ann_index import IndexSpec
+
+    def build():
+        return rag_backend.CorpusIndexer(str(corpus), str(tmp_path / "index"), IndexSpec(kind="flat"))
+
+    return build
+
+
+def test_refresh_indexes_new_files_and_skips_unchanged_ones(flat_indexer, bedrock):
+    indexer = flat_indexer()
+    first = indexer.refresh()
+    embedded = bedrock.calls["embed"]
+
+    second = indexer.refresh()
+
+    assert [os.path.basename(path) for path in first["added"]] == ["leave.pdf", "travel.pdf"]
+    assert second == {"added": [], "replaced": [], "deleted": [], "unchanged": 2}
+    assert bedrock.calls["embed"] == embedded
+    assert sources(indexer.vectorstore) == ["leave.pdf", "travel.pdf"]
+
+
+def test_refresh_replaces_modified_and_deletes_removed_files(flat_indexer, corpus):
+    indexer = flat_indexer()
+    indexer.refresh()
+    version = indexer.version
+    write_pdf(corpus / "leave.pdf", "Employees get twenty five days of paid leave.")
+    os.remove(corpus / "travel.pdf")
+    write_pdf(corpus / "parking.pdf", "Parking is free for staff.")
+
+    summary = indexer.refresh()
+
+    assert [os.path.basename(path) for path in summary["replaced"]] == ["leave.pdf"]
+    assert [os.path.basename(path) for path in summary["deleted"]] == ["travel.pdf"]
+    assert [os.path.basename(path) for path in summary["added"]] == ["parking.pdf"]
+    assert indexer.version != version
+    assert sources(indexer.vectorstore) == ["leave.pdf", "parking.pdf"]
+    assert_consistent(indexer.vectorstore)
+    answer = indexer.vectorstore.similarity_search("twenty five days of paid leave", k=1)[0]
+    assert "twenty five" in answer.page_content
+
+
+def test_saved_state_is_reused_by_a_new_indexer(flat_indexer, corpus, bedrock):
+    indexer = flat_indexer()
+    indexer.refresh()
+    os.remove(corpus / "travel.pdf")
+    indexer.refresh()
+    embedded = bedrock.calls["embed"]
+
+    reloaded = flat_indexer()
+    summary = reloaded.refresh()
+
+    assert summary["unchanged"] == 1 and not summary["added"]
+    assert bedrock.calls["embed"] == embedded
+    assert reloaded.version == indexer.version
+    assert sources(reloaded.vectorstore) == ["leave.pdf"]
+
+
+def test_refresh_logs_its_summary_instead_of_printing_it(flat_indexer, caplog, capsys):
+    indexer = flat_indexer()
+
+    with caplog.at_level("INFO", logger="rag_backend"):
+        indexer.refresh()
+
+    assert "Corpus refresh: 2 added, 0 replaced, 0 deleted, 0 unchanged." in caplog.messages
+    assert "Corpus" not in capsys.readouterr().out
+
+
+def test_an_index_out_of_step_with_its_manifest_is_rebuilt_with_a_warning(flat_indexer, caplog):
+    indexer = flat_indexer()
+    indexer.refresh()
+    manifest_path = os.path.join(indexer.index_dir, indexer.MANIFEST_FILE)
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest["vector_count"] += 1
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    summary = flat_indexer().refresh()
+
+    assert len(summary["added"]) == 2
+    assert [record.levelname for record in caplog.records if "manifest" in record.message] == ["WARNING"]
+
+
+def test_hnsw_is_refused(rag_backend, corpus):
+    from ann_index import IndexSpec
+
+    with pytest.raises(ValueError):
+        rag_backend.CorpusIndexer(str(corpus), index_spec=IndexSpec(kind="hnsw"))
+
+
+def ivf_store(rag_backend, kind="ivf_flat", count=400):
+    """An IVF vector store of `count` documents that each carry a word of their own."""
+    from ann_index import IndexSpec
+    from langchain_core.documents import Document
+
+    spec = IndexSpec(kind=kind, nlist=4, nprobe=4, train_size=count)
+    builder = rag_backend.VectorStoreBuilder(rag_backend.build_embeddings(), spec)
+    documents = [Document(page_content=f"doc{n} policy section", metadata={"n": n}) for n in range(count)]
+    builder.add(documents, ids=[f"id{n}" for n in range(count)])
+    vectorstore = builder.finish()
+    assert builder.spec.kind == kind
+    return vectorstore
+
+
+@pytest.mark.parametrize("kind", ["ivf_flat", "ivf_sq8"])
+def test_ivf_delete_keeps_search_results_in_step_with_the_docstore(rag_backend, kind):
+    vectorstore = ivf_store(rag_backend, kind)
+
+    rag_backend.delete_vectors(vectorstore, [f"id{n}" for n in range(100)])
+
+    assert_consistent(vectorstore)
+    assert vectorstore.index.ntotal == 300
+    found = vectorstore.similarity_search("doc350 policy section", k=1)[0]
+    assert found.metadata["n"] == 350
+    packed = rag_backend.build_retriever(vectorstore).invoke("doc350 policy section")
+    assert packed[0].metadata["n"] == 350
+
+
+def test_ivf_store_accepts_additions_after_a_delete(rag_backend, tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    vectorstore = ivf_store(rag_backend)
+    rag_backend.delete_vectors(vectorstore, [f"id{n}" for n in range(0, 400, 3)])
+    builder = rag_backend.VectorStoreBuilder(vectorstore.embeddings, None, vectorstore)
+    builder.add([Document(page_content="doc999 policy section", metadata={"n": 999})], ids=["id999"])
+    vectorstore.save_local(str(tmp_path / "saved"))
+    reloaded = FAISS.load_local(str(tmp_path / "saved"), vectorstore.embeddings, allow_dangerous_deserialization=True)
+
+    for store in (vectorstore, reloaded):
+        assert_consistent(store)
+        assert store.similarity_search("doc999 policy section", k=1)[0].metadata["n"] == 999
+        assert store.similarity_search("doc200 policy section", k=1)[0].metadata["n"] == 200
+
+
+def test_ivf_corpus_refresh_deletes_a_file_and_still_searches(rag_backend, tmp_path):
+    from ann_index import IndexSpec
+    from benchmarks.offline_suite import write_handbook
+
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    write_handbook(str(corpus / "a.pdf"), pages=20, seed=1)
+    write_handbook(str(corpus / "b.pdf"), pages=20, seed=2)
+    spec = IndexSpec(kind="ivf_flat", nlist=2, nprobe=2)
+    indexer = rag_backend.CorpusIndexer(str(corpus), str(tmp_path / "index"), spec)
+    indexer.refresh()
+    assert indexer.built_spec.kind == "ivf_flat"
+    kept = [indexer.vectorstore.docstore.search(doc_id) for doc_id in indexer.files[str(corpus / "b.pdf")]["ids"]]
+
+    os.remove(corpus / "a.pdf")
+    indexer.refresh()
+
+    assert_consistent(indexer.vectorstore)
+    assert sources(indexer.vectorstore) == ["b.pdf"] * len(kept)
+    for document in kept[::7]:
+        found = indexer.vectorstore.similarity_search(document.page_content, k=1)[0]
+        assert found.page_content == document.page_content
+    reloaded = rag_backend.CorpusIndexer(str(corpus), str(tmp_path / "index"), spec)
+    assert reloaded.refresh()["unchanged"] == 1
+    assert_consistent(reloaded.vectorstore)
@@ -0,0 +1,156 @@
+"""Tests of the question normalization, batch dedupe and request validation of the elearn knowledge base Lambda."""
+
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeAgentRuntime
+
+
+class FlakyAgentRuntime(FakeAgentRuntime):
+    """Times out on the questions in `failing`."""
+
+    def __init__(self, latency, failing=()):
+        super().__init__(latency)
+        self.failing = set(failing)
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, sessionId=None, **kwargs):
+        from botocore.exceptions import ReadTimeoutError
+
+        if input["text"] in self.failing:
+            raise ReadTimeoutError(endpoint_url="https://bedrock-agent-runtime.us-west-2.amazonaws.com")
+        return super().retrieve_and_generate(input, retrieveAndGenerateConfiguration, sessionId, **kwargs)
+
+
+@pytest.fixture
+def agent_runtime(latency):
+    return FlakyAgentRuntime(latency)
+
+
+@pytest.fixture
+def elearn(lambda_module, aws_client, bedrock, agent_runtime):
+    aws_client("bedrock-agent-runtime", agent_runtime)
+    aws_client("bedrock-runtime", bedrock)
+    module = lambda_module("elearn_app_knowledge_base")
+    module.retrieval_cache.clear()
+    yield module
+    module.retrieval_cache.clear()
+
+
+@pytest.mark.parametrize("question, normalized", [
+    ("What is  a Lambda layer?", "what is a lambda layer"),
+    ("  what is a\tLAMBDA layer ?! ", "what is a lambda layer"),
+    ("What is C++?", "what is c++"),
+    ("Is 2+2 = 4.", "is 2+2 = 4"),
+])
+def test_case_spacing_and_trailing_punctuation_are_normalized(elearn, question, normalized):
+    assert elearn.normalize_question(question) == normalized
+
+
+@pytest.mark.parametrize("first, second", [("What is 2+2?", "What is 2-2?"), ("Explain C", "Explain C++"),
+                                           ("What does x.y return?", "What does xy return?")])
+def test_symbols_keep_questions_apart(elearn, first, second):
+    assert elearn.normalize_question(first) != elearn.normalize_question(second)
+
+
+def test_a_batch_answers_each_distinct_question_once(elearn, agent_runtime):
+    questions = ["What is 2+2?", "what is 2+2", "What is 2-2?", "What is C++?", "What is C?", "WHAT IS C++ ?"]
+
+    response = elearn.lambda_handler({"questions": questions, "mode": "managed"}, None)
+
+    assert response["statusCode"] == 200
+    answers = json.loads(response["body"])["answers"]
+    assert [answer["question"] for answer in answers] == questions
+    assert agent_runtime.calls["retrieve_and_generate"] == 4
+    assert answers[0]["answer"] == answers[1]["answer"] and answers[3]["answer"] == answers[5]["answer"]
+    assert answers[0]["answer"] != answers[2]["answer"] and answers[3]["answer"] != answers[4]["answer"]
+
+
+def test_split_mode_shares_retrievals_of_equal_questions_only(elearn, agent_runtime):
+    for prompt in ("What is C++?", "what is c++", "What is C?"):
+        assert elearn.lambda_handler({"prompt": prompt, "mode": "split"}, None)["statusCode"] == 200
+
+    assert agent_runtime.calls["retrieve"] == 2
+
+
+@pytest.mark.parametrize("event", [
+    {},
+    {"prompt": ""},
+    {"prompt": "  ?! "},
+    {"prompt": 42},
+    {"prompt": ["What is C?"]},
+    {"questions": "What is C?"},
+    {"questions": ["What is C?", None]},
+    {"questions": ["What is C?", "   "]},
+    {"questions": []},
+])
+def test_questions_must_be_non_empty_strings(elearn, agent_runtime, bedrock, event):
+    response = elearn.lambda_handler(event, None)
+
+    assert response["statusCode"] == 400
+    assert not agent_runtime.calls and not bedrock.calls
+
+
+@pytest.fixture
+def pools(elearn, monkeypatch):
+    """The sizes of the thread pools the Lambda creates."""
+    pools = []
+    executor = elearn.ThreadPoolExecutor
+
+    def recording_executor(max_workers):
+        pools.append(max_workers)
+        return executor(max_workers=max_workers)
+
+    monkeypatch.setattr(elearn, "ThreadPoolExecutor", recording_executor)
+    return pools
+
+
+@pytest.mark.parametrize("requested, used", [(1000, 8), (3, 3), (0, 1)])
+def test_batch_concurrency_is_clamped_to_the_configured_maximum(elearn, pools, monkeypatch, requested, used):
+    monkeypatch.setattr(elearn, "MAX_WORKERS", 8)
+    questions = [f"What is lesson {number} about?" for number in range(20)]
+
+    response = elearn.lambda_handler({"questions": questions, "max_workers": requested}, None)
+
+    assert response["statusCode"] == 200
+    assert pools == [used]
+
+
+@pytest.mark.parametrize("max_workers", ["8", 2.5, None, True])
+def test_batch_concurrency_must_be_an_integer(elearn, pools, agent_runtime, max_workers):
+    response = elearn.lambda_handler({"questions": ["What is C?"], "max_workers": max_workers}, None)
+
+    assert response["statusCode"] == 400
+    assert pools == [] and not agent_runtime.calls
+
+
+def test_a_transport_error_fails_only_its_question(elearn, agent_runtime):
+    agent_runtime.failing = {"What is C?"}
+
+    response = elearn.lambda_handler({"questions": ["What is C?", "What is C++?"]}, None)
+
+    assert response["statusCode"] == 200
+    failed, answered = json.loads(response["body"])["answers"]
+    assert "Read timeout" in failed["error"] and "answer" not in failed
+    assert answered["answer"]
+
+
+def test_the_session_id_is_returned_in_a_header(elearn, agent_runtime):
+    first = elearn.lambda_handler({"prompt": "What is C?", "mode": "managed"}, None)
+    session_id = first["headers"][elearn.SESSION_HEADER]
+
+    second = elearn.lambda_handler({"prompt": "And C++?", "sessionId": session_id}, None)
+
+    assert set(first) == {"statusCode", "body", "headers"}
+    assert second["headers"][elearn.SESSION_HEADER] == session_id
+    assert "headers" not in elearn.lambda_handler({"prompt": "What is C?", "mode": "split"}, None)
+
+
+@pytest.mark.parametrize("client", ["bedrock", "bedrock_runtime"])
+def test_the_clients_leave_the_retries_to_with_retries(elearn, client):
+    from common import aws
+
+    placeholder = getattr(elearn, client)
+    built = aws.create_client(placeholder.service, region_name="us-west-2", **placeholder.kwargs)
+
+    assert built.meta.config.retries["total_max_attempts"] == 1
@@ -0,0 +1,103 @@
+"""Tests of the chunk-level embedding cache of RAG_chatbot_HR."""
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from benchmarks import use_app  # noqa: E402
+
+use_app("RAG_chatbot_HR")
+
+from embedding_store import CachedEmbeddings, EmbeddingStore  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeds a text as [len(text), index of its batch], recording the batches it was sent."""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), float(len(self.batches))] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.0]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "cache" / "embeddings.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_store_round_trips_vectors_per_model(store):
+    hashes = [store.text_hash("alpha"), store.text_hash("beta")]
+    store.put_many("model-a", {hashes[0]: [0.5, -1.25], hashes[1]: [2.0, 3.0]})
+
+    assert store.get_many("model-a", hashes + ["missing"]) == {hashes[0]: [0.5, -1.25], hashes[1]: [2.0, 3.0]}
+    assert store.get_many("model-b", hashes) == {}
+
+
+def test_store_persists_across_connections(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    first = EmbeddingStore(path)
+    first.put_many("model", {first.text_hash("text"): [1.0]})
+    first.close()
+
+    second = EmbeddingStore(path)
+    assert second.get_many("model", [second.text_hash("text")]) == {second.text_hash("text"): [1.0]}
+    second.close()
+
+
+def test_store_reads_more_hashes_than_sqlite_variables(store):
+    vectors = {store.text_hash(str(n)): [float(n)] for n in range(2000)}
+    store.put_many("model", vectors)
+
+    assert store.get_many("model", vectors) == vectors
+
+
+def test_misses_are_deduplicated_and_batched(store):
+    model = RecordingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model", store, batch_size=2, max_batch_chars=1000, max_concurrency=1)
+
+    vectors = embeddings.embed_documents(["a", "bb", "a", "ccc", "dddd", "bb"])
+
+    assert model.batches == [["a", "bb"], ["ccc", "dddd"]]
+    assert [vector[0] for vector in vectors] == [1.0, 2.0, 1.0, 3.0, 4.0, 2.0]
+    assert vectors[0] == vectors[2]
+
+
+def test_batches_are_bounded_by_characters(store):
+    model = RecordingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model", store, batch_size=10, max_batch_chars=5, max_concurrency=1)
+
+    embeddings.embed_documents(["aaa", "bb", "c", "dddddd"])
+
+    assert model.batches == [["aaa", "bb"], ["c"], ["dddddd"]]
+
+
+def test_only_misses_reach_the_model(store):
+    model = RecordingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model", store, batch_size=16)
+    first = embeddings.embed_documents(["one", "two"])
+
+    second = embeddings.embed_documents(["two", "three", "one"])
+
+    assert model.batches == [["one", "two"], ["three"]]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert CachedEmbeddings(RecordingEmbeddings(), "other-model", store).embed_documents(["one"]) == [[3.0, 1.0]]
+
+
+def test_cached_bedrock_embeddings_skip_known_chunks(rag_backend, bedrock):
+    embeddings = rag_backend.build_embeddings()
+    texts = [f"Chunk {n} of the leave policy." for n in range(5)]
+
+    first = embeddings.embed_documents(texts)
+    calls = bedrock.calls["embed"]
+    second = rag_backend.build_embeddings().embed_documents(texts + ["A new chunk about parking."])
+
+    assert all(new == pytest.approx(old) for new, old in zip(second, first))
+    assert bedrock.calls["embed"] == calls + 1
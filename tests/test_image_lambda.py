@@ -0,0 +1,147 @@
+"""Tests of the poster job mode of the image Lambda."""
+
+import json
+import re
+
+import pytest
+
+from benchmarks.fakes import FakeBedrockRuntime, FakeS3
+
+
+class FlakyBedrock(FakeBedrockRuntime):
+    """Times out on the variants whose seed is in `failing_seeds`."""
+
+    def __init__(self, latency, failing_seeds):
+        super().__init__(latency, image_bytes=3000)
+        self.failing_seeds = failing_seeds
+
+    def invoke_model(self, modelId, body, **kwargs):
+        from botocore.exceptions import ReadTimeoutError
+
+        if json.loads(body)["seed"] in self.failing_seeds:
+            raise ReadTimeoutError(endpoint_url="https://bedrock-runtime.us-west-2.amazonaws.com")
+        return super().invoke_model(modelId, body, **kwargs)
+
+
+@pytest.fixture
+def s3(latency):
+    return FakeS3(latency)
+
+
+@pytest.fixture
+def image_lambda(lambda_module, aws_client, latency, s3):
+    aws_client("s3", s3)
+    return lambda_module("image_media_industry")
+
+
+def test_a_transport_error_fails_only_its_variant(image_lambda, aws_client, latency, s3):
+    bedrock = FlakyBedrock(latency, failing_seeds={1})
+    aws_client("bedrock-runtime", bedrock)
+
+    response = image_lambda.lambda_handler({"prompt": "A noir poster", "seeds": [0, 1, 2], "refresh": True,
+                                            "requests_per_second": 1000}, None)
+
+    assert response["statusCode"] == 200
+    variants = json.loads(response["body"])["variants"]
+    assert [variant["status"] for variant in variants] == ["succeeded", "failed", "succeeded"]
+    assert "Read timeout" in variants[1]["error"]
+    assert all(variant["url"] for variant in variants if variant["status"] == "succeeded")
+    job_manifests = [key for _, key in s3.objects if key.startswith("jobs/")]
+    assert len(job_manifests) == 1
+
+
+@pytest.mark.parametrize("rate", [0, -1, "fast", None, True, float("nan")])
+def test_the_request_rate_must_be_positive(image_lambda, aws_client, bedrock, rate):
+    aws_client("bedrock-runtime", bedrock)
+
+    response = image_lambda.lambda_handler({"prompt": "A noir poster", "count": 2, "requests_per_second": rate}, None)
+
+    assert response["statusCode"] == 400
+    assert "requests_per_second" in json.loads(response["body"])["error"]
+    assert not bedrock.calls
+
+
+def test_the_bedrock_client_leaves_the_retries_to_invoke_image_model(image_lambda):
+    from common import aws
+
+    client = aws.create_client("bedrock-runtime", region_name="us-west-2", **image_lambda.client_bedrock.kwargs)
+
+    assert client.meta.config.retries["total_max_attempts"] == 1
+
+
+def test_an_image_is_addressed_by_everything_that_determines_it(image_lambda):
+    key = image_lambda.artifact_key("A noir poster", seed=1, cfg_scale=10, steps=30)
+    others = [
+        image_lambda.artifact_key("A noir poster!", 1, 10, 30),
+        image_lambda.artifact_key("A noir poster", 2, 10, 30),
+        image_lambda.artifact_key("A noir poster", 1, 7, 30),
+        image_lambda.artifact_key("A noir poster", 1, 10, 50),
+    ]
+
+    assert re.fullmatch(r"posters/[0-9a-f]{64}\.png", key)
+    assert image_lambda.artifact_key("A noir poster", 1, 10, 30) == key
+    assert len({key, *others}) == 5
+
+
+def job_variants(image_lambda, **event):
+    response = image_lambda.lambda_handler({"prompt": "A noir poster", "requests_per_second": 1000, **event}, None)
+    assert response["statusCode"] == 200
+    return json.loads(response["body"])["variants"]
+
+
+def test_a_stored_image_is_found_with_a_head_request_and_not_generated_again(image_lambda, aws_client, bedrock, s3):
+    aws_client("bedrock-runtime", bedrock)
+    first = job_variants(image_lambda, seeds=[0, 1])
+
+    second = job_variants(image_lambda, seeds=[0, 1])
+
+    assert [variant["cached"] for variant in first] == [False, False]
+    assert [variant["cached"] for variant in second] == [True, True]
+    assert [variant["key"] for variant in second] == [variant["key"] for variant in first]
+    assert bedrock.calls["image"] == 2
+    assert s3.calls["head_object"] == 4 and "get_object" not in s3.calls
+
+
+def test_refresh_regenerates_a_stored_image_without_looking_it_up(image_lambda, aws_client, bedrock, s3):
+    aws_client("bedrock-runtime", bedrock)
+    job_variants(image_lambda, seeds=[0])
+
+    refreshed = job_variants(image_lambda, seeds=[0], refresh=True)
+
+    assert refreshed[0]["cached"] is False
+    assert bedrock.calls["image"] == 2 and s3.calls["head_object"] == 1
+
+
+@pytest.mark.parametrize("event", [
+    {"prompt": "A noir poster", "seeds": 3},
+    {"prompt": "A noir poster", "seeds": "0,1"},
+    {"prompt": "A noir poster", "seeds": [0, "1"]},
+    {"prompt": "A noir poster", "count": [2]},
+    {"prompt": "A noir poster", "count": "many"},
+    {"prompt": "A noir poster", "count": 10 ** 12},
+    {"variants": "A noir poster"},
+    {"variants": ["A noir poster"]},
+    {"prompt": "A noir poster", "variants": [{"seed": 1}, None]},
+    {"variants": [{"prompt": ["A noir poster"]}]},
+    {"prompt": "A noir poster", "count": 2, "cfg_scale": "high"},
+    {"prompt": "A noir poster", "count": 2, "cfg_scale": True},
+    {"prompt": "A noir poster", "count": 2, "steps": 30.5},
+    {"prompt": "A noir poster", "count": 2, "steps": None},
+])
+def test_malformed_jobs_are_refused_with_400(image_lambda, aws_client, bedrock, s3, event):
+    aws_client("bedrock-runtime", bedrock)
+
+    response = image_lambda.lambda_handler(event, None)
+
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["error"]
+    assert not bedrock.calls and not s3.calls
+
+
+def test_numeric_options_are_passed_to_every_variant(image_lambda, aws_client, bedrock):
+    aws_client("bedrock-runtime", bedrock)
+
+    variants = job_variants(image_lambda, count=2, cfg_scale=7.5, steps=40)
+
+    assert [variant["status"] for variant in variants] == ["succeeded", "succeeded"]
+    assert variants[0]["key"] == image_lambda.artifact_key("A noir poster", 0, 7.5, 40)
@@ -0,0 +1,88 @@
+"""Tests of the streaming base64 decoding and multipart upload of the image Lambda."""
+
+import base64
+import json
+import random
+
+import pytest
+
+from benchmarks import load_module
+from benchmarks.fakes import FakeS3, LatencyProfile, StreamingBody
+
+
+@pytest.fixture(scope="module")
+def image_stream():
+    return load_module("image_media_industry", "image_stream")
+
+
+def response_body(image, escape_slashes=False, **artifact):
+    """A Bedrock SDXL response body carrying `image`."""
+    encoded = base64.b64encode(image).decode("ascii")
+    document = json.dumps({"result": "success", "artifacts": [{"seed": 7, "base64": encoded, **artifact}]})
+    if escape_slashes:
+        document = document.replace("/", "\\/")
+    return document.encode("utf-8")
+
+
+class Sink:
+    """Collects what a decoder writes."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 7, 9, 10, 64, 1 << 20])
+@pytest.mark.parametrize("escape_slashes", [False, True])
+def test_decoding_does_not_depend_on_chunk_boundaries(image_stream, chunk_size, escape_slashes):
+    image = random.Random(chunk_size).randbytes(1000)
+    sink = Sink()
+
+    artifact = image_stream.stream_artifact(StreamingBody(response_body(image, escape_slashes)), sink, chunk_size)
+
+    assert bytes(sink.data) == image
+    assert artifact == {"seed": 7, "base64": ""}
+
+
+def test_every_split_of_the_field_marker_and_value(image_stream):
+    body = response_body(bytes(range(256)), finishReason="SUCCESS")
+    for split in range(1, len(body)):
+        decoder = image_stream.Base64FieldDecoder()
+
+        decoded = decoder.feed(body[:split]) + decoder.feed(body[split:])
+
+        assert decoded == bytes(range(256)), split
+        assert decoder.metadata()["artifacts"][0]["finishReason"] == "SUCCESS"
+
+
+@pytest.mark.parametrize("body", [
+    b'{"artifacts": [{"base64": "QUJD!"}]}',
+    b'{"artifacts": [{"base64": "QUJDR"}]}',
+    b'{"artifacts": [{"base64": 12}]}',
+])
+def test_invalid_image_fields_are_refused(image_stream, body):
+    with pytest.raises(ValueError):
+        image_stream.stream_artifact(StreamingBody(body), Sink(), chunk_size=3)
+
+
+def test_a_truncated_response_has_no_metadata(image_stream):
+    decoder = image_stream.Base64FieldDecoder()
+    decoder.feed(response_body(b"poster")[:30])
+
+    with pytest.raises(ValueError):
+        decoder.metadata()
+
+
+def test_large_images_are_uploaded_in_parts(image_stream):
+    s3 = FakeS3(LatencyProfile(scale=0))
+    image = random.Random(0).randbytes(25_000)
+    writer = image_stream.MultipartWriter(s3, "bucket", "poster.png", part_size=10_000)
+
+    image_stream.stream_artifact(StreamingBody(response_body(image)), writer, chunk_size=4099)
+    writer.close()
+
+    assert s3.objects[("bucket", "poster.png")] == image
+    assert [part["PartNumber"] for part in writer.parts] == [1, 2, 3]
+    assert s3.calls["upload_part"] == 3 and "put_object" not in s3.calls
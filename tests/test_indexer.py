@@ -0,0 +1,123 @@
+"""Tests of the single-document indexer of RAG_chatbot_HR and its on-disk index cache."""
+
+import os
+
+import pytest
+
+from benchmarks.offline_suite import make_pdf
+
+
+def write_pdf(path, *pages):
+    """Write a PDF with one page of text per item of `pages`."""
+    with open(path, "wb") as pdf:
+        pdf.write(make_pdf([[line] for line in pages]))
+    return str(path)
+
+
+@pytest.fixture
+def handbook(tmp_path):
+    return write_pdf(tmp_path / "handbook.pdf", "Employees get twenty days of paid leave.")
+
+
+@pytest.fixture
+def builds():
+    """The documents whose index was built rather than loaded from the cache."""
+    return []
+
+
+@pytest.fixture
+def indexer(rag_backend, tmp_path, builds):
+    """Build an Indexer of a PDF caching its index in the test's directory."""
+    from ann_index import IndexSpec
+
+    def make(path):
+        indexer = rag_backend.Indexer(path, str(tmp_path / "index_cache"), IndexSpec(kind="flat"))
+        build = indexer.build
+
+        def recording_build(*args, **kwargs):
+            builds.append(path)
+            return build(*args, **kwargs)
+
+        indexer.build = recording_build
+        return indexer
+
+    return make
+
+
+def test_an_unchanged_document_is_loaded_from_the_cache(indexer, builds, handbook):
+    first = indexer(handbook)
+    built = first.index()
+
+    second = indexer(handbook)
+    cached = second.index()
+
+    assert builds == [handbook]
+    assert second.version == first.version
+    assert os.path.exists(os.path.join(second.cache_dir, second.version, "index.faiss"))
+    assert cached.vectorstore.index.ntotal == built.vectorstore.index.ntotal
+    assert cached.vectorstore.similarity_search("paid leave", k=1)[0].page_content == (
+        "Employees get twenty days of paid leave."
+    )
+
+
+def test_changed_content_gets_a_new_version_and_index(indexer, builds, handbook):
+    first = indexer(handbook)
+    first.index()
+    write_pdf(handbook, "Employees get twenty five days of paid leave.")
+
+    second = indexer(handbook)
+    rebuilt = second.index()
+
+    assert builds == [handbook, handbook]
+    assert second.version != first.version
+    assert rebuilt.vectorstore.similarity_search("paid leave", k=1)[0].page_content == (
+        "Employees get twenty five days of paid leave."
+    )
+
+
+def test_changed_settings_get_a_new_version(indexer, builds, handbook):
+    first = indexer(handbook)
+    first.index()
+
+    second = indexer(handbook)
+    second.chunk_size = first.chunk_size // 2
+    second.index()
+
+    assert builds == [handbook, handbook]
+    assert second.version != first.version
+    assert sorted(os.listdir(first.cache_dir)) == sorted([first.version, second.version])
+
+
+def test_the_index_is_built_in_batches_from_one_pass_over_the_pages(rag_backend, indexer, tmp_path, monkeypatch):
+    pages = [f"Policy {number} applies to every employee of the company." for number in range(5)]
+    document = indexer(write_pdf(tmp_path / "policies.pdf", *pages))
+    parses, batches, events = [], [], []
+    iter_pages, add = document.iter_pages, rag_backend.VectorStoreBuilder.add
+
+    def counting_iter_pages():
+        parses.append(document.path)
+        return iter_pages()
+
+    def recording_add(builder, chunks, ids=None):
+        batches.append(len(chunks))
+        return add(builder, chunks, ids)
+
+    monkeypatch.setattr(document, "iter_pages", counting_iter_pages)
+    monkeypatch.setattr(rag_backend.VectorStoreBuilder, "add", recording_add)
+
+    vectorstore = document.build(lambda stage, count: events.append((stage, count)), batch_size=2)
+
+    assert parses == [document.path]
+    assert batches == [2, 2, 1]
+    assert [count for stage, count in events if stage == "embedded"] == [2, 4, 5]
+    assert [count for stage, count in events if stage == "pages"] == [1, 2, 3, 4, 5]
+    assert vectorstore.index.ntotal == 5
+    # The first batch is embedded before the pages after it are parsed.
+    assert events.index(("embedded", 2)) < events.index(("pages", 3))
+
+
+def test_a_document_without_text_is_refused(indexer, tmp_path):
+    document = indexer(write_pdf(tmp_path / "blank.pdf", ""))
+
+    with pytest.raises(ValueError, match="No text"):
+        document.build()
@@ -0,0 +1,59 @@
+"""Tests of the deferred imports of common.lazy and of what the backends load at import time."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import REPO_ROOT
+
+DEFERRED = ("numpy", "faiss", "boto3", "botocore")
+
+
+def loaded_modules(folder, module):
+    """The deferred modules that importing `module` from its folder runs, in a fresh interpreter."""
+    environment = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    # A module that lazy_import left in sys.modules is not a plain module until it runs.
+    script = (f"import sys, types, {module}; print(' '.join(name for name in {DEFERRED!r} "
+              f"if type(sys.modules.get(name)) is types.ModuleType))")
+    return subprocess.run(
+        [sys.executable, "-c", script], cwd=os.path.join(REPO_ROOT, folder), env=environment,
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+
+
+def test_common_aws_loads_boto3_on_first_client():
+    assert loaded_modules(".", "common.aws") == []
+
+
+@pytest.mark.parametrize("folder, module", [
+    ("chatbot_streamlit", "chatbot_backend"),
+    ("RAG_chatbot_HR", "rag_backend"),
+])
+def test_backends_do_not_load_numpy_or_boto3_at_import(folder, module):
+    pytest.importorskip("langchain_aws")
+
+    assert loaded_modules(folder, module) == []
+
+
+def test_a_lazy_module_runs_on_first_attribute_access(tmp_path, monkeypatch):
+    from common.lazy import lazy_import
+
+    (tmp_path / "lazy_probe.py").write_text("import sys\nsys.lazy_probe_runs = getattr(sys, 'lazy_probe_runs', 0) + 1\n"
+                                            "VALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+
+    module = lazy_import("lazy_probe")
+    assert getattr(sys, "lazy_probe_runs", 0) == 0
+    assert module.VALUE == 42
+    assert sys.lazy_probe_runs == 1
+    monkeypatch.delattr(sys, "lazy_probe_runs")
+
+
+def test_a_missing_module_fails_at_import():
+    from common.lazy import lazy_import
+
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("no_such_module_anywhere")
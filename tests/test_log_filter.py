@@ -0,0 +1,78 @@
+"""Tests of the log pre-filter of the manufacturing log summarization Lambda."""
+
+import pytest
+
+from benchmarks import load_module
+from benchmarks.offline_suite import make_log
+
+
+@pytest.fixture(scope="module")
+def log_filter():
+    return load_module("manufacturing_logs_summarization", "log_filter")
+
+
+def test_repeated_lines_collapse_into_templates_with_counts(log_filter):
+    lines = [f"2024-05-01T10:00:{second:02d} INFO line 2 temperature={20 + second}C batch 0x{second:04x}\n"
+             for second in range(30)]
+
+    digest, stats = log_filter.prefilter(lines)
+
+    assert "[x30] <*> INFO line <*> <*> batch <*>" in digest
+    assert stats["templates"] == 1 and stats["lines"] == 30
+    assert stats["compression_ratio"] > 5
+
+
+def test_noise_levels_are_dropped_and_anomalies_listed_first(log_filter):
+    lines = ["DEBUG polling sensor 4\n"] * 50 + ["INFO cycle complete on line 1\n"] * 40
+    lines.insert(60, "ERROR spindle motor overheated on line 3\n")
+
+    digest, stats = log_filter.prefilter(lines)
+
+    assert stats["dropped_lines"] == 50
+    assert "polling" not in digest
+    anomalies = digest.split("Most anomalous lines:\n", 1)[1]
+    assert anomalies.startswith("- [x1] ERROR spindle motor overheated on line 3")
+    assert "[x40] INFO cycle complete on line <*>" in digest
+
+
+def test_memory_is_bounded_by_max_templates(log_filter):
+    lines = [f"WARN alarm {word} raised\n" for word in ("alpha", "beta", "gamma", "delta", "omega")]
+    lines += [f"INFO unique event {word}\n" for word in ("red", "green", "blue")]
+
+    flt = log_filter.LogFilter(max_templates=3, similarity_threshold=1.0).process(lines)
+
+    assert len(flt.templates) == 3
+    assert flt.evicted_lines == 5
+    assert sum(len(group) for group in flt.groups.values()) == 3
+
+
+def test_bytes_and_str_lines_give_the_same_digest(log_filter):
+    text = make_log(500, 3)
+
+    from_str = log_filter.prefilter(text.splitlines(keepends=True))
+    from_bytes = log_filter.prefilter(line.encode() for line in text.splitlines(keepends=True))
+
+    assert from_str == from_bytes
+    assert from_str[1]["lines"] == 500 and from_str[1]["compression_ratio"] > 2
+
+
+def test_multi_token_timestamps_do_not_merge_errors_into_routine_lines(log_filter):
+    lines = [f"2024-05-01 10:00:{second % 60:02d} INFO spindle speed={1200 + second}\n" for second in range(100)]
+    lines.insert(40, "2024-05-01 10:00:40 ERROR spindle overheat=98\n")
+    lines.insert(70, "2024-05-01 10:01:10 FATAL spindle seized=1\n")
+
+    digest, stats = log_filter.prefilter(lines)
+
+    assert stats["templates"] == 3
+    assert "[x100] <*> <*> INFO spindle <*>" in digest
+    anomalies = digest.split("Most anomalous lines:\n", 1)[1].split("Log:", 1)[0].splitlines()
+    assert anomalies == ["- [x1] 2024-05-01 10:01:10 FATAL spindle seized=1",
+                         "- [x1] 2024-05-01 10:00:40 ERROR spindle overheat=98"]
+
+
+def test_similarity_only_scores_the_constant_positions_of_a_template(log_filter):
+    template = log_filter.LogTemplate(["<*>", "<*>", "INFO", "spindle", "<*>"], "INFO", "", 1)
+
+    assert template.similarity(["<*>", "<*>", "INFO", "spindle", "<*>"]) == 1.0
+    assert template.similarity(["<*>", "<*>", "INFO", "motor", "<*>"]) == 0.5
+    assert template.similarity(["<*>", "<*>", "<*>", "<*>", "<*>"]) == 0.0
@@ -0,0 +1,75 @@
+"""Tests of the shared Bedrock client configuration and model pool of common."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("botocore")
+
+from common import aws  # noqa: E402
+from common.bedrock import ModelPool  # noqa: E402
+
+
+def test_clients_share_the_tuned_configuration(monkeypatch):
+    monkeypatch.setattr(aws, "AWS_MAX_POOL_CONNECTIONS", 64)
+
+    client = aws.create_client("bedrock-runtime", region_name="us-west-2")
+
+    assert client.meta.config.max_pool_connections == 64
+    assert client.meta.config.tcp_keepalive is True
+    assert client.meta.config.retries["mode"] == "standard"
+
+
+def test_pool_builds_each_item_once_across_threads():
+    pool = ModelPool()
+    built = []
+
+    def factory():
+        built.append(1)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get(("item",), factory))) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1 and len({id(result) for result in results}) == 1
+
+
+def test_chat_models_use_the_pooled_client(bedrock):
+    pytest.importorskip("langchain_aws")
+    pool = ModelPool(region_name="us-west-2", model_id="meta.llama3-8b-instruct-v1:0")
+    pool.set_bedrock_client(bedrock)
+
+    model = pool.get_chat_model()
+
+    assert model is pool.get_chat_model("meta.llama3-8b-instruct-v1:0")
+    assert model.client is bedrock
+    assert model.invoke("Hello").content
+    assert bedrock.calls["chat"] == 1
+    pool.clear()
+    assert pool.get_bedrock_client() is not bedrock
+
+
+def test_runnables_are_keyed_on_their_objects_by_identity():
+    pool = ModelPool()
+    retriever, other_retriever = {"k": 4}, {"k": 4}
+
+    runnable = pool.get_runnable(("chain", True, retriever), object)
+
+    assert pool.get_runnable(("chain", True, retriever), object) is runnable
+    assert pool.get_runnable(("chain", True, other_retriever), object) is not runnable
+
+
+def test_only_the_most_recently_used_runnables_are_kept():
+    pool = ModelPool(max_runnables=2)
+    stores = [object() for _ in range(3)]
+    first, second = (pool.get_runnable(("runnable", store), object) for store in stores[:2])
+
+    assert pool.get_runnable(("runnable", stores[0]), object) is first
+    pool.get_runnable(("runnable", stores[2]), object)
+
+    assert pool.get_runnable(("runnable", stores[0]), object) is first
+    assert pool.get_runnable(("runnable", stores[1]), object) is not second
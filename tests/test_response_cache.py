@@ -0,0 +1,101 @@
+"""Tests of the two-tier response cache of RAG_chatbot_HR."""
+
+import pytest
+
+from benchmarks import use_app
+from benchmarks.fakes import fake_vector
+
+use_app("RAG_chatbot_HR")
+
+import response_cache  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+
+class WordEmbeddings:
+    """Embeds a question as the bag of its words, like the Titan stand-in."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return fake_vector(text, 64)
+
+
+class Clock:
+    """A monotonic clock the test moves forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_exact_tier_matches_normalized_questions():
+    cache = ResponseCache()
+    cache.put("How many days of leave do I get?", "Twenty.", "v1")
+
+    hit = cache.lookup("  how many DAYS of leave do i get ", "v1")
+
+    assert (hit.answer, hit.tier) == ("Twenty.", "exact")
+    assert cache.lookup("How many days of sick leave?", "v1").answer is None
+    assert cache.stats == {"exact": 1, "semantic": 0, "miss": 1}
+
+
+def test_semantic_tier_matches_similar_questions_only():
+    embeddings = WordEmbeddings()
+    cache = ResponseCache(embeddings, similarity_threshold=0.95)
+    cache.put("how many leave days do I get", "Twenty.", "v1")
+
+    hit = cache.lookup("How many days leave do I get", "v1")
+    miss = cache.lookup("Who approves travel expenses?", "v1")
+
+    assert (hit.answer, hit.tier) == ("Twenty.", "semantic")
+    assert miss.answer is None and miss.vector is not None
+    cache.put("Who approves travel expenses?", "Your manager.", "v1", vector=miss.vector)
+    assert embeddings.queries == 3
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(WordEmbeddings(), ttl_seconds=60)
+    cache.put("What is the dress code?", "Business casual.", "v1")
+
+    clock.now += 59
+    assert cache.lookup("What is the dress code?", "v1").tier == "exact"
+    clock.now += 2
+    assert cache.lookup("What is the dress code?", "v1").answer is None
+    assert cache.lookup("what is the dress code", "v1").answer is None
+
+    cache.put("Where do I park?", "Level 2.", "v1")
+    assert len(cache) == 1
+
+
+def test_a_new_index_version_drops_every_answer():
+    cache = ResponseCache(WordEmbeddings())
+    cache.put("What is the dress code?", "Business casual.", "v1")
+    cache.put("Where do I park?", "Level 2.", "v1")
+
+    assert cache.lookup("What is the dress code?", "v2").answer is None
+    assert len(cache) == 0
+    cache.put("What is the dress code?", "Smart casual.", "v2")
+    assert cache.lookup("What is the dress code?", "v2").answer == "Smart casual."
+    assert cache.lookup("What is the dress code?", "v1").answer is None
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("first", "1")
+    cache.put("second", "2")
+    cache.lookup("first")
+
+    cache.put("third", "3")
+
+    assert [cache.lookup(question).answer for question in ("first", "second", "third")] == ["1", None, "3"]
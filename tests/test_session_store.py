@@ -0,0 +1,137 @@
+"""Tests of the bounded session stores and windowed history of common.session_store."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+
+from benchmarks import REPO_ROOT  # noqa: E402
+from common import session_store  # noqa: E402
+from common.session_store import (  # noqa: E402
+    InMemorySessionStore,
+    SessionHistory,
+    SQLiteSessionStore,
+    WindowedChatMessageHistory,
+)
+
+
+class Clock:
+    """A clock the test moves forward."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, "monotonic", clock)
+    monkeypatch.setattr(session_store.time, "time", clock)
+    return clock
+
+
+def turn(history, number):
+    history.add_messages([HumanMessage(content=f"question {number}"), AIMessage(content=f"answer {number}")])
+
+
+def test_memory_store_evicts_the_least_recently_used_session():
+    store = InMemorySessionStore(max_sessions=2)
+    first = store.get("a")
+    first.add_messages([HumanMessage(content="hello")])
+    store.get("b")
+    store.get("a")
+
+    store.get("c")
+
+    assert len(store) == 2
+    assert store.get("a") is first
+    assert store.get("b").messages == []
+
+
+def test_memory_store_drops_idle_sessions(clock):
+    store = InMemorySessionStore(ttl_seconds=60)
+    store.get("a").add_messages([HumanMessage(content="hello")])
+    store.get("b")
+
+    clock.now += 61
+    assert store.get("a").messages == []
+    assert len(store) == 1
+
+
+def test_an_empty_store_is_kept():
+    store = InMemorySessionStore(max_sessions=5)
+
+    assert SessionHistory(store).store is store
+
+
+def test_windows_are_bounded_by_their_store():
+    history = SessionHistory(InMemorySessionStore(max_sessions=3), max_turns=2)
+
+    for number in range(10):
+        history.get_session_history(f"session-{number}")
+
+    assert len(history._windows) == 3
+    assert len(history.store) == 3
+
+
+def test_sqlite_store_persists_and_purges_idle_sessions(tmp_path, clock):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path, ttl_seconds=60, max_sessions=2)
+    turn(store.get("a"), 1)
+    turn(store.get("b"), 1)
+
+    reopened = SQLiteSessionStore(path, ttl_seconds=60)
+    assert [message.content for message in reopened.get("a").messages] == ["question 1", "answer 1"]
+    clock.now += 30
+    reopened.get("a")
+    clock.now += 40
+    reopened.purge()
+    assert reopened.get("b").messages == []
+    assert len(reopened.get("a").messages) == 2
+
+
+def test_sqlite_store_keeps_at_most_max_sessions_history_objects(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), max_sessions=2)
+    for name in "abcd":
+        store.get(name)
+
+    assert list(store._histories) == ["c", "d"]
+    assert SessionHistory(store, max_turns=1).store is store
+
+
+def test_default_database_does_not_depend_on_the_working_directory(tmp_path):
+    environment = {key: value for key, value in os.environ.items() if key != "SESSION_DB_PATH"}
+    environment["PYTHONPATH"] = REPO_ROOT
+    path = subprocess.run(
+        [sys.executable, "-c", "from common import session_store; print(session_store.SESSION_DB_PATH)"],
+        cwd=tmp_path, env=environment, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+    assert path == os.path.join(REPO_ROOT, "common", "sessions.sqlite3")
+
+
+def test_window_replays_recent_turns_within_the_token_budget():
+    store = InMemorySessionStore()
+    for number in range(5):
+        turn(store.get("a"), number)
+
+    window = WindowedChatMessageHistory(store.get("a"), max_turns=3, max_tokens=14)
+
+    assert [message.content for message in window.messages] == ["question 4", "answer 4"]
+    window.max_tokens = None
+    assert [message.content for message in window.messages][::2] == ["question 2", "question 3", "question 4"]
+
+
+def test_messages_and_texts_share_one_token_estimate():
+    text = "Employees get twenty days of paid leave."
+
+    assert session_store.count_tokens(text) == len(text) // 4 + 1
+    assert session_store.estimate_tokens(HumanMessage(content=text)) == session_store.count_tokens(text) + 3
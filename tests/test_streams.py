@@ -0,0 +1,99 @@
+"""Tests of the streaming APIs of the chatbots: what they stream and the turn they save to the session history."""
+
+import asyncio
+
+import pytest
+
+from benchmarks.offline_suite import make_pdf
+from common.session_store import InMemorySessionStore, SessionHistory
+
+
+def collect(stream):
+    """Run a sync or async stream to its end and return its items."""
+    if hasattr(stream, "__aiter__"):
+        async def drain():
+            return [item async for item in stream]
+
+        return asyncio.run(drain())
+    return list(stream)
+
+
+def assert_turn_saved(session_history, session_id, question, answer):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    messages = session_history.get_session_history(session_id).messages
+    assert messages == [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+@pytest.fixture
+def session_history():
+    return SessionHistory(InMemorySessionStore())
+
+
+@pytest.fixture
+def retriever(rag_backend, tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "leave.pdf").write_bytes(make_pdf([["Employees get twenty days of paid leave."]]))
+    backend = rag_backend.ChatBotBackend("indexer")
+    backend.init_retriever(str(corpus))
+    return backend.retriever
+
+
+@pytest.mark.parametrize("method", ["stream_rag_response", "astream_rag_response"])
+def test_a_rag_stream_yields_sources_then_the_answer_and_saves_the_turn(
+    rag_backend, retriever, session_history, caplog, method
+):
+    backend = rag_backend.ChatBotBackend("rag", session_history=session_history, index=retriever, use_rag=True)
+
+    sources, *chunks = collect(getattr(backend, method)("How much leave do I get?"))
+
+    assert [document.page_content for document in sources] == ["Employees get twenty days of paid leave."]
+    assert "".join(chunks)
+    assert_turn_saved(session_history, "rag", "How much leave do I get?", "".join(chunks))
+    assert "Error in" not in caplog.text
+
+
+@pytest.mark.parametrize("method", ["stream_response", "astream_response"])
+def test_a_rag_backend_chat_stream_saves_the_turn(rag_backend, session_history, caplog, method):
+    backend = rag_backend.ChatBotBackend("chat", session_history=session_history)
+
+    chunks = collect(getattr(backend, method)("Hello there"))
+
+    assert "".join(chunks)
+    assert_turn_saved(session_history, "chat", "Hello there", "".join(chunks))
+    assert "Error in" not in caplog.text
+
+
+def test_a_streamed_follow_up_replays_the_earlier_turn(rag_backend, retriever, session_history, bedrock):
+    backend = rag_backend.ChatBotBackend("follow-up", session_history=session_history, index=retriever, use_rag=True)
+    collect(backend.stream_rag_response("How much leave do I get?"))
+
+    collect(backend.stream_rag_response("And what about managers?"))
+
+    assert len(session_history.get_session_history("follow-up").messages) == 4
+    assert backend.prompt_tokens["history"] > 0
+
+
+@pytest.fixture
+def chatbot_backend(bedrock):
+    pytest.importorskip("langchain_aws")
+    from benchmarks import use_app
+
+    use_app("chatbot_streamlit")
+    import chatbot_backend
+
+    chatbot_backend.MODEL_POOL.set_bedrock_client(bedrock)
+    yield chatbot_backend
+    chatbot_backend.MODEL_POOL.clear()
+
+
+@pytest.mark.parametrize("method", ["stream_response", "astream_response"])
+def test_a_chatbot_stream_saves_the_turn(chatbot_backend, session_history, caplog, method):
+    backend = chatbot_backend.ChatBotBackend("streamlit", session_history=session_history)
+
+    chunks = collect(getattr(backend, method)("Hello there"))
+
+    assert "".join(chunks)
+    assert_turn_saved(session_history, "streamlit", "Hello there", "".join(chunks))
+    assert "Error in" not in caplog.text
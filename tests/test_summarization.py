@@ -0,0 +1,161 @@
+"""Tests of the manufacturing log summarization Lambda."""
+
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeBedrockRuntime
+from benchmarks.offline_suite import make_log
+
+
+class ScriptedBedrock(FakeBedrockRuntime):
+    """Records the prompts it answers, after raising the ClientErrors whose codes are listed in `errors`."""
+
+    def __init__(self, latency, errors=()):
+        super().__init__(latency)
+        self.errors = list(errors)
+        self.prompts = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        from botocore.exceptions import ClientError
+
+        with self.lock:
+            code = self.errors.pop(0) if self.errors else None
+        if code is not None:
+            raise ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+        with self.lock:
+            self.prompts.append(json.loads(body)["prompt"])
+        return super().invoke_model(modelId, body, **kwargs)
+
+
+@pytest.fixture
+def bedrock(latency):
+    return ScriptedBedrock(latency)
+
+
+@pytest.fixture
+def summarizer(lambda_module, aws_client, bedrock):
+    aws_client("bedrock-runtime", bedrock)
+    return lambda_module("manufacturing_logs_summarization")
+
+
+@pytest.fixture
+def sleeps(summarizer, monkeypatch):
+    """The backoff delays of the Lambda, which are recorded instead of slept."""
+    sleeps = []
+    monkeypatch.setattr(summarizer.time, "sleep", sleeps.append)
+    return sleeps
+
+
+@pytest.fixture
+def pools(summarizer, monkeypatch):
+    """The sizes of the thread pools the Lambda creates."""
+    pools = []
+    executor = summarizer.ThreadPoolExecutor
+
+    def recording_executor(max_workers):
+        pools.append(max_workers)
+        return executor(max_workers=max_workers)
+
+    monkeypatch.setattr(summarizer, "ThreadPoolExecutor", recording_executor)
+    return pools
+
+
+@pytest.mark.parametrize("requested, used", [(1000, 8), (3, 3), (0, 1), (-5, 1)])
+def test_batch_concurrency_is_clamped_to_the_configured_maximum(summarizer, pools, monkeypatch, requested, used):
+    monkeypatch.setattr(summarizer, "MAX_WORKERS", 8)
+
+    response = summarizer.lambda_handler({"documents": [make_log(200, 1)], "max_workers": requested}, None)
+
+    assert response["statusCode"] == 200
+    assert pools == [used]
+    assert json.loads(response["body"])["summary"]
+
+
+@pytest.mark.parametrize("max_workers", ["8", 2.5, None, True, [4]])
+def test_batch_concurrency_must_be_an_integer(summarizer, pools, bedrock, max_workers):
+    response = summarizer.lambda_handler({"documents": ["a log line"], "max_workers": max_workers}, None)
+
+    assert response["statusCode"] == 400
+    assert pools == [] and not bedrock.calls
+
+
+def test_the_bedrock_client_leaves_the_retries_to_invoke_model(summarizer):
+    from common import aws
+
+    client = aws.create_client("bedrock-runtime", region_name="us-west-2", **summarizer.client_bedrock.kwargs)
+
+    assert client.meta.config.retries["total_max_attempts"] == 1
+
+
+def test_a_log_is_split_on_line_boundaries_into_bounded_chunks(summarizer):
+    text = "".join(f"line {number} of the log\n" for number in range(100)) + "x" * 250
+
+    chunks = summarizer.chunk_text(text, chunk_chars=100)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.endswith("\n") for chunk in chunks[:-3])
+    assert chunks[-3:] == ["x" * 100, "x" * 100, "x" * 50]
+
+
+def test_documents_are_mapped_by_chunk_then_reduced_per_document_and_overall(summarizer, bedrock):
+    documents = [("long", make_log(1000, 1)), ("short", make_log(20, 2))]
+    chunks = [len(summarizer.chunk_text(text)) for _, text in documents]
+
+    result = summarizer.summarize_documents(documents, max_workers=4)
+
+    maps = [prompt for prompt in bedrock.prompts if prompt.startswith(summarizer.CHUNK_PROMPT[:40])]
+    reduces = [prompt for prompt in bedrock.prompts if prompt.startswith(summarizer.REDUCE_PROMPT[:40])]
+    assert chunks[0] > 1 and chunks[1] == 1
+    assert result["chunks"] == len(maps) == sum(chunks)
+    # "long" has several chunk summaries to merge, "short" only one; then the two documents are merged.
+    assert len(reduces) == 2
+    assert [document["name"] for document in result["documents"]] == ["long", "short"]
+    assert all(document["summary"] for document in result["documents"]) and result["summary"]
+
+
+def test_summaries_too_large_for_one_call_are_reduced_level_by_level(summarizer, bedrock):
+    from concurrent.futures import ThreadPoolExecutor
+
+    summaries = [f"summary {number} " + "z" * 1000 for number in range(30)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        reduced = summarizer.reduce_summaries({"log": summaries}, executor)
+
+    first_level = summarizer.group_summaries(summaries)
+    assert len(first_level) == 3 and all(len(batch) <= summarizer.CHUNK_CHARS for batch in first_level)
+    assert len(bedrock.prompts) == len(first_level) + 1
+    assert reduced["log"]
+
+
+def test_throttled_calls_are_retried_with_capped_exponential_backoff(summarizer, bedrock, sleeps):
+    bedrock.errors = ["ThrottlingException", "ServiceUnavailableException", "ThrottlingException"]
+
+    assert summarizer.invoke_model("Summarize this log")
+
+    assert len(sleeps) == 3 and len(bedrock.prompts) == 1
+    assert all(0 <= delay <= min(20, 0.5 * 2 ** attempt) for attempt, delay in enumerate(sleeps))
+
+
+def test_retries_stop_after_max_retries(summarizer, bedrock, sleeps, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    monkeypatch.setattr(summarizer, "MAX_RETRIES", 2)
+    bedrock.errors = ["ThrottlingException"] * 3
+
+    with pytest.raises(ClientError, match="ThrottlingException"):
+        summarizer.invoke_model("Summarize this log")
+
+    assert len(sleeps) == 2 and not bedrock.prompts
+
+
+def test_other_errors_are_not_retried(summarizer, bedrock, sleeps):
+    from botocore.exceptions import ClientError
+
+    bedrock.errors = ["ValidationException"]
+
+    with pytest.raises(ClientError, match="ValidationException"):
+        summarizer.invoke_model("Summarize this log")
+
+    assert sleeps == []
@@ -0,0 +1,133 @@
+"""Tests of the request tracing of the RAG chatbot, built on the spans of common.tracing."""
+
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.offline_suite import make_pdf
+from common import tracing as common_tracing
+from common.session_store import InMemorySessionStore, SessionHistory
+
+
+@pytest.fixture
+def tracing(rag_backend, monkeypatch):
+    """The tracing module of the chatbot, switched on and exporting summaries only."""
+    import tracing
+
+    monkeypatch.setattr(tracing, "TRACING", True)
+    monkeypatch.setattr(common_tracing, "TRACE_EXPORT", "summary")
+    return tracing
+
+
+def test_prompt_tokens_go_to_the_current_span_not_to_stdout(rag_backend, tracing, capsys):
+    from langchain_core.documents import Document
+
+    backend = rag_backend.ChatBotBackend("prompt-tokens")
+    context = [Document("Employees accrue two days of leave a month.", metadata={"context_tokens": 40})]
+
+    with tracing.trace("rag_response") as request_trace:
+        usage = backend.record_prompt_tokens("How much leave do I get?", [], context)
+
+    assert usage["context"] == 40
+    assert request_trace.root.attributes["prompt_tokens_context"] == 40
+    assert request_trace.root.attributes["prompt_tokens_total"] == usage["total"]
+    assert "Prompt tokens" not in capsys.readouterr().out
+
+
+def test_a_chat_turn_is_traced_through_the_chain_callbacks(rag_backend, tracing, capsys):
+    backend = rag_backend.ChatBotBackend("traced-chat")
+
+    assert backend.get_response("Hello there")
+
+    summary = backend.trace_summary
+    assert summary["name"] == "chat_response" and summary["status"] == "ok"
+    assert summary["attributes"] == {"session_id": "traced-chat"}
+    assert "llm" in summary["stages"] and "load_history" in summary["stages"]
+    assert "request_id" not in summary and "cold_start" not in summary
+    assert json.loads(capsys.readouterr().out.splitlines()[-1]) == json.loads(json.dumps(summary))
+
+
+@pytest.fixture
+def rag(rag_backend, tmp_path):
+    """A RAG backend over a one-document corpus, with a history of its own."""
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "leave.pdf").write_bytes(make_pdf([["Employees get twenty days of paid leave."]]))
+    indexer = rag_backend.ChatBotBackend("indexer")
+    indexer.init_retriever(str(corpus))
+    return rag_backend.ChatBotBackend(
+        "traced-rag", session_history=SessionHistory(InMemorySessionStore()), index=indexer.retriever, use_rag=True
+    )
+
+
+@pytest.mark.parametrize("run", [
+    lambda backend, question, config: backend.answer(question, config),
+    lambda backend, question, config: list(backend.stream_answer(question, config)),
+    lambda backend, question, config: asyncio.run(backend.aanswer(question, config)),
+], ids=["invoke", "stream", "ainvoke"])
+def test_the_rewrite_decision_goes_to_the_contextualize_span(tracing, rag, run):
+    decisions = []
+    for question in ("How much leave do I get?", "And what about it for managers?"):
+        with tracing.trace("rag_response") as request_trace:
+            run(rag, question, request_trace.with_callbacks(rag.config))
+        contextualize = [span for span in request_trace.spans if span.name == "contextualize"]
+        assert len(contextualize) == 1 and "rewrite" not in request_trace.root.attributes
+        decisions.append(contextualize[0].attributes["rewrite"])
+
+    assert decisions == ["no_history", "rewritten"]
+    assert "contextualize.llm" in [span.name for span in request_trace.spans]
+
+
+def test_common_spans_join_the_request_trace(tracing):
+    with tracing.trace("rag_response", session_id="s") as request_trace:
+        with common_tracing.span("vector_search", k=4):
+            common_tracing.record_cache(True, "response", tier="exact")
+
+    assert [span.name for span in request_trace.spans] == ["rag_response", "vector_search"]
+    assert request_trace.spans[1].parent_id == request_trace.root.span_id
+    assert request_trace.spans[1].events[0][2] == {"cache": "response", "count": 1, "tier": "exact"}
+    assert request_trace.summary()["cache_hits"] == 1
+    assert common_tracing.span("outside") is common_tracing._NOOP
+
+
+def test_tracing_off_records_nothing(tracing, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING", False)
+
+    with tracing.trace("rag_response") as request_trace:
+        tracing.set_attributes(rewrite="standalone")
+
+    assert request_trace.summary() is None
+    assert request_trace.with_callbacks({"configurable": {}}) == {"configurable": {}}
+
+
+def test_a_lambda_invocation_is_exported_with_its_status(monkeypatch, capsys):
+    monkeypatch.setattr(common_tracing, "TRACING", True)
+    monkeypatch.setattr(common_tracing, "TRACE_EXPORT", "json")
+
+    def handler(event, context):
+        with common_tracing.span("invoke_model"):
+            common_tracing.record_tokens(12, 30)
+        return {"statusCode": 200}
+
+    common_tracing.traced_handler(handler)({"prompt": "a private prompt"}, None)
+
+    root, stage, summary = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert root["attributes"]["event.keys"] == "prompt" and root["attributes"]["status_code"] == 200
+    assert stage["parent_id"] == root["span_id"] and stage["attributes"]["output_tokens"] == 30
+    assert summary["status"] == "ok" and summary["input_tokens"] == 12
+    assert common_tracing._current.get() is None
+
+
+def test_a_failed_lambda_invocation_is_exported_as_an_error(monkeypatch, capsys):
+    monkeypatch.setattr(common_tracing, "TRACING", True)
+    monkeypatch.setattr(common_tracing, "TRACE_EXPORT", "summary")
+
+    def handler(event, context):
+        raise KeyError("prompt")
+
+    with pytest.raises(KeyError):
+        common_tracing.traced_handler(handler)({}, None)
+
+    assert json.loads(capsys.readouterr().out)["status"] == "error"
+    assert common_tracing._current.get() is None